@@ -14,10 +14,20 @@ Local file identity is resolved as cheaply as possible:
   2. A local state cache keyed by (path, size, mtime) - reused on subsequent runs.
   3. Otherwise sha256 is computed, but ONLY when the local size matches upstream (a size mismatch
      already proves the file differs) and only for one representative file per model - a sharded
-     model isn't hashed shard by shard. Use --hash to verify every shard.
+     model isn't hashed shard by shard. Use --hash to verify every shard. Files are hashed on a
+     thread pool (--jobs, --chunk-size) with live throughput and ETA on stderr; each hash is
+     saved to the state cache as soon as it finishes.
+
+Network and disk work overlap: upstream trees are fetched while local files are stat'ed and their
+metadata and sidecars read, and each model is compared - and its hash started - as soon as both
+its tree and its local files are in. The report keeps discovery order.
 
 Upstream repo trees are cached on disk (default 12h) to limit API calls. Set HF_TOKEN to raise
-rate limits. State lives in ~/.cache/model-staleness/state.json.
+rate limits. State lives in ~/.cache/model-staleness/state.json. Each repo is fetched once however
+many model dirs map to it, several at a time (--connections) over reused keep-alive connections;
+429 responses pause every request for the server's Retry-After. HF_ENDPOINT points the tool at
+another server (a mirror, or the local stand-in test/hf_stub.py; test/staleness_check.py runs
+the tool against it).
 
 If a weight file has a `<file>.chat-template-change-sha256.txt` sidecar (written by
 apply_chat_template.py), the recorded pre-edit sha256 is compared to upstream instead of the
@@ -28,16 +38,21 @@ rather than a false `stale`.
 from __future__ import annotations
 
 import argparse
+import email.utils
+import gzip
 import hashlib
+import http.client
 import json
 import os
 import platform
 import re
+import socket
 import sys
+import threading
 import time
 import urllib.error
 import urllib.parse
-import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
 WEIGHT_EXTS = (".gguf", ".safetensors")
 IGNORE_DIRS = {".cache", "assets", "tmp", ".git", "__pycache__", ".ipynb_checkpoints"}
@@ -45,11 +60,18 @@ IGNORE_DIRS = {".cache", "assets", "tmp", ".git", "__pycache__", ".ipynb_checkpo
 CHAT_TEMPLATE_SIDECAR = ".chat-template-change-sha256.txt"
 SHARD_RE = re.compile(r"-\d{5}-of-\d{5}\.(gguf|safetensors)$")
 HEX64_RE = re.compile(r"^[0-9a-f]{64}$")
-HASH_CHUNK = 8 * 1024 * 1024
-HF_API = "https://huggingface.co/api/models"
+HASH_CHUNK = 8 * 1024 * 1024  # default --chunk-size
+HASH_JOBS = min(4, os.cpu_count() or 1)  # default --jobs
+HF_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+HF_API = f"{HF_ENDPOINT}/api/models"
+HF_CONNECTIONS = 8    # default --connections
+HTTP_RETRIES = 5      # attempts per request on 429/503 or a dropped keep-alive connection
+MAX_RETRY_AFTER = 300  # seconds; longer Retry-After values are capped
 
 STATE_DIR = os.path.expanduser("~/.cache/model-staleness")
 STATE_FILE = os.path.join(STATE_DIR, "state.json")
+# Guards the state dict and its file: hashing threads record and save hashes while the scan runs.
+STATE_LOCK = threading.Lock()
 
 # Status precedence (worst first) used to roll file statuses up to a model verdict.
 STATUS_RANK = {
@@ -80,11 +102,12 @@ def load_state() -> dict:
 
 
 def save_state(state: dict) -> None:
-    os.makedirs(STATE_DIR, exist_ok=True)
-    tmp = STATE_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as fh:
-        json.dump(state, fh, indent=2, sort_keys=True)
-    os.replace(tmp, STATE_FILE)
+    with STATE_LOCK:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp = STATE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh, indent=2, sort_keys=True)
+        os.replace(tmp, STATE_FILE)
 
 
 # --------------------------------------------------------------------- discovery
@@ -169,46 +192,284 @@ def read_before_sha(weight_path: str) -> str | None:
     return None
 
 
-def local_sha256(path: str, st: os.stat_result, state: dict, log, label: str = "") -> str:
-    """sha256 of a local file, cached by (path, size, mtime_ns) across runs."""
-    cache = state["local"]
-    rec = cache.get(path)
+def cached_sha256(path: str, st: os.stat_result, state: dict) -> str | None:
+    """sha256 of a local file from an earlier run, if its (path, size, mtime_ns) still match."""
+    rec = state["local"].get(path)
     if rec and rec.get("size") == st.st_size and rec.get("mtime_ns") == st.st_mtime_ns:
         return rec["sha256"]
-    where = f"{label}: " if label else ""
-    log(f"  hashing {where}{os.path.basename(path)} ({st.st_size / 1e9:.1f} GB)...")
-    h = hashlib.sha256()
-    with open(path, "rb") as fh:
-        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
-            h.update(chunk)
-    digest = h.hexdigest()
-    cache[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
-    return digest
+    return None
+
+
+class HashCancelled(Exception):
+    """Raised in hashing threads once the run is interrupted."""
+
+
+class HashPool:
+    """Computes sha256 of local files on a thread pool - hashlib releases the GIL while hashing,
+    so several files stream from disk at once.
+
+    Each finished hash is written to the (path, size, mtime_ns) cache and saved straight away, so an
+    interrupted first run keeps everything it completed. Every file logs its throughput when done;
+    on a terminal a live line shows overall GB/s and ETA while hashes are pending.
+    """
+
+    def __init__(self, state: dict, jobs: int, chunk_size: int, log, live: bool) -> None:
+        self.state = state
+        self.chunk_size = chunk_size
+        self._log = log
+        self.live = live
+        self.pool = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="sha256")
+        self.lock = threading.Lock()  # guards the counters below and the progress line
+        self.cancelled = threading.Event()
+        self.stopped = threading.Event()
+        self.ticker: threading.Thread | None = None
+        # Time with at least one hash running: the pipeline can leave the pool idle waiting for
+        # trees, and that shouldn't count against throughput or the ETA
+        self.running = 0
+        self.busy = self.busy_since = 0.0
+        self.total = self.done = 0  # bytes
+        self.files = self.finished = 0
+        self.drawn = False
+
+    def log(self, msg: str) -> None:
+        """Log a line without tearing the live progress line (redrawn on the next tick)."""
+        with self.lock:
+            if self.drawn:
+                sys.stderr.write("\r\033[K")
+                self.drawn = False
+            self._log(msg)
+
+    def submit(self, path: str, st: os.stat_result, label: str = "") -> Future:
+        """Queue a file for hashing; the future's result is its sha256 hex digest."""
+        with self.lock:
+            if not self.files and self.live:
+                self.ticker = threading.Thread(target=self._tick, daemon=True)
+                self.ticker.start()
+            self.files += 1
+            self.total += st.st_size
+        where = f"{label}: " if label else ""
+        self.log(f"  hashing {where}{os.path.basename(path)} ({st.st_size / 1e9:.1f} GB)...")
+        return self.pool.submit(self._hash, path, st, where)
+
+    def _hash(self, path: str, st: os.stat_result, where: str) -> str:
+        h = hashlib.sha256()
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+        start, read = time.monotonic(), 0
+        with self.lock:
+            if not self.running:
+                self.busy_since = start
+            self.running += 1
+        try:
+            with open(path, "rb", buffering=0) as fh:
+                while n := fh.readinto(buf):
+                    if self.cancelled.is_set():
+                        raise HashCancelled(path)
+                    h.update(view[:n])
+                    read += n
+                    with self.lock:
+                        self.done += n
+        except BaseException:
+            with self.lock:
+                self.total -= st.st_size - read  # keep the ETA honest
+            raise
+        finally:
+            with self.lock:
+                self.running -= 1
+                if not self.running:
+                    self.busy += time.monotonic() - self.busy_since
+        digest = h.hexdigest()
+        with STATE_LOCK:
+            self.state["local"][path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        save_state(self.state)
+
+        elapsed = max(time.monotonic() - start, 1e-9)
+        with self.lock:
+            self.finished += 1
+            progress = f"{self.finished}/{self.files} files, {self._eta()}"
+        self.log(f"  hashed {where}{os.path.basename(path)}: {read / 1e9:.1f} GB in {elapsed:.1f}s "
+                 f"({read / 1e9 / elapsed:.2f} GB/s); {progress}")
+        return digest
+
+    def _busy(self) -> float:
+        """Seconds spent with at least one hash running."""
+        return self.busy + (time.monotonic() - self.busy_since if self.running else 0.0)
+
+    def _rate(self) -> float:
+        """Overall throughput so far, bytes/s."""
+        return self.done / max(self._busy(), 1e-9)
+
+    def _eta(self) -> str:
+        rate = self._rate()
+        if not rate:
+            return "ETA ?"
+        left = int((self.total - self.done) / rate)
+        return f"ETA {left // 60}:{left % 60:02d}"
+
+    def _tick(self) -> None:
+        while not self.stopped.wait(0.5):
+            with self.lock:
+                if self.finished == self.files:
+                    continue
+                sys.stderr.write(f"\r\033[K  hashing: {self.finished}/{self.files} files, "
+                                 f"{self.done / 1e9:.1f}/{self.total / 1e9:.1f} GB, "
+                                 f"{self._rate() / 1e9:.2f} GB/s, {self._eta()}")
+                sys.stderr.flush()
+                self.drawn = True
+
+    def close(self, cancel: bool = False) -> None:
+        """Wait for queued hashes (or, with cancel, abandon them) and print the totals."""
+        if cancel:
+            self.cancelled.set()
+        self.pool.shutdown(wait=True, cancel_futures=cancel)
+        self.stopped.set()
+        if self.ticker:
+            self.ticker.join()
+        if self.finished:
+            self.log(f"hashed {self.finished} file(s), {self.done / 1e9:.1f} GB in {self._busy():.1f}s "
+                     f"({self._rate() / 1e9:.2f} GB/s)")
 
 
 # -------------------------------------------------------------------- hf upstream
 
 
-def fetch_tree(repo: str, token: str | None) -> dict[str, dict]:
+class HFClient:
+    """Minimal HTTP/1.1 client for the HF API that keeps connections alive between requests.
+
+    urllib opens a new connection (and TLS handshake) per request. Here idle connections are
+    pooled per host and reused, so the pool never holds more than one per concurrent caller.
+    A 429 or 503 pauses every caller until the Retry-After time (exponential backoff without
+    one). Errors are raised as urllib.error.HTTPError / URLError, like urlopen. The token is only
+    sent to HF_ENDPOINT's host (and scheme), not to hosts it redirects or paginates to. cancel()
+    makes every pending and future request fail at once, so worker threads can exit on Ctrl+C.
+    """
+
+    def __init__(self, token: str | None, timeout: float = 30) -> None:
+        self.headers = {"User-Agent": "model-staleness/1.0", "Accept-Encoding": "gzip"}
+        self.authorized = dict(self.headers)
+        if token:
+            self.authorized["Authorization"] = f"Bearer {token}"
+        self.origin = urllib.parse.urlsplit(HF_ENDPOINT)[:2]
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+        self.active: set[http.client.HTTPConnection] = set()
+        self.paused_until = 0.0
+        self.cancelled = threading.Event()
+
+    def _connection(self, scheme: str, netloc: str) -> tuple[http.client.HTTPConnection, bool]:
+        """An idle connection to netloc (reused=True) or a new one."""
+        with self.lock:
+            idle = self.idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=self.timeout), False
+
+    def _release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+        with self.lock:
+            self.idle.setdefault((scheme, netloc), []).append(conn)
+
+    def close(self) -> None:
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle.clear()
+
+    def cancel(self) -> None:
+        """Fail every request: wake callers in a Retry-After pause and cut off in-flight reads."""
+        self.cancelled.set()
+        with self.lock:
+            for conn in self.active:
+                if conn.sock is not None:
+                    try:
+                        conn.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+    def _pause(self, retry_after: str | None, attempt: int) -> None:
+        """Hold back every caller for Retry-After (seconds or an HTTP date) or a backoff."""
+        delay = float(2 ** attempt)
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        delay = min(max(delay, 0.0), MAX_RETRY_AFTER)
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def get(self, url: str) -> tuple[bytes, http.client.HTTPMessage]:
+        """GET url, following redirects; returns (body, headers) of the final 2xx response."""
+        for attempt in range(HTTP_RETRIES + 5):
+            wait = self.paused_until - time.monotonic()
+            if self.cancelled.wait(wait) if wait > 0 else self.cancelled.is_set():
+                raise urllib.error.URLError("cancelled")
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path + (f"?{parts.query}" if parts.query else "")
+            # Anything off HF_ENDPOINT (a redirect elsewhere, or its next pages) doesn't get the token
+            headers = self.authorized if parts[:2] == self.origin else self.headers
+            conn, reused = self._connection(parts.scheme, parts.netloc)
+            with self.lock:
+                self.active.add(conn)
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as err:
+                conn.close()
+                if reused and not self.cancelled.is_set():
+                    continue  # the server dropped an idle keep-alive connection: retry on a new one
+                raise urllib.error.URLError(err) from err
+            except (OSError, http.client.HTTPException) as err:
+                conn.close()
+                raise urllib.error.URLError(err) from err
+            finally:
+                with self.lock:
+                    self.active.discard(conn)
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(parts.scheme, parts.netloc, conn)
+
+            if resp.status in (429, 503) and attempt < HTTP_RETRIES:
+                self._pause(resp.headers.get("Retry-After"), attempt)
+                continue
+            if resp.status in (301, 302, 303, 307, 308) and resp.headers.get("Location"):
+                url = urllib.parse.urljoin(url, resp.headers["Location"])
+                continue
+            if not 200 <= resp.status < 300:
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+            if resp.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            return body, resp.headers
+        raise urllib.error.URLError(f"too many retries or redirects: {url}")
+
+    def get_json(self, url: str) -> tuple[object, http.client.HTTPMessage]:
+        body, headers = self.get(url)
+        return json.loads(body), headers
+
+
+def fetch_tree(repo: str, client: HFClient) -> dict[str, dict]:
     """Fetch the upstream file tree -> {basename: {size, lfs, blob}}. Raises on HTTP/network error."""
     files: dict[str, dict] = {}
     url = f"{HF_API}/{urllib.parse.quote(repo)}/tree/main?recursive=true"
-    headers = {"User-Agent": "model-staleness/1.0"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
     while url:
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            for entry in json.load(resp):
-                if entry.get("type") != "file":
-                    continue
-                lfs = entry.get("lfs") or {}
-                files[os.path.basename(entry["path"])] = {
-                    "size": lfs.get("size", entry.get("size")),
-                    "lfs": lfs.get("oid"),
-                    "blob": entry.get("oid"),
-                }
-            url = _next_link(resp.headers.get("Link"))
+        entries, headers = client.get_json(url)
+        for entry in entries:
+            if entry.get("type") != "file":
+                continue
+            lfs = entry.get("lfs") or {}
+            files[os.path.basename(entry["path"])] = {
+                "size": lfs.get("size", entry.get("size")),
+                "lfs": lfs.get("oid"),
+                "blob": entry.get("oid"),
+            }
+        url = _next_link(headers.get("Link"))
     return files
 
 
@@ -221,7 +482,7 @@ def _next_link(link_header: str | None) -> str | None:
     return None
 
 
-def fetch_gated(repo: str, token: str | None) -> str | None:
+def fetch_gated(repo: str, client: HFClient) -> str | None:
     """Return the repo's gating mode ('auto'/'manual') or None if ungated/unknown.
 
     Gating is read from the model metadata endpoint: gated repos still serve
@@ -229,18 +490,14 @@ def fetch_gated(repo: str, token: str | None) -> str | None:
     so a 401/403 means not-found/private, never gated.
     """
     url = f"{HF_API}/{urllib.parse.quote(repo)}"
-    headers = {"User-Agent": "model-staleness/1.0"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
     try:
-        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as resp:
-            gated = json.load(resp).get("gated")
-    except (urllib.error.URLError, OSError, ValueError):
+        gated = client.get_json(url)[0].get("gated")
+    except (urllib.error.URLError, OSError, ValueError, AttributeError):
         return None  # best-effort probe: never let a gating lookup break the scan
     return gated if gated in ("auto", "manual") else None
 
 
-def upstream_tree(repo: str, state: dict, token: str | None, ttl: float, refresh: bool):
+def upstream_tree(repo: str, state: dict, client: HFClient, ttl: float, refresh: bool):
     """Return (files, status, gated). status is 'ok', 'not-on-hf', 'not-found' or 'error'.
 
     gated is 'auto'/'manual' when the repo requires licence acceptance, else None.
@@ -249,7 +506,7 @@ def upstream_tree(repo: str, state: dict, token: str | None, ttl: float, refresh
     if cached and not refresh and (time.time() - cached.get("fetched_at", 0)) < ttl:
         return cached["files"], "ok", cached.get("gated")
     try:
-        files = fetch_tree(repo, token)
+        files = fetch_tree(repo, client)
     except urllib.error.HTTPError as err:
         if err.code in (401, 403):
             return None, "not-found", None  # private/renamed/nonexistent (HF hides which)
@@ -262,23 +519,41 @@ def upstream_tree(repo: str, state: dict, token: str | None, ttl: float, refresh
         if cached:
             return cached["files"], "ok", cached.get("gated")
         return None, "error", None
-    gated = fetch_gated(repo, token)
-    state["hf"][repo] = {"fetched_at": time.time(), "files": files, "gated": gated}
+    gated = fetch_gated(repo, client)
+    with STATE_LOCK:
+        state["hf"][repo] = {"fetched_at": time.time(), "files": files, "gated": gated}
     return files, "ok", gated
 
 
 # ---------------------------------------------------------------------- compare
 
 
-def compare_file(model_dir, filename, upstream, state, allow_hash, log, label="") -> dict:
-    """Compare one local weight file to its upstream entry. Returns a result dict.
+def read_local(model_dir: str, weights: list[str], state: dict) -> dict[str, dict]:
+    """Everything known about a model's weight files without hashing -> {filename: facts}.
+
+    Facts are the stat result plus any sha256 available for free: the chat-template sidecar's
+    pre-edit sha, the HF download metadata etag, and a cached hash still valid for (size, mtime_ns).
+    """
+    facts = {}
+    for filename in weights:
+        path = os.path.join(model_dir, filename)
+        st = os.stat(path)
+        facts[filename] = {"path": path, "st": st, "before": read_before_sha(path),
+                           "metadata": read_hf_metadata_sha(model_dir, filename),
+                           "cached": cached_sha256(path, st, state)}
+    return facts
+
+
+def compare_file(filename, local, upstream, allow_hash, hasher, label="") -> dict:
+    """Compare one local weight file (its read_local() facts) to upstream. Returns a result dict.
 
     Free checks (size, HF metadata etag, chat-template sidecar) always run. A sha256 is only
     computed when nothing cheaper resolves it and allow_hash is set - the caller grants that to
-    one representative file per model so a sharded model isn't hashed shard by shard.
+    one representative file per model so a sharded model isn't hashed shard by shard. A hash
+    that isn't cached is queued on hasher; the result then has no status yet, and a "pending"
+    future that finish_hashes() resolves.
     """
-    path = os.path.join(model_dir, filename)
-    st = os.stat(path)
+    st = local["st"]
     up = upstream.get(filename)
     res = {"name": filename, "local_size": st.st_size, "upstream_size": None, "local_sha": None,
            "upstream_sha": None, "local_modified": False, "sha_source": None, "status": None}
@@ -290,7 +565,7 @@ def compare_file(model_dir, filename, upstream, state, allow_hash, log, label=""
     # A locally chat-template-edited file diverges from upstream in size and sha, but the sidecar
     # records the original pre-edit sha. Compare that to upstream: matches -> local edit (not stale),
     # differs -> upstream genuinely replaced. Needs no hashing and bypasses the size fast-path.
-    before = read_before_sha(path)
+    before = local["before"]
     if before is not None:
         res["local_sha"], res["local_modified"], res["sha_source"] = before, True, "sidecar"
         res["status"] = "current" if up["lfs"] is None else ("modified" if before == up["lfs"] else "stale")
@@ -301,22 +576,41 @@ def compare_file(model_dir, filename, upstream, state, allow_hash, log, label=""
     if up["lfs"] is None:
         res["status"], res["sha_source"] = "current", "size"  # non-LFS file, matching size
         return res
-    local = read_hf_metadata_sha(model_dir, filename)
-    if local is not None:
-        res["local_sha"], res["sha_source"] = local, "metadata"
-        res["status"] = "current" if local == up["lfs"] else "stale"
+    if local["metadata"] is not None:
+        res["local_sha"], res["sha_source"] = local["metadata"], "metadata"
+        res["status"] = "current" if local["metadata"] == up["lfs"] else "stale"
         return res
     if not allow_hash:  # size matched upstream but hash budget spent on another shard
         res["status"], res["sha_source"] = "current", "size-only"
         return res
-    local = local_sha256(path, st, state, log, label)
-    res["local_sha"], res["sha_source"] = local, "computed"
-    res["status"] = "current" if local == up["lfs"] else "stale"
+    res["sha_source"] = "computed"
+    if local["cached"] is None:
+        res["pending"] = hasher.submit(local["path"], st, label)
+        return res
+    res["local_sha"] = local["cached"]
+    res["status"] = "current" if local["cached"] == up["lfs"] else "stale"
     return res
 
 
-def roll_up(file_results: list[dict]) -> str:
-    return min((r["status"] for r in file_results), key=lambda s: STATUS_RANK.get(s, 99))
+def finish_hashes(results: list[dict], log) -> None:
+    """Fill in the files whose hashes were queued and roll their models up again."""
+    for r in results:
+        pending = [fr for fr in r["files"] if "pending" in fr]
+        for fr in pending:
+            try:
+                fr["local_sha"] = fr.pop("pending").result()
+            except OSError as err:
+                log(f"  cannot hash {fr['name']}: {err}")
+                fr["status"] = "error"
+                continue
+            fr["status"] = "current" if fr["local_sha"] == fr["upstream_sha"] else "stale"
+        if pending:
+            r["status"] = roll_up(r["files"])
+
+
+def roll_up(file_results: list[dict]) -> str | None:
+    statuses = [r["status"] for r in file_results if r["status"] is not None]
+    return min(statuses, key=lambda s: STATUS_RANK.get(s, 99)) if statuses else None
 
 
 # ------------------------------------------------------------------------ output
@@ -380,24 +674,66 @@ def _stale_detail(fr: dict) -> str:
 # -------------------------------------------------------------------------- main
 
 
-def scan_model(model_dir, weights, root, state, token, ttl, refresh, do_hash, log) -> dict:
-    repo = resolve_repo(model_dir, root)
+def scan_model(model_dir, weights, root, repo, tree, local, do_hash, hasher) -> dict:
+    """Compare a model given its upstream_tree() result and read_local() facts."""
     label = os.path.relpath(model_dir, root)
     if repo is None:
         return {"label": label, "repo": None, "status": "unknown-repo-map", "files": [], "gated": None}
-    upstream, tree_status, gated = upstream_tree(repo, state, token, ttl, refresh)
+    upstream, tree_status, gated = tree
     if tree_status != "ok":
         return {"label": label, "repo": repo, "status": tree_status, "files": [], "gated": None}
     files, hashed = [], False
     for f in weights:
         # Grant the compute budget to the first file that needs it, unless --hash verifies all.
-        res = compare_file(model_dir, f, upstream, state, do_hash or not hashed, log, repo)
+        res = compare_file(f, local[f], upstream, do_hash or not hashed, hasher, repo)
         if res["sha_source"] == "computed":
             hashed = True
         files.append(res)
     return {"label": label, "repo": repo, "status": roll_up(files), "files": files, "gated": gated}
 
 
+def scan(models, state, client, hasher, args, log) -> list[dict]:
+    """Compare every model, overlapping the network and local stages; results in `models` order.
+
+    The network stage fetches each distinct repo's tree once (--connections at a time); the local
+    stage runs read_local() for each model (--jobs at a time). A model is compared as soon as
+    both its tree and its local facts are in, which queues any hash it needs straight away, so
+    hashing runs while other trees are still downloading.
+    """
+    results: list[dict | None] = [None] * len(models)
+    repos = sorted({repo for *_, repo in models if repo})
+    if repos:
+        log(f"checking {len(repos)} upstream repo(s) ...")
+    net = ThreadPoolExecutor(max_workers=max(1, min(args.connections, len(repos) or 1)),
+                             thread_name_prefix="hf")
+    disk = ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="stat")
+    try:
+        # Many model dirs share a repo (quantisations, mirrors): fetch each one once
+        trees = {repo: net.submit(upstream_tree, repo, state, client, args.ttl * 3600, args.refresh)
+                 for repo in repos}
+        waiting: dict[Future, list[int]] = {}  # future -> models it completes
+        local: dict[int, Future] = {}
+        for i, (root, model_dir, weights, repo) in enumerate(models):
+            if repo is None:
+                results[i] = scan_model(model_dir, weights, root, None, None, None, args.do_hash, hasher)
+                continue
+            local[i] = disk.submit(read_local, model_dir, weights, state)
+            waiting.setdefault(trees[repo], []).append(i)
+            waiting.setdefault(local[i], []).append(i)
+
+        for done in as_completed(waiting):
+            for i in waiting[done]:
+                root, model_dir, weights, repo = models[i]
+                if results[i] is None and trees[repo].done() and local[i].done():
+                    results[i] = scan_model(model_dir, weights, root, repo, trees[repo].result(),
+                                            local[i].result(), args.do_hash, hasher)
+    finally:
+        # On Ctrl+C, don't start the remaining fetches and reads
+        net.shutdown(wait=False, cancel_futures=True)
+        disk.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
 def parse_args(argv) -> argparse.Namespace:
     p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     p.add_argument("--path", action="append", metavar="DIR",
@@ -406,6 +742,12 @@ def parse_args(argv) -> argparse.Namespace:
     p.add_argument("--refresh", action="store_true", help="ignore cached upstream trees and refetch")
     p.add_argument("--hash", action="store_true", dest="do_hash",
                    help="hash every shard, not just one representative file per model (exhaustive)")
+    p.add_argument("--connections", type=int, default=HF_CONNECTIONS,
+                   help=f"upstream repos to fetch at once, reusing connections (default {HF_CONNECTIONS})")
+    p.add_argument("--jobs", type=int, default=HASH_JOBS,
+                   help=f"files to hash, and model dirs to read, at once (default {HASH_JOBS})")
+    p.add_argument("--chunk-size", type=int, default=HASH_CHUNK // (1024 * 1024), metavar="MIB",
+                   help=f"read size per hashing I/O in MiB (default {HASH_CHUNK // (1024 * 1024)})")
     p.add_argument("--json", action="store_true", help="emit machine-readable JSON")
     p.add_argument("--only-stale", action="store_true", help="only report models that are out of date")
     p.add_argument("--no-color", action="store_true", help="disable coloured output")
@@ -420,23 +762,35 @@ def main(argv=None) -> int:
     token = os.environ.get("HF_TOKEN") or os.environ.get("HUGGING_FACE_HUB_TOKEN")
     log = (lambda *_: None) if args.quiet else (lambda *a: print(*a, file=sys.stderr))
     state = load_state()
+    hasher = HashPool(state, args.jobs, max(1, args.chunk_size) * 1024 * 1024, log,
+                      live=not args.quiet and sys.stderr.isatty())
+    log = hasher.log
+
+    client = HFClient(token)
 
     results: list[dict] = []
     try:
+        models = []  # (root, model_dir, weights, repo)
         for root in roots:
             if not os.path.isdir(root):
                 log(f"skip: {root} (not a directory)")
                 continue
             log(f"scanning {root} ...")
             for model_dir, weights in sorted(discover_models(root).items()):
-                results.append(scan_model(model_dir, weights, root, state,
-                                          token, args.ttl * 3600, args.refresh, args.do_hash, log))
-                save_state(state)  # persist incrementally so long first-run hashing survives interruption
+                models.append((root, model_dir, weights, resolve_repo(model_dir, root)))
+        results = scan(models, state, client, hasher, args, log)
+        save_state(state)  # fetched trees; hashes save as they finish
+        hasher.close()
     except KeyboardInterrupt:
+        client.cancel()  # let the hf workers stop now rather than hold up interpreter exit
+        hasher.close(cancel=True)
         save_state(state)
         log("\ninterrupted - computed hashes saved; rerun to resume")
         return 130
+    finally:
+        client.close()
 
+    finish_hashes(results, log)
     save_state(state)
 
     if args.json:
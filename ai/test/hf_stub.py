@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the HuggingFace model API, for testing model_staleness.py.
+
+Serves GET /api/models/ORG/REPO (metadata) and /api/models/ORG/REPO/tree/main
+(the file tree, one entry per page, linked with Link: rel="next" like the real
+API) over HTTP/1.1 keep-alive. Besides the repos it is given it knows a few
+special ones:
+
+  RATE_LIMITED   answers 429 with Retry-After: 1 the first time it is asked for
+  THROTTLED      always answers 429 with Retry-After: 300
+  SLOW           answers after a minute
+  RENAMED        307-redirects to its target repo, keeping the rest of the URL
+  MOVED_AWAY     the same, but to another host name for this server (localhost)
+  PRIVATE        401 (what HF answers for private and missing repos alike)
+  anything else  404
+
+GET /stats returns request, connection and 429 counts, and how many requests
+carried an Authorization header, by Host header. Run it standalone with
+a {repo: [tree entries]} JSON file and point HF_ENDPOINT at it:
+
+Usage: python3 hf_stub.py TREES.json [--port 8765] [--latency 0.05]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+RATE_LIMITED = "org/busy"
+THROTTLED = "org/throttled"
+SLOW = "org/slow"
+RENAMED = {"old/name": "org/paged"}
+MOVED_AWAY = {"away/name": "org/paged"}
+PRIVATE = "priv/x"
+
+
+class HFStub(ThreadingHTTPServer):
+    """HF API stand-in serving trees ({repo: [entries]}); gated maps repos to their gating mode."""
+
+    daemon_threads = True
+
+    def __init__(self, trees: dict[str, list[dict]], gated: dict[str, str] | None = None,
+                 port: int = 0, latency: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", port), Handler)
+        self.trees = trees
+        self.gated = gated or {}
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.stats: dict[str, Any] = {"requests": 0, "connections": 0, "rate_limited": 0, "tokens": {}}
+        self.limited: set[str] = set()
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] += 1
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: HFStub
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count("connections")
+
+    def send(self, code: int, document: object, headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(document).encode()
+        headers = dict(headers or {})
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.server.count("requests")
+        if self.headers.get("Authorization"):
+            with self.server.lock:
+                tokens = self.server.stats["tokens"]
+                tokens[self.headers["Host"]] = tokens.get(self.headers["Host"], 0) + 1
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            with self.server.lock:
+                return self.send(200, self.server.stats)
+        parts = url.path.split("/")
+        if parts[1:3] != ["api", "models"] or len(parts) < 5:
+            return self.send(404, {"error": "Not Found"})
+        repo, rest = "/".join(parts[3:5]), "/".join(parts[5:])
+
+        if repo == RATE_LIMITED:
+            with self.server.lock:
+                first = repo not in self.server.limited
+                self.server.limited.add(repo)
+            if first:
+                self.server.count("rate_limited")
+                return self.send(429, {"error": "Too Many Requests"}, {"Retry-After": "1"})
+        if repo == THROTTLED:
+            self.server.count("rate_limited")
+            return self.send(429, {"error": "Too Many Requests"}, {"Retry-After": "300"})
+        if repo == SLOW:
+            time.sleep(60)
+        if repo in RENAMED or repo in MOVED_AWAY:
+            host = f"http://localhost:{self.server.server_address[1]}" if repo in MOVED_AWAY else ""
+            location = f"{host}/api/models/{RENAMED.get(repo) or MOVED_AWAY[repo]}"
+            location += (f"/{rest}" if rest else "") + (f"?{url.query}" if url.query else "")
+            return self.send(307, {}, {"Location": location})
+        if repo == PRIVATE:
+            return self.send(401, {"error": "Invalid username or password."})
+        if repo not in self.server.trees:
+            return self.send(404, {"error": "Repository not found"})
+
+        if not rest:
+            return self.send(200, {"id": repo, "gated": self.server.gated.get(repo, False)})
+        if rest != "tree/main":
+            return self.send(404, {"error": "Not Found"})
+        entries = self.server.trees[repo]
+        cursor = int(parse_qs(url.query).get("cursor", ["0"])[0])
+        headers = {}
+        if cursor + 1 < len(entries):
+            headers["Link"] = (f"<http://{self.headers['Host']}/api/models/{repo}/tree/main"
+                               f"?recursive=true&cursor={cursor + 1}>; rel=\"next\"")
+        self.send(200, entries[cursor:cursor + 1], headers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the HuggingFace model API")
+    parser.add_argument("trees", help="JSON file mapping repo ids to their tree entries")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    args = parser.parse_args()
+    with open(args.trees) as fh:
+        trees = json.load(fh)
+    server = HFStub(trees, port=args.port, latency=args.latency)
+    print(f"HF_ENDPOINT={server.endpoint}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
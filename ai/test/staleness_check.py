@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Regression check for model_staleness.py's upstream fetching.
+
+Builds a small model tree, serves matching repos from the HF API stand-in
+(hf_stub.py) and runs model_staleness.py against it through HF_ENDPOINT,
+checking each model's status: a tree split over several Link-paginated pages,
+a renamed repo behind a 307 (and one whose 307 goes to another host name,
+which must not be sent the token), a 429 with Retry-After that is waited out
+and retried, and the 401 and 404 answers for private and missing repos. Also
+checks that keep-alive connections are reused, and that Ctrl+C during a long
+Retry-After wait or a stalled response exits straight away.
+
+Usage: python3 staleness_check.py
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+
+from hf_stub import HFStub  # noqa: E402
+
+CONNECTIONS = 4
+
+# repo -> local weight files {name: content}, upstream changes {name: size}, expected status
+MODELS: dict[str, tuple[dict[str, bytes], dict[str, int], str]] = {
+    "org/paged": ({f"m-0000{i}-of-00003.gguf": b"shard %d" % i * 100 for i in (1, 2, 3)}, {}, "current"),
+    "old/name": ({f"m-0000{i}-of-00003.gguf": b"shard %d" % i * 100 for i in (1, 2, 3)}, {}, "current"),
+    "away/name": ({f"m-0000{i}-of-00003.gguf": b"shard %d" % i * 100 for i in (1, 2, 3)}, {}, "current"),
+    "org/stale": ({"m.gguf": b"old weights"}, {"m.gguf": 4096}, "stale"),
+    "org/busy": ({"m.gguf": b"busy weights"}, {}, "current"),
+    "org/gated": ({"m.safetensors": b"gated weights"}, {}, "current"),
+    "priv/x": ({"m.gguf": b"private"}, {}, "not-found"),
+    "gone/repo": ({"m.gguf": b"deleted"}, {}, "not-on-hf"),
+}
+GATED = {"org/gated": "manual"}
+# repos that never answer in time, for the Ctrl+C check
+HANGING = ("org/throttled", "org/slow")
+INTERRUPT_AFTER = 1.5
+
+
+def tree_entries(files: dict[str, bytes], sizes: dict[str, int]) -> list[dict]:
+    """HF tree entries for files (LFS, with their sha256), plus the usual non-weight extras."""
+    entries: list[dict] = [{"type": "directory", "path": "docs", "oid": "d0"}]
+    for name, content in files.items():
+        size = sizes.get(name, len(content))
+        sha = hashlib.sha256(content).hexdigest() if name not in sizes else "0" * 64
+        entries.append({"type": "file", "path": name, "size": size, "oid": f"blob-{name}",
+                        "lfs": {"oid": sha, "size": size}})
+    entries.append({"type": "file", "path": "README.md", "size": 12, "oid": "readme"})
+    return entries
+
+
+def check(label: str, ok: bool, detail: str = "") -> bool:
+    print(f"{label}: {'ok' if ok else 'FAIL'}{f' ({detail})' if detail and not ok else ''}")
+    return ok
+
+
+def write_models(root: Path, models: dict[str, dict[str, bytes]]) -> None:
+    for repo, files in models.items():
+        model_dir = root / repo
+        model_dir.mkdir(parents=True)
+        for name, content in files.items():
+            (model_dir / name).write_bytes(content)
+
+
+def check_interrupt(tmp: str, server: HFStub, env: dict[str, str]) -> bool:
+    """Ctrl+C while every worker is stuck on a Retry-After wait or a stalled response."""
+    root = Path(tmp) / "hanging"
+    write_models(root, {repo: {"m.gguf": repo.encode()} for repo in HANGING})
+    cmd = [sys.executable, str(HERE.parent / "model_staleness.py"), "--path", str(root), "--json",
+           "--quiet"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    time.sleep(INTERRUPT_AFTER)
+    start = time.monotonic()
+    proc.send_signal(signal.SIGINT)
+    try:
+        code = proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        code = None
+    elapsed = time.monotonic() - start
+    return check("Ctrl+C exits promptly", code == 130 and elapsed < 5, f"exit {code} after {elapsed:.1f}s")
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "models"
+        trees: dict[str, list[dict]] = {}
+        write_models(root, {repo: files for repo, (files, _, _) in MODELS.items()})
+        for repo, (files, sizes, _) in MODELS.items():
+            if repo.startswith("org/"):
+                trees[repo] = tree_entries(files, sizes)
+
+        server = HFStub(trees, GATED, latency=0.01)
+        server.start()
+        env = {**os.environ, "HOME": tmp, "HF_ENDPOINT": server.endpoint, "HF_TOKEN": "hf_test"}
+        env.pop("HUGGING_FACE_HUB_TOKEN", None)
+        cmd = [sys.executable, str(HERE.parent / "model_staleness.py"), "--path", str(root), "--json", "--quiet",
+               "--connections", str(CONNECTIONS)]
+        try:
+            start = time.monotonic()
+            proc = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=120)
+            elapsed = time.monotonic() - start
+            with urlopen(f"{server.endpoint}/stats") as resp:
+                stats = json.load(resp)
+            interrupted = check_interrupt(tmp, server, env)
+        finally:
+            server.shutdown()
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return 1
+
+        results = {result["repo"]: result for result in json.loads(proc.stdout)}
+        ok = [check(f"{repo}: {expected}", results[repo]["status"] == expected, results[repo]["status"])
+              for repo, (_, _, expected) in MODELS.items()]
+        paged = [f["status"] for f in results["org/paged"]["files"]]
+        ok.append(check("pagination: every shard found", paged == ["current"] * 3, ", ".join(paged)))
+        ok.append(check("gating read from metadata", results["org/gated"]["gated"] == "manual",
+                        str(results["org/gated"]["gated"])))
+        ok.append(check("429 waited out once", stats["rate_limited"] == 1 and elapsed >= 1,
+                        f"{stats['rate_limited']} 429s, {elapsed:.1f}s"))
+        # one pool per host name: the localhost redirect opens one more
+        ok.append(check(f"connections reused ({stats['connections']} for {stats['requests']} requests)",
+                        stats["connections"] <= CONNECTIONS + 2 < stats["requests"]))
+        tokens = stats["tokens"]
+        port = server.server_address[1]
+        ok.append(check("token kept off the other host's redirect",
+                        tokens.get(f"127.0.0.1:{port}", 0) > 0 and tokens.get(f"localhost:{port}", 0) == 0,
+                        json.dumps(tokens)))
+        ok.append(interrupted)
+    return 0 if all(ok) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,13 +2,28 @@
 
 # This code is available under the MIT license: https://opensource.org/licenses/MIT
 
+"""Report which compose services docker compose would keep, recreate or create.
+
+Compares each service's `docker compose config --hash=*` with the config-hash
+label of its running containers: for the project in the current directory, or
+with --all for every compose project with running containers on this host.
+"""
+
 from pathlib import Path
+import argparse
 import subprocess
 import json
-from dataclasses import dataclass
-from typing import List, Optional
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
 
-container_hashes = subprocess.check_output(["docker", "ps", "-q"], text=True)
+# What compose will do with a service's container, and how the table shows it
+ACTIONS = {
+    "keep": "Keeping container",
+    "recreate": "Restarting container",
+    "new": "New container",
+}
 
 
 @dataclass
@@ -20,10 +35,26 @@ class Container:
     containernum: int
     service: str
     work_dir: Path
+    name: str
+
+
+@dataclass
+class Project:
+    name: str
+    work_dir: Path
+    config_files: List[str]
+
+
+@dataclass
+class Row:
+    project: str
+    service: str
+    action: str
+    container: str = ""
 
-    @property
-    def name(self) -> str:
-        return f"{self.project}_{self.service}_{self.containernum}"
+
+# Running compose containers by (resolved working dir, service)
+ContainerTable = Dict[Tuple[Path, str], List[Container]]
 
 
 # start gist block
@@ -61,55 +92,146 @@ def format_table(
 
 # end gist block
 
-containers: List[Container] = []
 
-for container_hash in container_hashes.strip().split("\n"):
-    labels_json = subprocess.check_output(
-        ["docker", "inspect", container_hash, "-f", "'{{json .Config.Labels}}'"],
-        text=True,
-    )
-    labels_json = labels_json.strip().rstrip("'").lstrip("'")
-    labels = json.loads(labels_json)
-
-    c = Container(
-        container_hash,
-        labels["com.docker.compose.config-hash"],
-        labels["com.docker.compose.project"],
-        labels["com.docker.compose.project.config_files"],
-        int(labels["com.docker.compose.container-number"]),
-        labels["com.docker.compose.service"],
-        Path(labels["com.docker.compose.project.working_dir"]),
+def load_containers() -> ContainerTable:
+    """Index the running compose containers (one `docker ps`, one `docker inspect`)."""
+    container_hashes = subprocess.check_output(
+        ["docker", "ps", "-q", "--no-trunc"], text=True
+    ).split()
+    if not container_hashes:
+        return {}
+    # A container that goes away between the two calls makes inspect exit non-zero,
+    # but it still prints the ones that exist
+    result = subprocess.run(
+        ["docker", "inspect", *container_hashes], capture_output=True, text=True
     )
-    containers.append(c)
-
-
-hashes = subprocess.check_output(
-    ["docker-compose", "config", "--hash=*"], text=True
-).strip()
-confs = [srv_hash.split(" ") for srv_hash in hashes.split("\n")]
-
-tbl: List[List[str]] = []
-
-for service, conf_hash in confs:
-    workdir = Path(".")
-    service_conts = list(
-        filter(
-            lambda c: c.work_dir.resolve() == workdir.resolve()
-            and c.service == service,
-            containers,
+    inspected = json.loads(result.stdout) if result.stdout.strip() else []
+
+    resolved: Dict[str, Path] = {}
+    containers: ContainerTable = {}
+    for info in inspected:
+        labels = info["Config"]["Labels"] or {}
+        if "com.docker.compose.project" not in labels:
+            continue
+
+        # Containers of a project share a working dir: resolve each one once
+        work_dir = labels["com.docker.compose.project.working_dir"]
+        if work_dir not in resolved:
+            resolved[work_dir] = Path(work_dir).resolve()
+
+        c = Container(
+            info["Id"],
+            labels["com.docker.compose.config-hash"],
+            labels["com.docker.compose.project"],
+            labels["com.docker.compose.project.config_files"],
+            int(labels["com.docker.compose.container-number"]),
+            labels["com.docker.compose.service"],
+            resolved[work_dir],
+            info["Name"].lstrip("/"),
         )
+        containers.setdefault((c.work_dir, c.service), []).append(c)
+    return containers
+
+
+def find_projects(containers: ContainerTable) -> List[Project]:
+    """The compose projects the running containers belong to."""
+    projects: Dict[str, Project] = {}
+    for conts in containers.values():
+        for c in conts:
+            if c.project not in projects:
+                files = [f for f in c.config.split(",") if f]
+                projects[c.project] = Project(c.project, c.work_dir, files)
+    return sorted(projects.values(), key=lambda p: p.name)
+
+
+def config_hashes(project: Project) -> List[Tuple[str, str]]:
+    """(service, config hash) pairs from `docker compose config --hash=*`."""
+    cmd = ["docker", "compose"]
+    if project.name:
+        cmd += ["-p", project.name]
+    for config_file in project.config_files:
+        cmd += ["-f", config_file]
+    hashes = subprocess.check_output(
+        [*cmd, "config", "--hash=*"], text=True, cwd=project.work_dir
+    ).strip()
+    return [tuple(line.split(" ", 1)) for line in hashes.split("\n") if line]
+
+
+def compare(
+    project: Project, confs: List[Tuple[str, str]], containers: ContainerTable
+) -> List[Row]:
+    """Keep, recreate or new for each of the project's services."""
+    rows = []
+    for service, conf_hash in confs:
+        service_conts = [
+            c
+            for c in containers.get((project.work_dir, service), [])
+            if c.project == project.name or not project.name
+        ]
+        if not service_conts:
+            rows.append(Row(project.name, service, "new"))
+        for c in service_conts:
+            action = "keep" if c.config_hash == conf_hash else "recreate"
+            rows.append(Row(project.name, service, action, c.name))
+    return rows
+
+
+def check_projects(
+    projects: List[Project], containers: ContainerTable, jobs: int
+) -> List[Row]:
+    """Compare every project, running `docker compose config` concurrently."""
+
+    def check(project: Project) -> List[Row]:
+        try:
+            return compare(project, config_hashes(project), containers)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"{project.name}: docker compose config failed: {e}", file=sys.stderr)
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(projects) or 1))) as pool:
+        return [row for rows in pool.map(check, projects) for row in rows]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="check every compose project with running containers on this host",
     )
-    col = [service]
-    if len(service_conts) == 0:
-        col += ["New container", ""]
-    else:
-        for result in service_conts:
-            if result.config_hash != conf_hash:
-                col += ["Restarting container", result.name]
-            else:
-                col += ["Keeping container", result.name]
-    tbl.append(col)
-
-tbl = list(map(list, zip(*tbl)))
+    parser.add_argument(
+        "--json", action="store_true", help="print JSON instead of a table"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="projects to check at once with --all (default: 8)",
+    )
+    args = parser.parse_args(argv)
 
-print(format_table(tbl, headers=["service", "todo", "container"]))
+    containers = load_containers()
+    if args.all:
+        rows = check_projects(find_projects(containers), containers, args.jobs)
+    else:
+        # The project in the current directory, with its default compose files
+        project = Project("", Path(".").resolve(), [])
+        rows = compare(project, config_hashes(project), containers)
+
+    if args.json:
+        print(json.dumps([asdict(row) for row in rows], indent=2))
+        return 0
+
+    headers = ["service", "todo", "container"]
+    tbl = [[row.service, ACTIONS[row.action], row.container] for row in rows]
+    if args.all:
+        headers.insert(0, "project")
+        tbl = [[row.project, *cols] for row, cols in zip(rows, tbl)]
+    if tbl:
+        print(format_table(list(map(list, zip(*tbl))), headers=headers))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
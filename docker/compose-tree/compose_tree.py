@@ -8,18 +8,98 @@ Shows what containers need restarting and why, including dependency chains.
 from __future__ import annotations
 
 import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import http.client
 import json
+import os
+import queue
 import re
+import select
+import shutil
+import signal
+import socket
+import socketserver
+import struct
 import subprocess
 import sys
-from dataclasses import dataclass, field
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
 from enum import Enum
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+from urllib.parse import quote, unquote, urlencode, urlparse
+
+from dependency_graph import DependencyGraph
+
+# dataclass(slots=True) (see Change) needs 3.10; fail with a clear message rather than a TypeError
+if sys.version_info < (3, 10):
+    sys.exit("compose-tree needs Python 3.10 or newer")
 
 # Global debug flag
 DEBUG = False
 
+# --experimental-native-loader: resolve compose files in-process (native_loader.py)
+# instead of with `docker compose config`
+NATIVE_LOADER = False
+
+# Skip the detailed config diff for services whose compose config hash matches
+# their container's com.docker.compose.config-hash label (off with --full-diff)
+CONFIG_HASH_CHECK = True
+
+# Limits for batched `docker inspect` calls (names per call / total argument bytes)
+INSPECT_CHUNK_SIZE = 200
+INSPECT_ARG_BYTES = 64 * 1024
+
+# Maximum number of docker subprocesses running at once (set via --jobs)
+DEFAULT_JOBS = 8
+_jobs = DEFAULT_JOBS
+_command_slots = threading.BoundedSemaphore(DEFAULT_JOBS)
+
+# Engine API client, set when running with --backend api (None = use the docker CLI)
+DOCKER_API: DockerAPIClient | None = None
+DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
+
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "compose-tree"
+# Bump when the cached config format or fingerprint inputs change
+CONFIG_CACHE_VERSION = 2
+# Where the docker CLI looks for the compose plugin (besides $DOCKER_CONFIG/cli-plugins)
+COMPOSE_PLUGIN_DIRS = (
+    "/usr/local/lib/docker/cli-plugins",
+    "/usr/local/libexec/docker/cli-plugins",
+    "/usr/lib/docker/cli-plugins",
+    "/usr/libexec/docker/cli-plugins",
+)
+# Bump when the stored inspect snapshot format changes
+INSPECT_STORE_VERSION = 1
+# Set by --hosts for each host's run: keys inspect snapshots by host, as its tunnel socket changes per run
+HOST_LABEL_ENV = "COMPOSE_TREE_HOST"
+
+# --apply: `docker compose up` timeout, and how often to poll while waiting for health
+COMPOSE_UP_TIMEOUT = 600
+HEALTH_POLL_INTERVAL = 1.0
+DEFAULT_HEALTH_TIMEOUT = 120
+
+# Version of the --format json/ndjson document layout; bump on incompatible changes
+OUTPUT_SCHEMA_VERSION = 1
+
+# Wall time spent in each analysis phase, in seconds (see phase())
+PHASE_TIMINGS: dict[str, float] = {}
+
+# Span recorder, set when running with --profile (None = profiling off)
+PROFILER: Profiler | None = None
+
+T = TypeVar("T")
+
 
 class Colour:
     """ANSI colour codes for terminal output."""
@@ -53,12 +133,32 @@ class RestartTrigger(Enum):
     NOT_CREATED = "NOT_CREATED"
 
 
+@dataclass(slots=True)
+class Change:
+    """One difference between compose and a container: `old` is the container's value, `new` compose's."""
+
+    field: str
+    key: str | None = None
+    old: Any = None
+    new: Any = None
+    source: str | None = None
+
+
 @dataclass
 class RestartReason:
-    """A single reason for restart with details."""
+    """A single reason for restart with details.
+
+    `details` holds plain messages (or, for DEPENDENCY_RESTART, the triggering
+    services); `changes` are rendered into display lines only when shown, see lines().
+    """
 
     trigger: RestartTrigger
     details: list[str] = field(default_factory=list)
+    changes: list[Change] = field(default_factory=list)
+
+    def lines(self) -> list[str]:
+        """Display lines: the details, then the changes rendered with the current colours."""
+        return self.details + render_changes(self.changes) if self.changes else self.details
 
 
 @dataclass
@@ -74,29 +174,351 @@ class ServiceStatus:
     exit_code: int | None = None
 
 
-def run_command(cmd: list[str], cwd: Path | None = None) -> tuple[int, str, str]:
-    """Run a command and return exit code, stdout, stderr."""
+def debug(message: str) -> None:
+    """Print a debug message when --debug is set."""
+    if DEBUG:
+        print(f"  [DEBUG] {message}")
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Add the wall time of the enclosed block to PHASE_TIMINGS[name]."""
+    start = time.perf_counter()
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=cwd,
-            timeout=60,
+        yield
+    finally:
+        end = time.perf_counter()
+        PHASE_TIMINGS[name] = PHASE_TIMINGS.get(name, 0.0) + end - start
+        if PROFILER:
+            PROFILER.record("phase", name, start, end)
+
+
+class Profiler:
+    """Records timed spans (phases, subprocesses, API calls, services) for --profile."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.spans: list[tuple[str, str, float, float, int, dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def record(self, category: str, name: str, start: float, end: float, **args: Any) -> None:
+        with self._lock:
+            self.spans.append((category, name, start, end, threading.get_ident(), args))
+
+    @contextmanager
+    def span(self, category: str, name: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, start, time.perf_counter(), **args)
+
+    def totals(self, category: str) -> list[tuple[str, int, float, float]]:
+        """(name, count, total seconds, max seconds) per span name, slowest total first."""
+        grouped: dict[str, list[float]] = {}
+        for span_category, name, start, end, _, _ in self.spans:
+            if span_category == category:
+                grouped.setdefault(name, []).append(end - start)
+        return sorted(
+            ((name, len(times), sum(times), max(times)) for name, times in grouped.items()),
+            key=lambda row: row[2],
+            reverse=True,
         )
-        return result.returncode, result.stdout, result.stderr
-    except subprocess.TimeoutExpired:
-        return 1, "", "Command timed out"
-    except FileNotFoundError:
-        return 1, "", f"Command not found: {cmd[0]}"
+
+    def report(self, limit: int = 10) -> None:
+        """Print the per-phase, per-subprocess and slowest-service breakdown to stderr."""
+        wall = time.perf_counter() - self.start
+        sections = [
+            ("phase", "Phases"),
+            ("subprocess", "Subprocesses"),
+            ("api", "Engine API requests"),
+            ("function", "Functions"),
+            ("comparator", "Config comparators"),
+            ("service", f"Slowest services (top {limit})"),
+        ]
+        print(f"\n{Colour.BOLD}Profile:{Colour.RESET} {wall * 1000:.1f} ms wall time", file=sys.stderr)
+        for category, title in sections:
+            rows = self.totals(category)
+            if category == "service":
+                rows = rows[:limit]
+            if not rows:
+                continue
+            width = max(len(title), *(len(name) for name, *_ in rows))
+            print(
+                f"\n{Colour.BOLD}{title:<{width}}  {'calls':>6}  {'total ms':>9}  {'max ms':>8}{Colour.RESET}",
+                file=sys.stderr,
+            )
+            for name, count, total, longest in rows:
+                print(
+                    f"{name:<{width}}  {count:>6}  {total * 1000:>9.2f}  {longest * 1000:>8.2f}",
+                    file=sys.stderr,
+                )
+
+    def write_trace(self, path: Path) -> None:
+        """Write the spans as a Chrome trace-event file (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        main_thread = threading.main_thread().ident
+        threads = {main_thread: 0}
+        for span in self.spans:
+            threads.setdefault(span[4], len(threads))
+        events: list[dict[str, Any]] = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": index,
+             "args": {"name": "main" if ident == main_thread else f"worker-{index}"}}
+            for ident, index in threads.items()
+        ]
+        for category, name, start, end, ident, args in self.spans:
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.start) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": pid,
+                "tid": threads[ident],
+                "args": args,
+            })
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+
+_NOT_PROFILED = nullcontext()
+
+
+def profiled(category: str, name: str, **args: Any) -> Any:
+    """Context manager timing a block into PROFILER; a no-op when profiling is off."""
+    if PROFILER is None:
+        return _NOT_PROFILED
+    return PROFILER.span(category, name, **args)
+
+
+def profiled_function(func: Callable[..., T]) -> Callable[..., T]:
+    """Decorator timing each call of `func` into PROFILER when profiling is on."""
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        if PROFILER is None:
+            return func(*args, **kwargs)
+        with PROFILER.span("function", func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def set_jobs(jobs: int) -> None:
+    """Set the maximum number of concurrent docker subprocesses."""
+    global _command_slots, _jobs
+    _jobs = max(1, jobs)
+    _command_slots = threading.BoundedSemaphore(_jobs)
+
+
+def command_label(cmd: list[str]) -> str:
+    """Short name for a command, e.g. "docker compose config" or "docker image inspect"."""
+    words = [cmd[0]]
+    args = iter(cmd[1:])
+    for arg in args:
+        if arg in ("-f", "--file", "-p", "--project-name", "--project-directory", "--filter", "--format"):
+            next(args, None)
+        elif not arg.startswith("-"):
+            words.append(arg)
+            if arg not in ("compose", "image", "container"):
+                break
+    return " ".join(words)
+
+
+def run_command(cmd: list[str], cwd: Path | None = None, timeout: float = 60) -> tuple[int, str, str]:
+    """Run a command and return exit code, stdout, stderr.
+
+    Safe to call from worker threads; at most --jobs commands run at once.
+    """
+    with _command_slots, profiled("subprocess", command_label(cmd), argv=cmd):
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                cwd=cwd,
+                timeout=timeout,
+            )
+            return result.returncode, result.stdout, result.stderr
+        except subprocess.TimeoutExpired:
+            return 1, "", "Command timed out"
+        except FileNotFoundError:
+            return 1, "", f"Command not found: {cmd[0]}"
+
+
+def run_parallel(tasks: list[Callable[[], T]]) -> list[T]:
+    """Run independent tasks on worker threads, returning results in task order."""
+    if len(tasks) <= 1:
+        return [task() for task in tasks]
+    with ThreadPoolExecutor(max_workers=min(len(tasks), _jobs)) as pool:
+        return list(pool.map(lambda task: task(), tasks))
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP/1.1 connection over a unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout: float = 60) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerAPIError(Exception):
+    """The Engine API could not be reached or returned an unexpected response."""
+
+
+# Object IDs/names in Engine API paths, collapsed so --profile groups requests per endpoint
+API_PATH_ID_RE = re.compile(r"^/(containers|images)/.+/json$")
+
+
+class DockerAPIClient:
+    """Minimal Docker Engine API client with a pool of keep-alive connections.
+
+    Avoids the docker CLI's per-invocation startup cost. Only the read-only
+    endpoints compose-tree needs are implemented.
+    """
+
+    def __init__(self, socket_path: str, pool_size: int = DEFAULT_JOBS) -> None:
+        self.socket_path = socket_path
+        self._pool: queue.LifoQueue[UnixHTTPConnection] = queue.LifoQueue(maxsize=pool_size)
+
+    @classmethod
+    def from_env(cls, pool_size: int = DEFAULT_JOBS) -> DockerAPIClient | None:
+        """Create a client for the local daemon socket, or None if it isn't reachable."""
+        docker_host = os.environ.get("DOCKER_HOST", "")
+        if docker_host and not docker_host.startswith("unix://"):
+            return None
+        socket_path = docker_host.removeprefix("unix://") or DEFAULT_DOCKER_SOCKET
+        client = cls(socket_path, pool_size)
+        try:
+            client.get("/_ping")
+        except DockerAPIError:
+            return None
+        return client
+
+    def _request(self, conn: UnixHTTPConnection, path: str) -> tuple[int, bytes]:
+        conn.request("GET", path, headers={"Connection": "keep-alive"})
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.will_close:
+            conn.close()
+        return resp.status, body
+
+    def get(self, path: str) -> tuple[int, bytes]:
+        """GET a path, returning (status, body). Raises DockerAPIError on connection failure."""
+        endpoint = API_PATH_ID_RE.sub(r"/\1/{id}/json", path.split("?")[0])
+        with _command_slots, profiled("api", f"GET {endpoint}", path=path):
+            return self._get(path)
+
+    def _get(self, path: str) -> tuple[int, bytes]:
+        try:
+            conn = self._pool.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = UnixHTTPConnection(self.socket_path)
+            reused = False
+
+        try:
+            status, body = self._request(conn, path)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            if not reused:
+                raise DockerAPIError(str(e)) from e
+            # Idle keep-alive connection was dropped by the daemon: retry on a fresh one
+            conn = UnixHTTPConnection(self.socket_path)
+            try:
+                status, body = self._request(conn, path)
+            except (OSError, http.client.HTTPException) as e2:
+                conn.close()
+                raise DockerAPIError(str(e2)) from e2
+
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return status, body
+
+    def get_json(self, path: str) -> Any | None:
+        """GET a path and decode JSON; None for 404. Raises DockerAPIError otherwise."""
+        status, body = self.get(path)
+        if status == 404:
+            return None
+        if status != 200:
+            raise DockerAPIError(f"GET {path}: HTTP {status}")
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError as e:
+            raise DockerAPIError(f"GET {path}: {e}") from e
+
+    def compose_ps(self, project: str) -> list[dict[str, Any]]:
+        """List a compose project's containers in `docker compose ps --format json` shape."""
+        filters = json.dumps({
+            "label": [f"com.docker.compose.project={project}", "com.docker.compose.oneoff=False"],
+        })
+        containers = self.get_json(f"/containers/json?{urlencode({'all': 1, 'filters': filters})}") or []
+
+        result = []
+        for c in containers:
+            labels = c.get("Labels") or {}
+            names = c.get("Names") or []
+            exit_match = re.match(r"Exited \((-?\d+)\)", c.get("Status", ""))
+            health_match = re.search(r"\((healthy|unhealthy|health: starting)\)", c.get("Status", ""))
+            result.append({
+                "ID": c.get("Id", ""),
+                "Name": names[0].lstrip("/") if names else "",
+                "Service": labels.get("com.docker.compose.service", ""),
+                "Created": c.get("Created"),
+                "State": c.get("State", ""),
+                "Health": health_match.group(1).removeprefix("health: ") if health_match else "",
+                "ExitCode": int(exit_match.group(1)) if exit_match else 0,
+            })
+        return result
+
+    def inspect_container(self, name: str) -> dict[str, Any] | None:
+        """Equivalent of `docker inspect <container>`."""
+        return self.get_json(f"/containers/{quote(name, safe='')}/json")
+
+    def image_id(self, ref: str) -> str | None:
+        """Equivalent of `docker image inspect <ref> --format {{.Id}}`."""
+        data = self.get_json(f"/images/{quote(ref, safe='/:@')}/json")
+        return data.get("Id") if data else None
+
+
+# Compose/env file tokens, compiled once rather than per line
+SERVICE_KEY_RE = re.compile(r"^(\w[\w.-]*):\s*(?:&[\w-]+\s*)?(?:#.*)?$")
+INCLUDE_PATH_RE = re.compile(r"^-?\s*path:\s*([^\s#]+)")
+ENV_FILE_INLINE_RE = re.compile(r"env_file:\s*([^\s#]+)")
+EXTENDS_FILE_RE = re.compile(r"(?:^|[{,\s])file:\s*([^\s#,}]+)")
+LIST_ITEM_RE = re.compile(r"^-\s*(?:path:\s*)?([^\s#]+)")
+ANCHOR_DEF_RE = re.compile(r"^x-[\w-]+:\s*&([\w-]+)")
+ALIAS_RE = re.compile(r"\*(\w[\w-]*)")
+IDENTIFIER_RE = re.compile(r"[A-Za-z_]\w*")
+
+# Parsed env files: {resolved_path: ((mtime_ns, size), {VAR: path})}
+_env_file_cache: dict[Path, tuple[tuple[int, int], dict[str, str]]] = {}
+# Tokenised compose files: {(path, base_dir): ((mtime_ns, size), structure)}
+_structure_cache: dict[tuple[Path, Path], tuple[tuple[int, int], ComposeFileStructure]] = {}
 
 
 def parse_env_file(env_path: Path) -> dict[str, str]:
-    """Parse an env file and return variable names defined in it."""
-    variables = {}
-    if not env_path.exists():
-        return variables
+    """Parse an env file and return variable names defined in it.
+
+    Results are memoised by path and (mtime, size), so an env file shared by
+    many services is only read once per run.
+    """
+    try:
+        st = env_path.stat()
+    except OSError:
+        return {}
+
+    fingerprint = (st.st_mtime_ns, st.st_size)
+    cached = _env_file_cache.get(env_path)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
 
+    variables = {}
     try:
         with open(env_path) as f:
             for line in f:
@@ -110,243 +532,402 @@ def parse_env_file(env_path: Path) -> dict[str, str]:
                         variables[key] = str(env_path)
     except (OSError, IOError):
         pass
+    _env_file_cache[env_path] = (fingerprint, variables)
     return variables
 
 
+@dataclass
+class ComposeFileStructure:
+    """The parts of one compose file that determine where env vars come from.
+
+    includes:    [(included_file, [env_file, ...]), ...]
+    anchors:     {anchor_name: [env_file, ...]} for x-* extension fields
+    services:    {service_name: [("anchor", name) | ("env_file", [path, ...]), ...]} in file order
+    identifiers: every word in the file that could name an environment variable
+                 (interpolation or pass-through), used to fingerprint the shell env
+    extends:     files named by services' `extends: file:`
+    """
+
+    includes: list[tuple[Path, list[Path]]] = field(default_factory=list)
+    extends: list[Path] = field(default_factory=list)
+    anchors: dict[str, list[Path]] = field(default_factory=dict)
+    services: dict[str, list[tuple[str, Any]]] = field(default_factory=dict)
+    identifiers: set[str] = field(default_factory=set)
+
+
+def parse_compose_structure(file_path: Path, base_dir: Path) -> ComposeFileStructure:
+    """Tokenise a compose file in a single pass over its lines.
+
+    Regex/indent based rather than a YAML parser so anchors and merge keys can be
+    followed back to the env_files they carry.
+    """
+    structure = ComposeFileStructure()
+    try:
+        content = file_path.read_text()
+    except OSError:
+        return structure
+    lines = content.split("\n")
+    structure.identifiers = set(IDENTIFIER_RE.findall(content))
+
+    top_key = ""
+    service_indent = -1
+    # Open include entry: (indent of "- path:", env_files)
+    include: tuple[int, list[Path]] | None = None
+    # Owner of the current block: an anchor's or a service's env_file list
+    anchor_files: list[Path] | None = None
+    service_events: list[tuple[str, Any]] | None = None
+    # Open multi-line "env_file:" list and its indent
+    env_list: list[Path] | None = None
+    env_list_indent = 0
+    # Indent of an open block-style "extends:" mapping
+    extends_indent = -1
+
+    for line in lines:
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(line) - len(stripped)
+
+        if indent == 0:
+            # New top-level key closes every open block
+            top_key = stripped.split(":", 1)[0]
+            include = None
+            anchor_files = service_events = env_list = None
+            anchor_match = ANCHOR_DEF_RE.match(stripped)
+            if anchor_match:
+                anchor_files = structure.anchors.setdefault(anchor_match.group(1), [])
+            continue
+
+        if top_key == "include":
+            # Entries sit at the "- path:" indent; anything deeper belongs to the open entry
+            if include and indent <= include[0]:
+                include = None
+            path_match = INCLUDE_PATH_RE.match(stripped)
+            if path_match and include is None:
+                inc_path = (base_dir / path_match.group(1).strip("'\"")).resolve()
+                include = (indent, [])
+                structure.includes.append((inc_path, include[1]))
+            elif include is not None:
+                inline = ENV_FILE_INLINE_RE.match(stripped)
+                if inline:
+                    include[1].append((base_dir / inline.group(1).strip("'\"")).resolve())
+                else:
+                    item = LIST_ITEM_RE.match(stripped)
+                    if item:
+                        include[1].append((base_dir / item.group(1).strip("'\"")).resolve())
+            continue
+
+        if top_key == "services":
+            if service_indent < 0:
+                service_indent = indent
+            if indent == service_indent:
+                svc_match = SERVICE_KEY_RE.match(stripped)
+                service_events = structure.services.setdefault(svc_match.group(1), []) if svc_match else None
+                env_list = None
+                extends_indent = -1
+                continue
+
+        if anchor_files is None and service_events is None:
+            continue
+
+        if env_list is not None:
+            if indent <= env_list_indent and not stripped.startswith("-"):
+                env_list = None
+            else:
+                item = LIST_ITEM_RE.match(stripped)
+                if item:
+                    env_list.append((base_dir / item.group(1).strip("'\"")).resolve())
+                continue
+
+        if service_events is not None:
+            if extends_indent >= 0 and indent <= extends_indent:
+                extends_indent = -1
+            if stripped.startswith("extends:"):
+                value = stripped[len("extends:"):].split(" #", 1)[0].strip()
+                if not value:
+                    extends_indent = indent
+                    continue
+                file_match = EXTENDS_FILE_RE.search(value) if value.startswith("{") else None
+            else:
+                file_match = EXTENDS_FILE_RE.match(stripped) if extends_indent >= 0 else None
+            if file_match:
+                # Relative to the declaring file, not the project directory
+                structure.extends.append((file_path.parent / file_match.group(1).strip("'\"")).resolve())
+                continue
+
+        if service_events is not None and "<<:" in stripped:
+            service_events.extend(("anchor", name) for name in ALIAS_RE.findall(stripped))
+
+        if "env_file:" in stripped:
+            inline = ENV_FILE_INLINE_RE.match(stripped)
+            files = anchor_files if service_events is None else []
+            if service_events is not None:
+                service_events.append(("env_file", files))
+            if inline:
+                files.append((base_dir / inline.group(1).strip("'\"")).resolve())
+            else:
+                # Multi-line list: filled in as the following lines are read
+                env_list, env_list_indent = files, indent
+
+    return structure
+
+
+def load_compose_structure(file_path: Path, base_dir: Path) -> ComposeFileStructure:
+    """parse_compose_structure, memoised by path and (mtime, size)."""
+    try:
+        st = file_path.stat()
+    except OSError:
+        return ComposeFileStructure()
+
+    fingerprint = (st.st_mtime_ns, st.st_size)
+    cached = _structure_cache.get((file_path, base_dir))
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+    structure = parse_compose_structure(file_path, base_dir)
+    _structure_cache[(file_path, base_dir)] = (fingerprint, structure)
+    return structure
+
+
+def get_compose_inputs(
+    compose_file: Path, project_dir: Path, extra_files: tuple[Path, ...] = ()
+) -> tuple[list[Path], set[str]]:
+    """List every file that can affect `docker compose config` output.
+
+    Covers the compose file(s), transitive includes and `extends: file:` targets,
+    all referenced env_files and the .env files compose reads for interpolation.
+    Returns: ([path, ...], {identifier, ...}) - identifiers may name env vars.
+    """
+    files: dict[Path, None] = {}
+    identifiers: set[str] = set()
+    pending = [(f, project_dir) for f in reversed((compose_file, *extra_files))]
+
+    while pending:
+        file_path, base_dir = pending.pop()
+        if file_path in files:
+            continue
+        files[file_path] = None
+        files.setdefault(base_dir / ".env", None)
+
+        structure = load_compose_structure(file_path, base_dir)
+        identifiers |= structure.identifiers
+        for inc_full, inc_env_files in structure.includes:
+            files.update(dict.fromkeys(inc_env_files))
+            pending.append((inc_full, inc_full.parent))
+        # An extended service's file (and the env_files it declares) feeds the config too
+        for ext_full in structure.extends:
+            pending.append((ext_full, ext_full.parent))
+        for env_files in structure.anchors.values():
+            files.update(dict.fromkeys(env_files))
+        for events in structure.services.values():
+            for kind, value in events:
+                if kind == "env_file":
+                    files.update(dict.fromkeys(value))
+
+    return list(files), identifiers
+
+
+@profiled_function
 def get_service_env_sources(
-    compose_file: Path, project_dir: Path
+    compose_file: Path, project_dir: Path, extra_files: tuple[Path, ...] = ()
 ) -> dict[str, dict[str, str]]:
     """Parse compose file(s) to find env_file references for each service.
 
-    Uses regex-based parsing to handle YAML anchors that standard parsers can't.
+    Each compose file is tokenised once (see load_compose_structure) and each
+    env file parsed once (see parse_env_file).
     Returns: {service_name: {VAR_NAME: "source_file_path", ...}, ...}
     """
     service_sources: dict[str, dict[str, str]] = {}
     processed_files: set[Path] = set()
-    # Track which services are defined in which files
-    file_services: dict[Path, list[str]] = {}
     # Track env_files associated with YAML anchors (x-common patterns)
     anchor_env_files: dict[str, list[Path]] = {}
 
-    def extract_services_from_file(file_path: Path) -> list[str]:
-        """Extract service names from a compose file."""
-        services = []
-        if not file_path.exists():
-            return services
-        try:
-            content = file_path.read_text()
-        except OSError:
-            return services
-
-        for line in content.split("\n"):
-            stripped = line.lstrip()
-            indent = len(line) - len(stripped)
-            if indent == 2 and stripped and not stripped.startswith("#"):
-                svc_match = re.match(r"^&?\w*\s*(\w[\w-]*):\s*$", stripped)
-                if svc_match:
-                    services.append(svc_match.group(1))
-        return services
-
-    def extract_env_files_from_compose(
-        file_path: Path, base_dir: Path, inherited_env_files: list[Path] | None = None
+    def add_env_file(sources: dict[str, str], ef_path: Path, override: bool) -> None:
+        for var_name in parse_env_file(ef_path):
+            if override or var_name not in sources:
+                sources[var_name] = str(ef_path)
+
+    def process_file(
+        file_path: Path, base_dir: Path, inherited_env_files: list[Path]
     ) -> None:
-        """Extract env_file references from a compose file using regex."""
-        if not file_path.exists() or file_path in processed_files:
+        if not file_path.is_file() or file_path in processed_files:
             return
         processed_files.add(file_path)
+        structure = load_compose_structure(file_path, base_dir)
+
+        # Included files: their services inherit the include's env_files
+        # (without overriding their own), then the file is processed itself
+        for inc_full, inc_env_files in structure.includes:
+            all_inherited = inherited_env_files + inc_env_files
+            inc_services = load_compose_structure(inc_full, inc_full.parent).services
+            for svc in inc_services:
+                sources = service_sources.setdefault(svc, {})
+                for ef_path in all_inherited:
+                    add_env_file(sources, ef_path, override=False)
+            process_file(inc_full, inc_full.parent, all_inherited)
+
+        anchor_env_files.update(structure.anchors)
+
+        # Service env_files override; merged anchors only fill gaps
+        for svc, events in structure.services.items():
+            sources = service_sources.setdefault(svc, {})
+            for kind, value in events:
+                if kind == "anchor":
+                    for ef_path in anchor_env_files.get(value, []):
+                        add_env_file(sources, ef_path, override=False)
+                else:
+                    for ef_path in value:
+                        add_env_file(sources, ef_path, override=True)
+
+    # Start processing from the main compose file, then any override files in order
+    for file_path in (compose_file, *extra_files):
+        process_file(file_path, project_dir, [])
 
-        if inherited_env_files is None:
-            inherited_env_files = []
+    return service_sources
 
-        try:
-            content = file_path.read_text()
-        except OSError:
-            return
 
-        # Find include directives with their env_files
-        # Match include blocks like:
-        #   - path: ./docker-compose-xxx.yaml
-        #     env_file:
-        #       - .env
-        lines = content.split("\n")
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            stripped = line.lstrip()
-            indent = len(line) - len(stripped)
-
-            # Look for "- path:" in include section
-            path_match = re.match(r"^-?\s*path:\s*([^\s#]+)", stripped)
-            if path_match:
-                inc_path = path_match.group(1).strip("'\"")
-                inc_full = (base_dir / inc_path).resolve()
-
-                # Look for env_file in the following lines
-                inc_env_files: list[Path] = []
-                j = i + 1
-                while j < len(lines):
-                    next_line = lines[j]
-                    next_stripped = next_line.lstrip()
-                    next_indent = len(next_line) - len(next_stripped)
-
-                    # If we hit another "- path:" or less indented, stop
-                    if next_stripped.startswith("- path:") or (
-                        next_indent <= indent and next_stripped and not next_stripped.startswith("#")
-                    ):
-                        break
-
-                    if "env_file:" in next_stripped:
-                        # Check for single-line env_file
-                        single = re.match(r"env_file:\s*([^\s#]+)", next_stripped)
-                        if single:
-                            ef = single.group(1).strip("'\"")
-                            inc_env_files.append((base_dir / ef).resolve())
-                        j += 1
-                        continue
+class ConfigCache:
+    """On-disk cache of resolved `docker compose config` output.
 
-                    # Match env_file list entry
-                    ef_match = re.match(r"^-\s*([^\s#]+)", next_stripped)
-                    if ef_match and next_indent > indent:
-                        ef = ef_match.group(1).strip("'\"")
-                        inc_env_files.append((base_dir / ef).resolve())
-                    j += 1
-
-                # Get services defined in included file
-                inc_services = extract_services_from_file(inc_full)
-                file_services[inc_full] = inc_services
-
-                # Apply inherited env_files to services in included file
-                all_inherited = inherited_env_files + inc_env_files
-                for svc in inc_services:
-                    if svc not in service_sources:
-                        service_sources[svc] = {}
-                    for ef_path in all_inherited:
-                        env_vars = parse_env_file(ef_path)
-                        for var_name in env_vars:
-                            # Don't override service-specific env_file
-                            if var_name not in service_sources[svc]:
-                                service_sources[svc][var_name] = str(ef_path)
-
-                # Recursively process included file
-                if inc_full.exists():
-                    extract_env_files_from_compose(inc_full, inc_full.parent, all_inherited)
-
-            i += 1
-
-        # First pass: extract x-anchor definitions with their env_files
-        current_anchor = None
-        in_anchor_env_file = False
-        anchor_env_indent = 0
-
-        for line in lines:
-            stripped = line.lstrip()
-            indent = len(line) - len(stripped)
-
-            # Match x-* anchor definitions: "x-ai-common: &ai-common"
-            if indent == 0 and stripped.startswith("x-"):
-                anchor_match = re.match(r"x-[\w-]+:\s*&([\w-]+)", stripped)
-                if anchor_match:
-                    current_anchor = anchor_match.group(1)
-                    anchor_env_files[current_anchor] = []
-                    in_anchor_env_file = False
-                continue
+    One entry per compose file and kind of output (the config itself, or the
+    per-service config hashes), valid while the fingerprint of its inputs (see
+    get_compose_inputs, plus referenced environment variables) is unchanged.
+    """
 
-            # Look for env_file in anchor definition
-            if current_anchor and "env_file:" in stripped and not stripped.startswith("#"):
-                in_anchor_env_file = True
-                anchor_env_indent = indent
-                single_match = re.match(r"env_file:\s*([^\s#]+)", stripped)
-                if single_match:
-                    ef_path = single_match.group(1).strip("'\"")
-                    anchor_env_files[current_anchor].append((base_dir / ef_path).resolve())
-                    in_anchor_env_file = False
+    def __init__(self, cache_dir: Path = CACHE_DIR) -> None:
+        self.cache_dir = cache_dir / "config"
+        self.enabled = True
+        self.refresh = False
+        self.hits = 0
+        self.misses = 0
+        self._compose_version: str | None = None
+        self._version_lock = threading.Lock()
+
+    def entry_path(self, compose_files: tuple[Path, ...], kind: str = "config") -> Path:
+        key = hashlib.sha256("\0".join(map(str, compose_files)).encode()).hexdigest()[:32]
+        return self.cache_dir / (f"{key}.json" if kind == "config" else f"{key}.{kind}.json")
+
+    def fingerprint(
+        self, compose_files: tuple[Path, ...], project_dir: Path, project_name: str | None = None
+    ) -> str:
+        """Hash every input that can change the resolved config."""
+        files, identifiers = get_compose_inputs(compose_files[0], project_dir, compose_files[1:])
+        h = hashlib.sha256(
+            f"v{CONFIG_CACHE_VERSION}\0{compose_files}\0{project_dir}\0{project_name or ''}\0".encode()
+        )
+        h.update(f"{self.compose_version()}\0".encode())
+        for path in sorted(files):
+            try:
+                st = path.stat()
+                h.update(f"{path}\0{st.st_mtime_ns}\0{st.st_size}\0".encode())
+            except OSError:
+                h.update(f"{path}\0missing\0".encode())
+        for name in sorted(os.environ):
+            if name in identifiers or name.startswith(("COMPOSE_", "DOCKER_")):
+                h.update(f"{name}={os.environ[name]}\0".encode())
+        return h.hexdigest()
+
+    def compose_version(self) -> str:
+        """`docker compose version` output: an upgrade changes both config output and hashes.
+
+        Stored next to the cache entries, keyed by the docker binary and compose plugin
+        files, so a warm run doesn't spawn docker just to ask.
+        """
+        with self._version_lock:
+            if self._compose_version is None:
+                self._compose_version = self._load_compose_version()
+            return self._compose_version
+
+    def _load_compose_version(self) -> str:
+        plugin_dirs = [Path(os.environ.get("DOCKER_CONFIG") or Path.home() / ".docker") / "cli-plugins"]
+        plugin_dirs += map(Path, COMPOSE_PLUGIN_DIRS)
+        stamp = []
+        for path in [shutil.which("docker"), *(d / "docker-compose" for d in plugin_dirs)]:
+            try:
+                st = Path(path).stat() if path else None
+            except OSError:
                 continue
+            if st:
+                stamp.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        stamp_text = "\0".join(stamp)
 
-            # Collect anchor env_file list entries
-            if in_anchor_env_file and current_anchor:
-                if indent <= anchor_env_indent and stripped and not stripped.startswith("-"):
-                    in_anchor_env_file = False
-                    current_anchor = None
-                    continue
-                ef_match = re.match(r"^-\s*([^\s#]+)", stripped)
-                if ef_match:
-                    ef_path = ef_match.group(1).strip("'\"")
-                    anchor_env_files[current_anchor].append((base_dir / ef_path).resolve())
-
-            # End of anchor block (new top-level key)
-            if indent == 0 and stripped and not stripped.startswith("#") and not stripped.startswith("x-"):
-                current_anchor = None
-                in_anchor_env_file = False
-
-        # Second pass: extract service blocks and their env_file references
-        current_service = None
-        in_env_file_block = False
-        env_file_indent = 0
-
-        for line in lines:
-            stripped = line.lstrip()
-            indent = len(line) - len(stripped)
-
-            # Detect service definition
-            if indent == 2 and stripped and not stripped.startswith("#"):
-                svc_match = re.match(r"^&?\w*\s*(\w[\w-]*):\s*$", stripped)
-                if svc_match:
-                    current_service = svc_match.group(1)
-                    if current_service not in service_sources:
-                        service_sources[current_service] = {}
-                    in_env_file_block = False
-
-            # Check for anchor references: "<<: [*ai-common, *other]"
-            if current_service and "<<:" in stripped:
-                anchor_refs = re.findall(r"\*(\w[\w-]*)", stripped)
-                for anchor_name in anchor_refs:
-                    if anchor_name in anchor_env_files:
-                        for ef_path in anchor_env_files[anchor_name]:
-                            env_vars = parse_env_file(ef_path)
-                            for var_name in env_vars:
-                                if var_name not in service_sources[current_service]:
-                                    service_sources[current_service][var_name] = str(ef_path)
-
-            # Detect env_file directive
-            if current_service and "env_file:" in stripped and not stripped.startswith("#"):
-                in_env_file_block = True
-                env_file_indent = indent
-                single_match = re.match(r"env_file:\s*([^\s#]+)", stripped)
-                if single_match:
-                    ef_path = single_match.group(1).strip("'\"")
-                    ef_full = (base_dir / ef_path).resolve()
-                    env_vars = parse_env_file(ef_full)
-                    for var_name in env_vars:
-                        service_sources[current_service][var_name] = str(ef_full)
-                    in_env_file_block = False
-                continue
+        entry_path = self.cache_dir / "compose-version.json"
+        if not self.refresh:
+            try:
+                entry = json.loads(entry_path.read_text())
+                if entry["stamp"] == stamp_text:
+                    return entry["version"]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        code, stdout, _ = run_command(["docker", "compose", "version"])
+        version = stdout.strip() if code == 0 else ""
+        tmp = entry_path.with_suffix(".tmp")
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"stamp": stamp_text, "version": version}))
+            os.replace(tmp, entry_path)
+        except OSError:
+            pass
+        return version
+
+    def get(
+        self, compose_files: tuple[Path, ...], fingerprint: str, kind: str = "config"
+    ) -> dict[str, Any] | None:
+        """Return the cached entry if its fingerprint matches, counting hits/misses."""
+        if not self.refresh:
+            try:
+                entry = json.loads(self.entry_path(compose_files, kind).read_text())
+                if entry.get("fingerprint") == fingerprint:
+                    self.hits += 1
+                    return entry["config"]
+            except (OSError, ValueError, KeyError):
+                pass
+        self.misses += 1
+        return None
 
-            # Collect env_file list entries
-            if in_env_file_block and current_service:
-                if indent <= env_file_indent and stripped and not stripped.startswith("-"):
-                    in_env_file_block = False
-                    continue
-                ef_match = re.match(r"^-\s*([^\s#]+)", stripped)
-                if ef_match:
-                    ef_path = ef_match.group(1).strip("'\"")
-                    ef_full = (base_dir / ef_path).resolve()
-                    env_vars = parse_env_file(ef_full)
-                    for var_name in env_vars:
-                        service_sources[current_service][var_name] = str(ef_full)
+    def put(
+        self, compose_files: tuple[Path, ...], fingerprint: str, config: dict[str, Any], kind: str = "config"
+    ) -> None:
+        """Store an entry atomically; failures only cost a future cache miss."""
+        path = self.entry_path(compose_files, kind)
+        tmp = path.with_suffix(".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"fingerprint": fingerprint, "config": config}))
+            os.replace(tmp, path)
+        except OSError:
+            pass
 
-    # Start processing from the main compose file
-    extract_env_files_from_compose(compose_file, project_dir)
 
-    return service_sources
+CONFIG_CACHE = ConfigCache()
+
+
+def compose_command(compose_files: Iterable[Path], project_name: str | None = None) -> list[str]:
+    """`docker compose [-p NAME] -f FILE ...`, ready for a subcommand."""
+    cmd = ["docker", "compose"]
+    if project_name:
+        cmd.extend(["-p", project_name])
+    for file_path in compose_files:
+        cmd.extend(["-f", str(file_path)])
+    return cmd
 
 
+@profiled_function
 def get_compose_config(
-    compose_file: Path, project_dir: Path
+    compose_file: Path, project_dir: Path, extra_files: tuple[Path, ...] = (), project_name: str | None = None
 ) -> dict[str, Any] | None:
-    """Get the resolved compose configuration as JSON."""
-    cmd = ["docker", "compose"]
-    if compose_file:
-        cmd.extend(["-f", str(compose_file)])
+    """Get the resolved compose configuration as JSON (under `-p project_name` if given).
+
+    Served from CONFIG_CACHE when none of its inputs changed since the last run.
+    """
+    compose_files = (compose_file, *extra_files)
+    fingerprint = None
+    if CONFIG_CACHE.enabled:
+        fingerprint = CONFIG_CACHE.fingerprint(compose_files, project_dir, project_name)
+        cached = CONFIG_CACHE.get(compose_files, fingerprint)
+        if cached is not None:
+            return cached
+
+    cmd = compose_command(compose_files, project_name)
     cmd.extend(["config", "--format", "json"])
 
     code, stdout, stderr = run_command(cmd, cwd=project_dir)
@@ -355,19 +936,97 @@ def get_compose_config(
         return None
 
     try:
-        return json.loads(stdout)
+        config = json.loads(stdout)
     except json.JSONDecodeError as e:
         print(f"{Colour.RED}Error parsing compose config:{Colour.RESET} {e}")
         return None
 
+    if fingerprint:
+        CONFIG_CACHE.put(compose_files, fingerprint, config)
+    return config
+
+
+@profiled_function
+def get_config_hashes(
+    compose_file: Path, project_dir: Path, extra_files: tuple[Path, ...] = (), project_name: str | None = None
+) -> dict[str, str]:
+    """Get each service's compose config hash via `docker compose config --hash=*`.
+
+    These are the values compose stores in the com.docker.compose.config-hash
+    label when it creates a container. Cached like get_compose_config; empty with
+    --full-diff or if the hashes can't be computed, so every service gets the full diff.
+    """
+    if not CONFIG_HASH_CHECK:
+        return {}
+    compose_files = (compose_file, *extra_files)
+    fingerprint = None
+    if CONFIG_CACHE.enabled:
+        fingerprint = CONFIG_CACHE.fingerprint(compose_files, project_dir, project_name)
+        cached = CONFIG_CACHE.get(compose_files, fingerprint, kind="hashes")
+        if cached is not None:
+            return cached
+
+    cmd = compose_command(compose_files, project_name)
+    cmd.extend(["config", "--hash=*"])
+
+    code, stdout, stderr = run_command(cmd, cwd=project_dir)
+    if code != 0:
+        debug(f"docker compose config --hash failed, using the full config diff: {stderr.strip()}")
+        return {}
+
+    hashes = {}
+    for line in stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            hashes[parts[0]] = parts[1]
+
+    if fingerprint:
+        CONFIG_CACHE.put(compose_files, fingerprint, hashes, kind="hashes")
+    return hashes
+
+
+def resolve_compose(
+    compose_file: Path, project_dir: Path, extra_files: tuple[Path, ...] = (), project_name: str | None = None
+) -> tuple[dict[str, Any] | None, dict[str, dict[str, str]], dict[str, str]]:
+    """(config, env sources, config hashes) for a project, from `docker compose config`.
+
+    project_name is passed as `-p`: needed for projects found from container labels,
+    which may have been started under a name their files don't give.
+
+    With --experimental-native-loader the files are resolved in-process instead.
+    That needs no subprocess but has no config hashes, so every service gets the
+    full config diff. It falls back to the docker compose CLI for anything it
+    can't resolve exactly.
+    """
+    if NATIVE_LOADER:
+        # Imported only when asked for: the loader is experimental and stays out of normal runs
+        from native_loader import ComposeLoadError, load_compose_native
+
+        try:
+            with profiled("function", "load_compose_native"):
+                config, env_sources = load_compose_native(compose_file, project_dir, extra_files, project_name)
+            return config, env_sources, {}
+        except ComposeLoadError as e:
+            debug(f"Native compose loader failed, using docker compose config: {e}")
+    config, env_sources, config_hashes = run_parallel([
+        lambda: get_compose_config(compose_file, project_dir, extra_files, project_name),
+        lambda: get_service_env_sources(compose_file, project_dir, extra_files),
+        lambda: get_config_hashes(compose_file, project_dir, extra_files, project_name),
+    ])
+    return config, env_sources, config_hashes
+
 
 def get_compose_ps(
-    compose_file: Path, project_dir: Path
+    compose_file: Path, project_dir: Path, project_name: str | None = None
 ) -> list[dict[str, Any]]:
     """Get current container states from docker compose ps."""
-    cmd = ["docker", "compose"]
-    if compose_file:
-        cmd.extend(["-f", str(compose_file)])
+    if DOCKER_API and project_name:
+        try:
+            return DOCKER_API.compose_ps(project_name)
+        except DockerAPIError as e:
+            debug(f"Engine API ps failed, falling back to CLI: {e}")
+
+    cmd = compose_command([compose_file] if compose_file else [], project_name)
     cmd.extend(["ps", "--all", "--format", "json"])
 
     code, stdout, stderr = run_command(cmd, cwd=project_dir)
@@ -398,6 +1057,194 @@ def get_container_inspect(container_name: str) -> dict[str, Any] | None:
         return None
 
 
+def chunk_args(args: list[str]) -> list[list[str]]:
+    """Split de-duplicated arguments into chunks that fit on one command line."""
+    chunks: list[list[str]] = []
+    chunk: list[str] = []
+    chunk_len = 0
+    for arg in dict.fromkeys(a for a in args if a):
+        if chunk and (len(chunk) >= INSPECT_CHUNK_SIZE or chunk_len + len(arg) > INSPECT_ARG_BYTES):
+            chunks.append(chunk)
+            chunk, chunk_len = [], 0
+        chunk.append(arg)
+        chunk_len += len(arg) + 1
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def index_inspect(inspects: dict[str, dict[str, Any]], item: dict[str, Any]) -> None:
+    """Make inspect data findable by container name and by ID."""
+    name = item.get("Name", "").lstrip("/")
+    if name:
+        inspects[name] = item
+    if item.get("Id"):
+        inspects.setdefault(item["Id"], item)
+
+
+def get_container_inspects(container_names: list[str]) -> dict[str, dict[str, Any]]:
+    """Inspect many containers with as few `docker inspect` calls as possible.
+
+    Names are passed in chunks to stay well under the OS argument length limit.
+    Returns: {container_name: inspect_data, ...}, missing containers are omitted.
+    """
+    inspects: dict[str, dict[str, Any]] = {}
+
+    if DOCKER_API:
+        names = list(dict.fromkeys(n for n in container_names if n))
+        try:
+            results = run_parallel([lambda name=name: DOCKER_API.inspect_container(name) for name in names])
+        except DockerAPIError as e:
+            debug(f"Engine API inspect failed, falling back to CLI: {e}")
+        else:
+            for item in results:
+                if item:
+                    index_inspect(inspects, item)
+            return inspects
+
+    batches = chunk_args(container_names)
+    results = run_parallel([
+        lambda batch=batch: run_command(["docker", "inspect", *batch]) for batch in batches
+    ])
+
+    for code, stdout, stderr in results:
+        # docker inspect exits non-zero if ANY name is missing but still prints the rest
+        if not stdout.strip():
+            continue
+        try:
+            data = json.loads(stdout)
+        except json.JSONDecodeError:
+            continue
+        for item in data or []:
+            index_inspect(inspects, item)
+
+    return inspects
+
+
+def inspect_key(container: dict[str, Any]) -> str | None:
+    """Container ID and creation time from a `compose ps` entry, or None if ps didn't report them.
+
+    The CLI reports "2024-01-01 12:00:00 +0000 UTC" and the Engine API a Unix
+    timestamp; both become the timestamp so either backend finds the other's snapshots.
+    """
+    container_id = container.get("ID")
+    created = container.get("CreatedAt") or container.get("Created")
+    if isinstance(created, str):
+        try:
+            created = int(datetime.strptime(created[:25], "%Y-%m-%d %H:%M:%S %z").timestamp())
+        except ValueError:
+            pass
+    return f"{container_id}@{created}" if container_id and created else None
+
+
+class InspectStore:
+    """On-disk snapshots of `docker inspect` output, kept between runs.
+
+    One file per compose file, holding {ps ID@creation time: snapshot} for the
+    containers seen on the last run. `docker compose ps` stays the source of
+    truth: a recreated container has a new key and is inspected again, and
+    containers no longer listed are dropped. A snapshot is only reused when the
+    service's config hash matches the container's config-hash label, so the
+    check reads nothing but creation-time fields (image ID, labels) from it.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR) -> None:
+        self.cache_dir = cache_dir / "inspect"
+        self.enabled = True
+        self.refresh = False
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, compose_file: Path) -> Path:
+        # Containers live on the daemon, so snapshots are kept per --hosts label or DOCKER_HOST
+        docker_host = os.environ.get(HOST_LABEL_ENV) or os.environ.get("DOCKER_HOST")
+        source = f"{docker_host}\0{compose_file}" if docker_host else str(compose_file)
+        key = hashlib.sha256(source.encode()).hexdigest()[:32]
+        return self.cache_dir / f"{key}.json"
+
+    def load(self, compose_file: Path) -> dict[str, dict[str, Any]]:
+        """Snapshots from the last run (none with --refresh)."""
+        if self.refresh:
+            return {}
+        try:
+            entry = json.loads(self.entry_path(compose_file).read_text())
+        except (OSError, ValueError):
+            return {}
+        return entry.get("containers", {}) if entry.get("version") == INSPECT_STORE_VERSION else {}
+
+    def save(self, compose_file: Path, snapshots: dict[str, dict[str, Any]]) -> None:
+        """Replace the stored snapshots atomically; failures only cost a future refetch."""
+        path = self.entry_path(compose_file)
+        tmp = path.with_suffix(".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"version": INSPECT_STORE_VERSION, "containers": snapshots}))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+INSPECT_STORE = InspectStore()
+
+
+def inspect_snapshot(item: dict[str, Any]) -> dict[str, Any]:
+    """The creation-time part of inspect data that a hash-matched service is checked against."""
+    config = item.get("Config") or {}
+    return {
+        "Id": item.get("Id", ""),
+        "Name": item.get("Name", ""),
+        "Image": item.get("Image", ""),
+        "Config": {"Image": config.get("Image", ""), "Labels": config.get("Labels") or {}},
+    }
+
+
+@profiled_function
+def get_project_inspects(
+    compose_file: Path, container_map: dict[str, dict[str, Any]], config_hashes: dict[str, str]
+) -> dict[str, dict[str, Any]]:
+    """Inspect a project's containers, reusing snapshots from earlier runs where it's safe.
+
+    A snapshot is reused only if `docker compose ps` still lists the same
+    container ID, creation time and name, and the service's config hash matches
+    the snapshot's config-hash label. Everything else is inspected afresh.
+    """
+    if not INSPECT_STORE.enabled or not config_hashes:
+        return get_container_inspects([c.get("Name", "") for c in container_map.values()])
+
+    stored = INSPECT_STORE.load(compose_file)
+    inspects: dict[str, dict[str, Any]] = {}
+    snapshots: dict[str, dict[str, Any]] = {}
+    pending: list[str] = []
+    for service, container in container_map.items():
+        name = container.get("Name", "")
+        key = inspect_key(container)
+        snapshot = stored.get(key) if key else None
+        labels = (snapshot or {}).get("Config", {}).get("Labels") or {}
+        if (
+            snapshot
+            and snapshot.get("Name", "").lstrip("/") == name
+            and config_hashes.get(service)
+            and labels.get("com.docker.compose.config-hash") == config_hashes[service]
+        ):
+            index_inspect(inspects, snapshot)
+            snapshots[key] = snapshot
+            INSPECT_STORE.hits += 1
+        else:
+            pending.append(name)
+            INSPECT_STORE.misses += 1
+
+    fetched = get_container_inspects(pending)
+    inspects.update(fetched)
+    for container in container_map.values():
+        key = inspect_key(container)
+        item = fetched.get(container.get("Name", ""))
+        # Only store what was inspected as the container ps listed (not one recreated in between)
+        if key and item and item.get("Id", "").startswith(container["ID"]):
+            snapshots[key] = inspect_snapshot(item)
+    INSPECT_STORE.save(compose_file, snapshots)
+    return inspects
+
+
 def get_image_id(image_name: str) -> str | None:
     """Get the ID of a local image."""
     cmd = ["docker", "image", "inspect", image_name, "--format", "{{.Id}}"]
@@ -407,6 +1254,60 @@ def get_image_id(image_name: str) -> str | None:
     return stdout.strip()
 
 
+class ImageResolver:
+    """Resolve image references to local image IDs, memoised for the whole run.
+
+    All distinct references are resolved up front with batched `docker image inspect`
+    calls so the per-service check is a dictionary lookup.
+    """
+
+    def __init__(self) -> None:
+        self.ids: dict[str, str | None] = {}
+
+    def prefetch(self, compose_config: dict[str, Any]) -> None:
+        """Resolve every `image:` referenced by the compose config."""
+        refs = [
+            svc.get("image", "")
+            for svc in compose_config.get("services", {}).values()
+        ]
+        self.resolve(refs)
+
+    def resolve(self, refs: list[str]) -> None:
+        """Resolve any references not already cached."""
+        pending = list(dict.fromkeys(r for r in refs if r and r not in self.ids))
+        if DOCKER_API:
+            try:
+                image_ids = run_parallel([lambda ref=ref: DOCKER_API.image_id(ref) for ref in pending])
+            except DockerAPIError as e:
+                debug(f"Engine API image lookup failed, falling back to CLI: {e}")
+            else:
+                self.ids.update(zip(pending, image_ids))
+                return
+
+        batches = chunk_args(pending)
+        results = run_parallel([
+            lambda batch=batch: run_command(["docker", "image", "inspect", *batch, "--format", "{{.Id}}"])
+            for batch in batches
+        ])
+        fallback: list[str] = []
+        for batch, (code, stdout, stderr) in zip(batches, results):
+            ids = stdout.split()
+            if code == 0 and len(ids) == len(batch):
+                # Output order matches argument order when every image exists
+                self.ids.update(zip(batch, ids))
+            else:
+                # Some images are missing locally: resolve this batch one by one
+                fallback.extend(batch)
+        image_ids = run_parallel([lambda ref=ref: get_image_id(ref) for ref in fallback])
+        self.ids.update(zip(fallback, image_ids))
+
+    def get(self, ref: str) -> str | None:
+        """Return the local image ID for a reference, resolving it if needed."""
+        if ref not in self.ids:
+            self.resolve([ref])
+        return self.ids.get(ref)
+
+
 def normalise_env_list(env: list[str] | dict[str, str] | None) -> dict[str, str]:
     """Convert environment variables to a normalised dict."""
     if env is None:
@@ -460,10 +1361,12 @@ def normalise_volumes(volumes: list[Any] | None) -> set[str]:
     return result
 
 
+@profiled_function
 def check_image_changed(
     service_name: str,
     compose_config: dict[str, Any],
     container_info: dict[str, Any] | None,
+    images: ImageResolver | None = None,
 ) -> RestartReason | None:
     """Check if the local image differs from the running container's image."""
     service_cfg = compose_config.get("services", {}).get(service_name, {})
@@ -476,7 +1379,7 @@ def check_image_changed(
         return None
 
     container_image_id = container_info.get("Image", "")
-    local_image_id = get_image_id(desired_image)
+    local_image_id = images.get(desired_image) if images else get_image_id(desired_image)
 
     if not local_image_id:
         return None
@@ -484,10 +1387,7 @@ def check_image_changed(
     if container_image_id != local_image_id:
         return RestartReason(
             trigger=RestartTrigger.IMAGE_UPDATED,
-            details=[
-                f"Current: {container_image_id[:19]}...",
-                f"Available: {local_image_id[:19]}...",
-            ],
+            changes=[Change("image", desired_image, container_image_id, local_image_id)],
         )
     return None
 
@@ -508,427 +1408,927 @@ def format_env_source(source: str, project_dir: Path) -> str:
         return Path(source).name
 
 
-def check_config_changed(
-    service_name: str,
-    compose_config: dict[str, Any],
-    container_info: dict[str, Any] | None,
-    env_sources: dict[str, str] | None = None,
-    project_dir: Path | None = None,
-) -> RestartReason | None:
-    """Check if the compose config differs from the running container.
+def format_label_diff(cur: str | None, new: str | None) -> str:
+    """Smart diff: show what actually changed in a label value with colour highlighting."""
+    if cur is None:
+        snippet = f"{new[:60]}..." if new and len(new) > 60 else new
+        return f"(missing) → {Colour.GREEN}{snippet}{Colour.RESET}"
+    if new is None:
+        snippet = f"{cur[:60]}..." if len(cur) > 60 else cur
+        return f"{Colour.RED}{snippet}{Colour.RESET} → (removed)"
+
+    # Find first difference
+    min_len = min(len(cur), len(new))
+    diff_start = 0
+    for i in range(min_len):
+        if cur[i] != new[i]:
+            diff_start = i
+            break
+    else:
+        diff_start = min_len  # Difference is in length
+
+    # Show context around difference
+    context_before = 15
+    context_after = 30
+    start = max(0, diff_start - context_before)
+
+    prefix = "..." if start > 0 else ""
+
+    # Split into common prefix, different part, and suffix
+    common_before = cur[start:diff_start]
+    cur_diff = cur[diff_start:diff_start + context_after]
+    new_diff = new[diff_start:diff_start + context_after]
+    cur_suffix = "..." if diff_start + context_after < len(cur) else ""
+    new_suffix = "..." if diff_start + context_after < len(new) else ""
+
+    # Format with colours: red for removed, green for added
+    cur_formatted = f"{prefix}{common_before}{Colour.RED}{cur_diff}{Colour.RESET}{cur_suffix}"
+    new_formatted = f"{prefix}{common_before}{Colour.GREEN}{new_diff}{Colour.RESET}{new_suffix}"
+
+    return f"{cur_formatted} → {new_formatted}"
+
+
+def format_env_change(change: Change) -> str:
+    """Render an environment variable difference with its source."""
+    source = f"{Colour.DIM}({change.source}){Colour.RESET}"
+    if change.old is None:
+        # New variable
+        display_val = change.new if len(change.new) <= 50 else f"{change.new[:50]}..."
+        return f"{Colour.GREEN}+ {change.key}={display_val}{Colour.RESET} {source}"
+    # Changed variable - show diff with source
+    cur_display = change.old if len(change.old) <= 30 else f"{change.old[:30]}..."
+    new_display = change.new if len(change.new) <= 30 else f"{change.new[:30]}..."
+    return (
+        f"{Colour.YELLOW}~ {change.key}: {Colour.RED}{cur_display}{Colour.RESET} → "
+        f"{Colour.GREEN}{new_display}{Colour.RESET} {source}"
+    )
 
-    Key insight: Docker Compose only recreates when something SPECIFIED in compose
-    differs from container. Extra values in container (from base image, Docker
-    defaults) are fine. We check "is compose config satisfied?" not "are they equal?".
-    """
-    if not container_info:
-        return None
 
-    if env_sources is None:
-        env_sources = {}
-    if project_dir is None:
-        project_dir = Path.cwd()
+def render_changes(changes: list[Change]) -> list[str]:
+    """Display lines for a reason's changes.
 
-    service_cfg = compose_config.get("services", {}).get(service_name, {})
-    container_cfg = container_info.get("Config", {})
-    host_cfg = container_info.get("HostConfig", {})
-
-    changed_fields = []
-
-    # Check environment: only flag if a var DEFINED IN COMPOSE is missing/different
-    desired_env = normalise_env_list(service_cfg.get("environment"))
-    current_env = normalise_env_list(container_cfg.get("Env", []))
-
-    env_diffs = []
-    for key, desired_val in sorted(desired_env.items()):
-        current_val = current_env.get(key)
-        # Get source info
-        source = env_sources.get(key, "unknown")
-        source_display = format_env_source(source, project_dir)
-
-        if current_val is None:
-            # New variable
-            display_val = desired_val if len(desired_val) <= 50 else f"{desired_val[:50]}..."
-            env_diffs.append(
-                f"{Colour.GREEN}+ {key}={display_val}{Colour.RESET} {Colour.DIM}({source_display}){Colour.RESET}"
-            )
-        elif current_val != desired_val:
-            # Changed variable - show diff with source
-            cur_display = current_val if len(current_val) <= 30 else f"{current_val[:30]}..."
-            new_display = desired_val if len(desired_val) <= 30 else f"{desired_val[:30]}..."
-            env_diffs.append(
-                f"{Colour.YELLOW}~ {key}: {Colour.RED}{cur_display}{Colour.RESET} → "
-                f"{Colour.GREEN}{new_display}{Colour.RESET} {Colour.DIM}({source_display}){Colour.RESET}"
-            )
-    if env_diffs:
-        changed_fields.append(("environment", env_diffs))
-
-    # Check command - only if explicitly set in compose
-    desired_cmd = service_cfg.get("command")
-    if desired_cmd is not None:
-        current_cmd = container_cfg.get("Cmd")
-        if isinstance(desired_cmd, str):
-            desired_cmd = desired_cmd.split()
-        if current_cmd != desired_cmd:
-            changed_fields.append("command")
-
-    # Check entrypoint - only if explicitly set in compose
-    desired_entry = service_cfg.get("entrypoint")
-    if desired_entry is not None:
-        current_entry = container_cfg.get("Entrypoint")
-        if isinstance(desired_entry, str):
-            desired_entry = [desired_entry]
-        if current_entry != desired_entry:
-            changed_fields.append("entrypoint")
-
-    # Check working directory - only if explicitly set
-    desired_workdir = service_cfg.get("working_dir")
-    if desired_workdir:
-        current_workdir = container_cfg.get("WorkingDir")
-        if desired_workdir != current_workdir:
-            changed_fields.append("working_dir")
-
-    # Check user - only if explicitly set
-    desired_user = service_cfg.get("user")
-    if desired_user is not None:
-        current_user = container_cfg.get("User") or ""
-        if str(desired_user) != str(current_user):
-            changed_fields.append("user")
-
-    # Check labels: only verify labels DEFINED IN COMPOSE exist with correct values
-    desired_labels = service_cfg.get("labels", {})
-    if isinstance(desired_labels, list):
-        desired_labels = dict(item.split("=", 1) for item in desired_labels if "=" in item)
-    if desired_labels:
-        current_labels = container_cfg.get("Labels", {})
-        label_diffs = []
-        for key, desired_val in desired_labels.items():
-            current_val = current_labels.get(key)
-            # Unescape $$ -> $ in desired value (compose escape sequence)
-            desired_val_normalised = desired_val.replace("$$", "$") if desired_val else desired_val
-            if current_val != desired_val_normalised:
-                # Smart diff: show what actually changed with colour highlighting
-                def format_label_diff(cur: str | None, new: str | None) -> str:
-                    if cur is None:
-                        snippet = f"{new[:60]}..." if new and len(new) > 60 else new
-                        return f"(missing) → {Colour.GREEN}{snippet}{Colour.RESET}"
-                    if new is None:
-                        snippet = f"{cur[:60]}..." if len(cur) > 60 else cur
-                        return f"{Colour.RED}{snippet}{Colour.RESET} → (removed)"
-
-                    # Find first difference
-                    min_len = min(len(cur), len(new))
-                    diff_start = 0
-                    for i in range(min_len):
-                        if cur[i] != new[i]:
-                            diff_start = i
-                            break
-                    else:
-                        diff_start = min_len  # Difference is in length
-
-                    # Show context around difference
-                    context_before = 15
-                    context_after = 30
-                    start = max(0, diff_start - context_before)
-
-                    prefix = "..." if start > 0 else ""
-
-                    # Split into common prefix, different part, and suffix
-                    common_before = cur[start:diff_start]
-                    cur_diff = cur[diff_start:diff_start + context_after]
-                    new_diff = new[diff_start:diff_start + context_after]
-                    cur_suffix = "..." if diff_start + context_after < len(cur) else ""
-                    new_suffix = "..." if diff_start + context_after < len(new) else ""
-
-                    # Format with colours: red for removed, green for added
-                    cur_formatted = f"{prefix}{common_before}{Colour.RED}{cur_diff}{Colour.RESET}{cur_suffix}"
-                    new_formatted = f"{prefix}{common_before}{Colour.GREEN}{new_diff}{Colour.RESET}{new_suffix}"
-
-                    return f"{cur_formatted} → {new_formatted}"
-
-                label_diffs.append(f"{key}: {format_label_diff(current_val, desired_val_normalised)}")
-                if DEBUG:
-                    print(f"  [DEBUG] {service_name} label mismatch: {key}")
-                    print(f"    compose (normalised): {desired_val_normalised!r}")
-                    print(f"    current: {current_val!r}")
-        if label_diffs:
-            changed_fields.append(("labels", label_diffs))
-
-    # Check ports: verify compose-specified ports are present
-    # Normalise to comparable format: "host_port:container_port/protocol"
-    desired_ports_raw = service_cfg.get("ports", [])
-    if desired_ports_raw:
-        current_port_bindings = host_cfg.get("PortBindings", {}) or {}
-
-        # Build lookup of current ports: container_port/proto -> set of host_ports
-        current_port_map: dict[str, set[str]] = {}
-        for port_proto, bindings in current_port_bindings.items():
-            if bindings:
-                current_port_map[port_proto] = {b.get("HostPort", "") for b in bindings}
-
-        ports_match = True
-        for port in desired_ports_raw:
-            if isinstance(port, dict):
-                target = port.get("target")
-                published = port.get("published")
-                protocol = port.get("protocol", "tcp")
-            elif isinstance(port, str) and ":" in port:
-                # Parse "host:container" or "host:container/proto"
-                parts = port.replace("/", ":").split(":")
-                published = parts[0] if len(parts) >= 2 else None
-                target = parts[1] if len(parts) >= 2 else parts[0]
-                protocol = parts[2] if len(parts) >= 3 else "tcp"
+    Environment and label changes are listed per key under a "field:" heading,
+    image changes as current/available IDs, anything else as its field name.
+    """
+    lines: list[str] = []
+    seen: set[str] = set()
+    for change in changes:
+        if change.field == "image":
+            lines.append(f"Current: {change.old[:19]}...")
+            lines.append(f"Available: {change.new[:19]}...")
+        elif change.field in ("environment", "labels"):
+            if change.field not in seen:
+                lines.append(f"{change.field}:")
+            if change.field == "environment":
+                lines.append(f"  {format_env_change(change)}")
             else:
-                continue
+                lines.append(f"  {change.key}: {format_label_diff(change.old, change.new)}")
+        elif change.field not in seen:
+            lines.append(change.field)
+        seen.add(change.field)
+    return lines
 
-            if published and target:
-                container_port_key = f"{target}/{protocol}"
-                current_host_ports = current_port_map.get(container_port_key, set())
-                if str(published) not in current_host_ports:
-                    ports_match = False
-                    break
-
-        if not ports_match:
-            changed_fields.append("ports")
-
-    # Check volumes: verify compose-specified mounts are present
-    desired_volumes_raw = service_cfg.get("volumes", [])
-    if desired_volumes_raw:
-        current_mounts = container_info.get("Mounts", [])
-        # Build lookup by destination
-        current_mount_map = {m.get("Destination"): m for m in current_mounts}
-
-        volumes_match = True
-        for vol in desired_volumes_raw:
-            if isinstance(vol, dict):
-                target = vol.get("target")
-                source = vol.get("source")
-            elif isinstance(vol, str) and ":" in vol:
-                parts = vol.split(":")
-                source = parts[0]
-                target = parts[1] if len(parts) >= 2 else parts[0]
-            else:
-                continue
 
-            if target:
-                current_mount = current_mount_map.get(target)
-                if not current_mount:
-                    volumes_match = False
-                    break
-                # For bind mounts, verify source matches
-                if source and current_mount.get("Type") == "bind":
-                    if current_mount.get("Source") != source:
-                        volumes_match = False
-                        break
-
-        if not volumes_match:
-            changed_fields.append("volumes")
-
-    # Check networks: only if explicitly specified in compose
-    desired_networks = service_cfg.get("networks")
-    if desired_networks:
-        if isinstance(desired_networks, dict):
-            desired_network_names = set(desired_networks.keys())
-        elif isinstance(desired_networks, list):
-            desired_network_names = set(desired_networks)
-        else:
-            desired_network_names = set()
-
-        if desired_network_names:
-            network_settings = container_info.get("NetworkSettings", {})
-            current_networks = set(network_settings.get("Networks", {}).keys())
-
-            # Normalise: strip project prefix, handle full paths
-            def normalise_net(name: str) -> str:
-                if "/" in name:
-                    name = name.split("/")[-1]
-                return name
-
-            normalised_desired = {normalise_net(n) for n in desired_network_names}
-            # Current networks have project prefix, try to match base names
-            normalised_current = set()
-            for n in current_networks:
-                normalised_current.add(n)
-                # Also add without project prefix
-                if "_" in n:
-                    normalised_current.add(n.split("_", 1)[-1])
-
-            if not normalised_desired.issubset(normalised_current):
-                changed_fields.append("networks")
-
-    # Check capabilities: only if explicitly specified, check subset
-    # Normalise cap names: Docker uses CAP_X internally, compose often uses X
-    def normalise_cap(cap: str) -> str:
-        cap = cap.upper()
-        if not cap.startswith("CAP_"):
-            cap = f"CAP_{cap}"
-        return cap
-
-    desired_cap_add = {normalise_cap(c) for c in service_cfg.get("cap_add", [])}
-    desired_cap_drop = {normalise_cap(c) for c in service_cfg.get("cap_drop", [])}
-
-    if desired_cap_add or desired_cap_drop:
-        current_cap_add = {normalise_cap(c) for c in (host_cfg.get("CapAdd") or [])}
-        current_cap_drop = {normalise_cap(c) for c in (host_cfg.get("CapDrop") or [])}
-        # Desired caps should be subset of current (container may have more)
-        missing_cap_add = desired_cap_add - current_cap_add
-        missing_cap_drop = desired_cap_drop - current_cap_drop
-        if missing_cap_add:
-            if DEBUG:
-                print(f"  [DEBUG] {service_name} missing cap_add: {missing_cap_add}")
+@dataclass
+class ServiceContext:
+    """What a comparator needs to know about the service beyond its compose config."""
+
+    name: str
+    env_sources: dict[str, str] = field(default_factory=dict)
+    project_dir: Path = field(default_factory=Path.cwd)
+
+
+class FieldComparator(ABC):
+    """Checks one compose field against a container's inspect data.
+
+    prepare() normalises the compose side of a service once per config (None
+    when compose doesn't set the field, so there's nothing to check); compare()
+    returns the differences against one container. As everywhere in
+    check_config_changed, a difference means something compose SPECIFIES isn't
+    satisfied: extra values on the container (image defaults, Docker defaults) are fine.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        """The compose side of the field, normalised; None if compose doesn't set it."""
+
+    @abstractmethod
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        """Differences between `desired` (from prepare) and one container."""
+
+
+# Comparators by field name, in the order their changes are reported
+COMPARATORS: dict[str, FieldComparator] = {}
+
+
+def register_comparator(cls: type[FieldComparator]) -> type[FieldComparator]:
+    """Class decorator adding a comparator to COMPARATORS.
+
+    Instantiating it here makes a comparator missing prepare() or compare()
+    fail at import (TypeError) rather than on the first service it checks.
+    """
+    if not cls.name or cls.name in COMPARATORS:
+        raise TypeError(f"{cls.__name__}: comparator name {cls.name!r} is empty or already registered")
+    COMPARATORS[cls.name] = cls()
+    return cls
+
+
+@register_comparator
+class EnvironmentComparator(FieldComparator):
+    """Only flag a variable DEFINED IN COMPOSE that is missing or different."""
+
+    name = "environment"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        return sorted(normalise_env_list(service_cfg.get("environment")).items()) or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_env = normalise_env_list(container.get("Config", {}).get("Env", []))
+        changes = []
+        for key, desired_val in desired:
+            current_val = current_env.get(key)
+            if current_val != desired_val:
+                # Missing or changed variable, with where its value comes from
+                source = format_env_source(service.env_sources.get(key, "unknown"), service.project_dir)
+                changes.append(Change("environment", key, current_val, desired_val, source))
+        return changes
+
+
+@register_comparator
+class CommandComparator(FieldComparator):
+    """Command, only if explicitly set in compose."""
+
+    name = "command"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired_cmd = service_cfg.get("command")
+        return desired_cmd.split() if isinstance(desired_cmd, str) else desired_cmd
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_cmd = container.get("Config", {}).get("Cmd")
+        return [Change("command", old=current_cmd, new=desired)] if current_cmd != desired else []
+
+
+@register_comparator
+class EntrypointComparator(FieldComparator):
+    """Entrypoint, only if explicitly set in compose."""
+
+    name = "entrypoint"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired_entry = service_cfg.get("entrypoint")
+        return [desired_entry] if isinstance(desired_entry, str) else desired_entry
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_entry = container.get("Config", {}).get("Entrypoint")
+        return [Change("entrypoint", old=current_entry, new=desired)] if current_entry != desired else []
+
+
+@register_comparator
+class WorkingDirComparator(FieldComparator):
+    """Working directory, only if explicitly set."""
+
+    name = "working_dir"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        return service_cfg.get("working_dir") or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_workdir = container.get("Config", {}).get("WorkingDir")
+        return [Change("working_dir", old=current_workdir, new=desired)] if desired != current_workdir else []
+
+
+@register_comparator
+class UserComparator(FieldComparator):
+    """User, only if explicitly set."""
+
+    name = "user"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired_user = service_cfg.get("user")
+        return None if desired_user is None else str(desired_user)
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_user = container.get("Config", {}).get("User") or ""
+        return [Change("user", old=current_user, new=desired)] if desired != str(current_user) else []
+
+
+@register_comparator
+class LabelsComparator(FieldComparator):
+    """Only verify labels DEFINED IN COMPOSE exist with the right values."""
+
+    name = "labels"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired_labels = service_cfg.get("labels") or {}
+        if isinstance(desired_labels, list):
+            desired_labels = dict(item.split("=", 1) for item in desired_labels if "=" in item)
+        # Unescape $$ -> $ in desired values (compose escape sequence)
+        return [
+            (key, value.replace("$$", "$") if value else value) for key, value in desired_labels.items()
+        ] or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_labels = container.get("Config", {}).get("Labels", {})
+        changes = []
+        for key, desired_val in desired:
+            current_val = current_labels.get(key)
+            if current_val != desired_val:
+                changes.append(Change("labels", key, current_val, desired_val))
+                if DEBUG:
+                    print(f"  [DEBUG] {service.name} label mismatch: {key}")
+                    print(f"    compose (normalised): {desired_val!r}")
+                    print(f"    current: {current_val!r}")
+        return changes
+
+
+@register_comparator
+class PortsComparator(FieldComparator):
+    """Compose-specified published ports, as ("container_port/protocol", host_port) pairs."""
+
+    name = "ports"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired = []
+        for port in service_cfg.get("ports") or []:
+            if isinstance(port, dict):
+                target = port.get("target")
+                published = port.get("published")
+                protocol = port.get("protocol", "tcp")
+            elif isinstance(port, str) and ":" in port:
+                # Parse "host:container" or "host:container/proto"
+                parts = port.replace("/", ":").split(":")
+                published = parts[0] if len(parts) >= 2 else None
+                target = parts[1] if len(parts) >= 2 else parts[0]
+                protocol = parts[2] if len(parts) >= 3 else "tcp"
+            else:
+                continue
+            if published and target:
+                desired.append((f"{target}/{protocol}", str(published)))
+        return desired or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_port_bindings = container.get("HostConfig", {}).get("PortBindings", {}) or {}
+        changes = []
+        for container_port_key, published in desired:
+            bindings = current_port_bindings.get(container_port_key) or []
+            current_host_ports = {b.get("HostPort", "") for b in bindings}
+            if published not in current_host_ports:
+                changes.append(Change(
+                    "ports", container_port_key, ",".join(sorted(current_host_ports)) or None, published
+                ))
+        return changes
+
+
+@register_comparator
+class VolumesComparator(FieldComparator):
+    """Compose-specified mounts, as (target, source) pairs."""
+
+    name = "volumes"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired = []
+        for vol in service_cfg.get("volumes") or []:
+            if isinstance(vol, dict):
+                target = vol.get("target")
+                source = vol.get("source")
+            elif isinstance(vol, str) and ":" in vol:
+                parts = vol.split(":")
+                source = parts[0]
+                target = parts[1] if len(parts) >= 2 else parts[0]
+            else:
+                continue
+            if target:
+                desired.append((target, source))
+        return desired or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_mount_map = {m.get("Destination"): m for m in container.get("Mounts", [])}
+        changes = []
+        for target, source in desired:
+            current_mount = current_mount_map.get(target)
+            if not current_mount:
+                changes.append(Change("volumes", target, None, source))
+            # For bind mounts, verify source matches
+            elif source and current_mount.get("Type") == "bind" and current_mount.get("Source") != source:
+                changes.append(Change("volumes", target, current_mount.get("Source"), source))
+        return changes
+
+
+@register_comparator
+class NetworksComparator(FieldComparator):
+    """Networks, only if explicitly specified in compose."""
+
+    name = "networks"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired_networks = service_cfg.get("networks")
+        if not isinstance(desired_networks, (dict, list)):
+            return None
+        # Normalise: strip project prefix, handle full paths
+        return {name.split("/")[-1] for name in desired_networks} or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current_networks = set(container.get("NetworkSettings", {}).get("Networks", {}).keys())
+        # Current networks have the project prefix: also match their base names
+        normalised_current = set(current_networks)
+        normalised_current.update(n.split("_", 1)[-1] for n in current_networks if "_" in n)
+        if desired.issubset(normalised_current):
+            return []
+        return [Change("networks", old=sorted(current_networks), new=sorted(desired))]
+
+
+def normalise_cap(cap: str) -> str:
+    """Docker uses CAP_X internally, compose often uses X."""
+    cap = cap.upper()
+    if not cap.startswith("CAP_"):
+        cap = f"CAP_{cap}"
+    return cap
+
+
+@register_comparator
+class CapabilitiesComparator(FieldComparator):
+    """cap_add/cap_drop, only if explicitly specified; the container may have more."""
+
+    name = "capabilities"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired_cap_add = {normalise_cap(c) for c in service_cfg.get("cap_add", [])}
+        desired_cap_drop = {normalise_cap(c) for c in service_cfg.get("cap_drop", [])}
+        return (desired_cap_add, desired_cap_drop) if desired_cap_add or desired_cap_drop else None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        desired_cap_add, desired_cap_drop = desired
+        host_cfg = container.get("HostConfig", {})
+        current_cap_add = {normalise_cap(c) for c in (host_cfg.get("CapAdd") or [])}
+        current_cap_drop = {normalise_cap(c) for c in (host_cfg.get("CapDrop") or [])}
+        # Desired caps should be a subset of current
+        missing_cap_add = desired_cap_add - current_cap_add
+        missing_cap_drop = desired_cap_drop - current_cap_drop
+        if missing_cap_add:
+            if DEBUG:
+                print(f"  [DEBUG] {service.name} missing cap_add: {missing_cap_add}")
                 print(f"    desired: {desired_cap_add}")
                 print(f"    current: {current_cap_add}")
-            changed_fields.append("capabilities")
-        elif missing_cap_drop:
+            return [Change("capabilities", "cap_add", sorted(current_cap_add), sorted(desired_cap_add))]
+        if missing_cap_drop:
             if DEBUG:
-                print(f"  [DEBUG] {service_name} missing cap_drop: {missing_cap_drop}")
+                print(f"  [DEBUG] {service.name} missing cap_drop: {missing_cap_drop}")
                 print(f"    desired: {desired_cap_drop}")
                 print(f"    current: {current_cap_drop}")
-            changed_fields.append("capabilities")
-
-    # Check resource limits
-    desired_deploy = service_cfg.get("deploy", {})
-    desired_resources = desired_deploy.get("resources", {})
-    if desired_resources:
-        limits = desired_resources.get("limits", {})
-        if limits.get("memory") or limits.get("cpus"):
-            current_memory = host_cfg.get("Memory", 0)
-            current_cpus = host_cfg.get("NanoCpus", 0)
-            # Basic check - if limits are specified but differ
-            if limits.get("memory") and current_memory == 0:
-                changed_fields.append("resources")
-            elif limits.get("cpus") and current_cpus == 0:
-                changed_fields.append("resources")
-
-    if changed_fields:
-        # Flatten changed_fields: some are strings, some are (name, [details]) tuples
-        details = []
-        for item in changed_fields:
-            if isinstance(item, tuple):
-                field_name, field_details = item
-                details.append(f"{field_name}:")
-                for detail in field_details:
-                    details.append(f"  {detail}")
+            return [Change("capabilities", "cap_drop", sorted(current_cap_drop), sorted(desired_cap_drop))]
+        return []
+
+
+@register_comparator
+class ResourcesComparator(FieldComparator):
+    """Memory/CPU limits: basic check that limits set in compose are set at all."""
+
+    name = "resources"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        limits = ((service_cfg.get("deploy") or {}).get("resources") or {}).get("limits") or {}
+        return limits if limits.get("memory") or limits.get("cpus") else None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        host_cfg = container.get("HostConfig", {})
+        current_memory = host_cfg.get("Memory", 0)
+        current_cpus = host_cfg.get("NanoCpus", 0)
+        if desired.get("memory") and current_memory == 0:
+            return [Change("resources", "memory", current_memory, desired.get("memory"))]
+        if desired.get("cpus") and current_cpus == 0:
+            return [Change("resources", "cpus", current_cpus, desired.get("cpus"))]
+        return []
+
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h)")
+DURATION_FULL_RE = re.compile(rf"(?:{DURATION_RE.pattern})+")
+DURATION_NS = {"ns": 1, "us": 1_000, "µs": 1_000, "ms": 1_000_000, "s": 10**9, "m": 60 * 10**9, "h": 3600 * 10**9}
+
+
+def parse_duration(value: Any) -> int | None:
+    """Compose duration ("1m30s", or nanoseconds) in nanoseconds, as inspect reports them."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if not isinstance(value, str) or not DURATION_FULL_RE.fullmatch(value):
+        return None
+    return int(sum(float(number) * DURATION_NS[unit] for number, unit in DURATION_RE.findall(value)))
+
+
+@register_comparator
+class HealthcheckComparator(FieldComparator):
+    """Healthcheck settings specified in compose, against Config.Healthcheck."""
+
+    name = "healthcheck"
+
+    # compose key -> inspect key, for the durations
+    DURATIONS = {
+        "interval": "Interval",
+        "timeout": "Timeout",
+        "start_period": "StartPeriod",
+        "start_interval": "StartInterval",
+    }
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        healthcheck = service_cfg.get("healthcheck")
+        if not healthcheck:
+            return None
+        if healthcheck.get("disable"):
+            return {"Test": ["NONE"]}
+        desired: dict[str, Any] = {}
+        test = healthcheck.get("test")
+        if test:
+            desired["Test"] = ["CMD-SHELL", test] if isinstance(test, str) else list(test)
+        for key, inspect_key in self.DURATIONS.items():
+            duration = parse_duration(healthcheck.get(key))
+            if duration is not None:
+                desired[inspect_key] = duration
+        if healthcheck.get("retries") is not None:
+            desired["Retries"] = int(healthcheck["retries"])
+        return desired or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current = container.get("Config", {}).get("Healthcheck") or {}
+        return [
+            Change("healthcheck", key, current.get(key), value)
+            for key, value in desired.items() if current.get(key) != value
+        ]
+
+
+@register_comparator
+class DevicesComparator(FieldComparator):
+    """Device mappings specified in compose, as (host path, container path, permissions)."""
+
+    name = "devices"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired = []
+        for device in service_cfg.get("devices") or []:
+            if isinstance(device, dict):
+                source = device.get("source", "")
+                target = device.get("target") or source
+                permissions = device.get("permissions") or ""
             else:
-                details.append(item)
-        return RestartReason(
-            trigger=RestartTrigger.CONFIG_CHANGED,
-            details=details,
-        )
-    return None
+                source, _, rest = str(device).partition(":")
+                target, _, permissions = rest.partition(":")
+                target = target or source
+            # CDI names (vendor.com/class=name) become device requests, not mappings
+            if source.startswith("/"):
+                desired.append((source, target, permissions))
+        return desired or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current = {
+            (d.get("PathOnHost"), d.get("PathInContainer")): d.get("CgroupPermissions", "")
+            for d in container.get("HostConfig", {}).get("Devices") or []
+        }
+        changes = []
+        for source, target, permissions in desired:
+            if (source, target) not in current:
+                changes.append(Change("devices", target, None, source))
+            elif permissions and current[(source, target)] != permissions:
+                changes.append(Change("devices", target, current[(source, target)], permissions))
+        return changes
+
+
+@register_comparator
+class UlimitsComparator(FieldComparator):
+    """Ulimits specified in compose, as {name: (soft, hard)}."""
+
+    name = "ulimits"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        desired = {}
+        for name, limit in (service_cfg.get("ulimits") or {}).items():
+            if isinstance(limit, dict):
+                single = limit.get("single")
+                soft = limit.get("soft", single)
+                hard = limit.get("hard", single)
+            else:
+                soft = hard = limit
+            desired[name] = (int(soft), int(hard))
+        return desired or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current = {
+            u.get("Name"): (u.get("Soft"), u.get("Hard"))
+            for u in container.get("HostConfig", {}).get("Ulimits") or []
+        }
+        return [
+            Change("ulimits", name, list(current[name]) if name in current else None, list(limit))
+            for name, limit in desired.items() if current.get(name) != limit
+        ]
+
+
+@register_comparator
+class SysctlsComparator(FieldComparator):
+    """Kernel parameters specified in compose."""
+
+    name = "sysctls"
+
+    def prepare(self, service_cfg: dict[str, Any]) -> Any:
+        sysctls = service_cfg.get("sysctls") or {}
+        if isinstance(sysctls, list):
+            sysctls = dict(item.split("=", 1) for item in sysctls if "=" in item)
+        return {key: str(value) for key, value in sysctls.items()} or None
+
+    def compare(self, desired: Any, container: dict[str, Any], service: ServiceContext) -> list[Change]:
+        current = container.get("HostConfig", {}).get("Sysctls") or {}
+        return [
+            Change("sysctls", key, current.get(key), value)
+            for key, value in desired.items() if current.get(key) != value
+        ]
 
 
-def build_dependency_graph(
+# Fields compared by check_config_changed: every registered one unless narrowed by --fields/--skip-fields
+CONFIG_FIELDS = tuple(COMPARATORS)
+
+
+def prepare_service(service_cfg: dict[str, Any], fields: Iterable[str] | None = None) -> dict[str, Any]:
+    """Normalised compose side of each field the service sets, ready for check_config_changed."""
+    prepared = {}
+    for name in CONFIG_FIELDS if fields is None else fields:
+        desired = COMPARATORS[name].prepare(service_cfg)
+        if desired is not None:
+            prepared[name] = desired
+    return prepared
+
+
+@profiled_function
+def check_config_changed(
+    service_name: str,
     compose_config: dict[str, Any],
-) -> dict[str, list[str]]:
-    """Build a mapping of service -> services it depends on."""
-    services = compose_config.get("services", {})
-    dependencies: dict[str, list[str]] = {}
-
-    for service_name, service_cfg in services.items():
-        deps = []
-
-        # Handle depends_on (both list and dict formats)
-        depends_on = service_cfg.get("depends_on", {})
-        if isinstance(depends_on, list):
-            deps.extend(depends_on)
-        elif isinstance(depends_on, dict):
-            deps.extend(depends_on.keys())
-
-        # Handle links (legacy)
-        links = service_cfg.get("links", [])
-        for link in links:
-            # Links can be "service" or "service:alias"
-            dep_service = link.split(":")[0]
-            if dep_service not in deps:
-                deps.append(dep_service)
-
-        dependencies[service_name] = deps
-
-    return dependencies
-
-
-def build_dependents_graph(
-    dependencies: dict[str, list[str]],
-) -> dict[str, list[str]]:
-    """Build inverse mapping: service -> services that depend on it."""
-    dependents: dict[str, list[str]] = {name: [] for name in dependencies}
-
-    for service, deps in dependencies.items():
-        for dep in deps:
-            if dep in dependents:
-                dependents[dep].append(service)
-
-    return dependents
-
-
-def propagate_dependency_restarts(
-    statuses: dict[str, ServiceStatus],
-    dependents_graph: dict[str, list[str]],
-) -> None:
-    """Mark services as needing restart if their dependencies need restart."""
-    # Find all services that need restart for direct reasons
-    needs_restart = {
-        name for name, status in statuses.items()
-        if status.needs_restart and not any(
-            r.trigger == RestartTrigger.DEPENDENCY_RESTART for r in status.reasons
-        )
-    }
+    container_info: dict[str, Any] | None,
+    env_sources: dict[str, str] | None = None,
+    project_dir: Path | None = None,
+    prepared: dict[str, Any] | None = None,
+) -> RestartReason | None:
+    """Check if the compose config differs from the running container.
 
-    # BFS to propagate to dependents
-    to_process = list(needs_restart)
-    processed = set()
+    Key insight: Docker Compose only recreates when something SPECIFIED in compose
+    differs from container. Extra values in container (from base image, Docker
+    defaults) are fine. We check "is compose config satisfied?" not "are they equal?".
 
-    while to_process:
-        current = to_process.pop(0)
-        if current in processed:
-            continue
-        processed.add(current)
+    Each field is checked by its comparator in COMPARATORS. `prepared` is the
+    service's compose side from prepare_service(); it's computed here if not given.
+    """
+    if not container_info:
+        return None
 
-        for dependent in dependents_graph.get(current, []):
-            if dependent not in statuses:
-                continue
+    if prepared is None:
+        prepared = prepare_service(compose_config.get("services", {}).get(service_name, {}))
+    service = ServiceContext(service_name, env_sources or {}, project_dir or Path.cwd())
 
-            status = statuses[dependent]
+    changes: list[Change] = []
+    for name, desired in prepared.items():
+        with profiled("comparator", name):
+            changes.extend(COMPARATORS[name].compare(desired, container_info, service))
 
-            # Check if already has DEPENDENCY_RESTART reason from this service
-            has_dep_reason = any(
-                r.trigger == RestartTrigger.DEPENDENCY_RESTART
-                for r in status.reasons
-            )
+    if changes:
+        return RestartReason(trigger=RestartTrigger.CONFIG_CHANGED, changes=changes)
+    return None
+
+
+def propagate_restarts(graph: DependencyGraph, statuses: dict[str, ServiceStatus]) -> None:
+    """Mark services as needing restart if any of their dependencies need restart.
+
+    Each dependent gets one DEPENDENCY_RESTART reason listing every direct
+    dependency that is restarting, in declaration order.
+    """
+    # Services that need restart for direct reasons, and the dependency reason
+    # each of the others already has (if any)
+    roots: list[str] = []
+    dependency_reasons: dict[str, RestartReason] = {}
+    for name, status in statuses.items():
+        for reason in status.reasons:
+            if reason.trigger == RestartTrigger.DEPENDENCY_RESTART:
+                dependency_reasons[name] = reason
+                break
+        else:
+            if status.needs_restart:
+                roots.append(name)
+
+    for name, triggers in graph.restarting_dependents(roots, statuses).items():
+        reason = dependency_reasons.get(name)
+        if reason is None:
+            statuses[name].reasons.append(RestartReason(RestartTrigger.DEPENDENCY_RESTART, triggers))
+        else:
+            reason.details.extend(dep for dep in triggers if dep not in reason.details)
+        statuses[name].needs_restart = True
 
-            if not has_dep_reason:
-                # Add dependency restart reason
-                existing_deps = []
-                for r in status.reasons:
-                    if r.trigger == RestartTrigger.DEPENDENCY_RESTART:
-                        existing_deps = r.details
-                        break
-
-                if current not in existing_deps:
-                    existing_deps.append(current)
-
-                # Find or create the dependency reason
-                found = False
-                for r in status.reasons:
-                    if r.trigger == RestartTrigger.DEPENDENCY_RESTART:
-                        if current not in r.details:
-                            r.details.append(current)
-                        found = True
-                        break
-
-                if not found:
+
+@dataclass
+class ProjectState:
+    """Everything gathered while analysing a project.
+
+    Kept so watch mode can re-check only the services affected by a change.
+    `direct` holds each service's own restart reasons, before dependency propagation;
+    `prepared` each service's compose side for the config comparators (see prepare_service).
+    """
+
+    compose_file: Path
+    project_dir: Path
+    config: dict[str, Any]
+    env_sources: dict[str, dict[str, str]]
+    container_map: dict[str, dict[str, Any]]
+    inspects: dict[str, dict[str, Any]]
+    images: ImageResolver
+    graph: DependencyGraph = field(default_factory=lambda: DependencyGraph({}))
+    direct: dict[str, ServiceStatus] = field(default_factory=dict)
+    extra_files: tuple[Path, ...] = ()
+    config_hashes: dict[str, str] = field(default_factory=dict)
+    prepared: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # `-p` name the project was started under (from container labels); None = as its files say
+    project_name: str | None = None
+    # Dependency cycles already warned about, each rotated to start at its smallest name
+    reported_cycles: set[tuple[str, ...]] = field(default_factory=set)
+
+    @property
+    def name(self) -> str:
+        """The compose project name."""
+        return self.project_name or self.config.get("name") or self.project_dir.name
+
+    def rebuild_graph(self) -> None:
+        """Recompute the dependency graph from the current config.
+
+        Cycles are warned about when they appear, not again on every watch/serve reload.
+        """
+        self.graph = DependencyGraph.from_config(self.config)
+        cycles: dict[tuple[str, ...], list[str]] = {}
+        for cycle in self.graph.cycles:
+            ring = cycle[:-1]
+            start = ring.index(min(ring))
+            cycles[tuple(ring[start:] + ring[:start])] = cycle
+        for key, cycle in cycles.items():
+            if key not in self.reported_cycles:
+                print(
+                    f"{Colour.YELLOW}Warning:{Colour.RESET} dependency cycle in "
+                    f"{self.config.get('name') or self.compose_file}: {' → '.join(cycle)}",
+                    file=sys.stderr,
+                )
+        self.reported_cycles = set(cycles)
+
+    def check(self, service_names: Iterable[str] | None = None) -> None:
+        """(Re-)check the given services, or all of them."""
+        services = self.config.get("services", {})
+        if service_names is None:
+            service_names = services
+        for service_name in service_names:
+            if service_name in services:
+                with profiled("service", service_name):
+                    self.direct[service_name] = check_service(service_name, self)
+            else:
+                self.direct.pop(service_name, None)
+        # Keep compose file order so output is stable
+        self.direct = {name: self.direct[name] for name in services if name in self.direct}
+
+    def _status(self, name: str) -> ServiceStatus:
+        """Copy of a service's direct status, ready for dependency propagation."""
+        status = self.direct[name]
+        return replace(
+            status,
+            reasons=list(status.reasons),
+            dependencies=self.graph.dependencies.get(name, []),
+            dependents=self.graph.dependents.get(name, []),
+        )
+
+    def statuses(self) -> dict[str, ServiceStatus]:
+        """Service statuses with dependency restarts propagated."""
+        statuses = {name: self._status(name) for name in self.direct}
+        propagate_restarts(self.graph, statuses)
+        return statuses
+
+    def iter_statuses(self) -> Iterator[ServiceStatus]:
+        """Check services in dependency order, yielding each once its status is final.
+
+        A service's status is final as soon as it and its dependencies have been
+        checked, so callers can act on early services while later ones are still
+        being checked. Services on dependency cycles come last.
+        """
+        services = self.config.get("services", {})
+        final: dict[str, ServiceStatus] = {}
+        for name in self.graph.order:
+            if name not in services:
+                continue
+            with phase("check"):
+                if name not in self.direct:
+                    with profiled("service", name):
+                        self.direct[name] = check_service(name, self)
+                status = self._status(name)
+                triggers = [
+                    dep for dep in status.dependencies if dep in final and final[dep].needs_restart
+                ]
+                if triggers:
+                    status.needs_restart = True
                     status.reasons.append(
-                        RestartReason(
-                            trigger=RestartTrigger.DEPENDENCY_RESTART,
-                            details=[current],
-                        )
+                        RestartReason(trigger=RestartTrigger.DEPENDENCY_RESTART, details=triggers)
                     )
-                status.needs_restart = True
+            final[name] = status
+            yield status
+
+        remaining = [name for name in services if name not in final]
+        if remaining:
+            with phase("check"):
+                self.check(name for name in remaining if name not in self.direct)
+                statuses = self.statuses()
+            for name in remaining:
+                yield statuses[name]
+
+    def reload_config(self) -> set[str]:
+        """Re-resolve compose config after a file change; re-check services whose config changed."""
+        config, env_sources, config_hashes = resolve_compose(
+            self.compose_file, self.project_dir, self.extra_files, self.project_name
+        )
+        if not config:
+            # Mid-edit or invalid file: keep the last good analysis
+            return set()
+
+        old_services = self.config.get("services", {})
+        new_services = config.get("services", {})
+        affected = {
+            name for name in old_services.keys() | new_services.keys()
+            if old_services.get(name) != new_services.get(name)
+            or self.env_sources.get(name) != env_sources.get(name)
+        }
+        self.config, self.env_sources, self.config_hashes = config, env_sources, config_hashes
+        for name in affected:
+            self.prepared.pop(name, None)
+        self.images.prefetch(config)
+        # The diff may now read fields a stored snapshot doesn't have: inspect afresh
+        self.inspects.update(get_container_inspects([
+            self.container_map[name].get("Name", "") for name in affected if name in self.container_map
+        ]))
+        self.rebuild_graph()
+        self.check(affected)
+        return affected
+
+    def refresh_containers(self, service_names: set[str]) -> set[str]:
+        """Re-read container state after docker events for the given services."""
+        ps_output = get_compose_ps(self.compose_file, self.project_dir, self.name)
+        container_map = map_containers(ps_output)
+        affected = set(service_names) | {
+            name for name in self.container_map.keys() | container_map.keys()
+            if self.container_map.get(name) != container_map.get(name)
+        }
+        self.container_map = container_map
+        self.inspects.update(get_container_inspects([
+            container_map[name].get("Name", "") for name in affected if name in container_map
+        ]))
+        self.check(affected)
+        return affected
+
+    def refresh_images(self) -> set[str]:
+        """Re-resolve image IDs after image events; re-check services whose image changed."""
+        old_ids = self.images.ids
+        self.images.ids = {}
+        self.images.prefetch(self.config)
+        changed = {ref for ref, image_id in self.images.ids.items() if old_ids.get(ref) != image_id}
+        affected = {
+            name for name, svc in self.config.get("services", {}).items()
+            if svc.get("image") in changed
+        }
+        self.check(affected)
+        return affected
+
+    def refresh(self, files_changed: bool, images_changed: bool, services: set[str]) -> set[str]:
+        """Bring the analysis up to date after a batch of events; returns the re-checked services."""
+        affected: set[str] = set()
+        if files_changed:
+            affected |= self.reload_config()
+        if images_changed:
+            affected |= self.refresh_images()
+        if services:
+            affected |= self.refresh_containers(services - {""})
+        return affected
+
+
+def map_containers(ps_output: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Build lookup of container info by service name."""
+    container_map: dict[str, dict[str, Any]] = {}
+    for container in ps_output:
+        service = container.get("Service", "")
+        if service:
+            container_map[service] = container
+    return container_map
+
+
+def check_service(service_name: str, project: ProjectState) -> ServiceStatus:
+    """Determine a single service's own restart reasons (dependencies aside)."""
+    status = ServiceStatus(name=service_name)
+    container_ps = project.container_map.get(service_name)
+
+    # Check if container exists and is running
+    if not container_ps:
+        status.needs_restart = True
+        status.reasons.append(
+            RestartReason(
+                trigger=RestartTrigger.NOT_CREATED,
+                details=["Container does not exist"],
+            )
+        )
+        status.container_state = "not created"
+        return status
+
+    state = container_ps.get("State", "").lower()
+    status.container_state = state
+    status.exit_code = container_ps.get("ExitCode")
+
+    if state != "running":
+        status.needs_restart = True
+        exit_info = ""
+        if status.exit_code is not None:
+            exit_info = f" (exit code: {status.exit_code})"
+        status.reasons.append(
+            RestartReason(
+                trigger=RestartTrigger.NOT_RUNNING,
+                details=[f"State: {state}{exit_info}"],
+            )
+        )
+
+    # Get detailed container info for comparisons
+    container_name = container_ps.get("Name", "")
+    container_info = project.inspects.get(container_name) if container_name else None
+
+    # Check image
+    image_reason = check_image_changed(service_name, project.config, container_info, project.images)
+    if image_reason:
+        status.needs_restart = True
+        status.reasons.append(image_reason)
+
+    # Check config. If compose's own hash of the service config matches the one it
+    # labelled the container with, compose won't recreate it: skip the detailed diff.
+    config_hash = project.config_hashes.get(service_name)
+    labels = (container_info or {}).get("Config", {}).get("Labels") or {}
+    if config_hash and labels.get("com.docker.compose.config-hash") == config_hash:
+        debug(f"{service_name}: config hash unchanged, skipping config diff")
+        config_reason = None
+    else:
+        svc_env_sources = project.env_sources.get(service_name, {})
+        prepared = project.prepared.get(service_name)
+        if prepared is None:
+            prepared = prepare_service(project.config.get("services", {}).get(service_name, {}))
+            project.prepared[service_name] = prepared
+        config_reason = check_config_changed(
+            service_name, project.config, container_info, svc_env_sources, project.project_dir, prepared
+        )
+    if config_reason:
+        status.needs_restart = True
+        status.reasons.append(config_reason)
+
+    return status
 
-            # Continue propagation
-            if dependent not in processed:
-                to_process.append(dependent)
+
+def load_project(compose_file: Path, project_dir: Path, check: bool = True) -> ProjectState | None:
+    """Gather config and container state for a project and check every service.
+
+    With check=False services are left unchecked, for iter_statuses() to check as it goes.
+    """
+    with phase("resolve"):
+        if DOCKER_API:
+            # The Engine API lists containers by project label, so ps needs the project
+            # name from the resolved config first; the API call itself is cheap.
+            config, all_env_sources, config_hashes = resolve_compose(compose_file, project_dir)
+            if not config:
+                return None
+            ps_output = get_compose_ps(compose_file, project_dir, config.get("name"))
+        else:
+            # config, ps, config hashes and env-source parsing are independent: run them concurrently
+            (config, all_env_sources, config_hashes), ps_output = run_parallel([
+                lambda: resolve_compose(compose_file, project_dir),
+                lambda: get_compose_ps(compose_file, project_dir),
+            ])
+            if not config:
+                return None
+
+    container_map = map_containers(ps_output)
+
+    # Inspect every container in batched calls rather than one per service (reusing
+    # stored snapshots of unchanged containers), and resolve every distinct image once
+    # (services sharing an image share the lookup). Both run concurrently.
+    images = ImageResolver()
+    with phase("inspect"):
+        container_inspects, _ = run_parallel([
+            lambda: get_project_inspects(compose_file, container_map, config_hashes),
+            lambda: images.prefetch(config),
+        ])
+
+    project = ProjectState(
+        compose_file=compose_file,
+        project_dir=project_dir,
+        config=config,
+        env_sources=all_env_sources,
+        container_map=container_map,
+        inspects=container_inspects,
+        images=images,
+        config_hashes=config_hashes,
+    )
+    project.rebuild_graph()
+    if check:
+        with phase("check"):
+            project.check()
+    return project
 
 
 def analyse_services(
@@ -936,111 +2336,153 @@ def analyse_services(
     project_dir: Path,
 ) -> dict[str, ServiceStatus]:
     """Analyse all services and determine restart requirements."""
-    config = get_compose_config(compose_file, project_dir)
-    if not config:
+    project = load_project(compose_file, project_dir)
+    if not project:
         return {}
+    with phase("propagate"):
+        return project.statuses()
 
-    # Get env sources for all services
-    all_env_sources = get_service_env_sources(compose_file, project_dir)
 
-    services = config.get("services", {})
-    ps_output = get_compose_ps(compose_file, project_dir)
+@dataclass
+class HostProject:
+    """A compose project discovered from its containers' labels."""
 
-    # Build lookup of container info by service name
-    container_map: dict[str, dict[str, Any]] = {}
-    for container in ps_output:
-        service = container.get("Service", "")
-        if service:
-            container_map[service] = container
+    name: str
+    working_dir: Path
+    config_files: tuple[Path, ...]
+    containers: list[dict[str, Any]] = field(default_factory=list)
 
-    # Build dependency graphs
-    dependencies = build_dependency_graph(config)
-    dependents = build_dependents_graph(dependencies)
 
-    statuses: dict[str, ServiceStatus] = {}
+def list_compose_containers() -> list[str]:
+    """IDs of every compose-managed container on the host, running or not."""
+    if DOCKER_API:
+        filters = json.dumps({"label": ["com.docker.compose.project"]})
+        try:
+            containers = DOCKER_API.get_json(f"/containers/json?{urlencode({'all': 1, 'filters': filters})}")
+        except DockerAPIError as e:
+            debug(f"Engine API container list failed, falling back to CLI: {e}")
+        else:
+            return [c["Id"] for c in containers or [] if c.get("Id")]
 
-    for service_name in services:
-        status = ServiceStatus(
-            name=service_name,
-            dependencies=dependencies.get(service_name, []),
-            dependents=dependents.get(service_name, []),
-        )
+    cmd = ["docker", "ps", "--all", "--quiet", "--no-trunc", "--filter", "label=com.docker.compose.project"]
+    code, stdout, stderr = run_command(cmd)
+    return stdout.split() if code == 0 else []
 
-        container_ps = container_map.get(service_name)
 
-        # Check if container exists and is running
-        if not container_ps:
-            status.needs_restart = True
-            status.reasons.append(
-                RestartReason(
-                    trigger=RestartTrigger.NOT_CREATED,
-                    details=["Container does not exist"],
-                )
+def discover_projects(inspects: dict[str, dict[str, Any]]) -> dict[str, HostProject]:
+    """Group inspected containers into compose projects using compose's labels."""
+    projects: dict[str, HostProject] = {}
+    seen: set[str] = set()
+    for item in inspects.values():
+        if item.get("Id") in seen:
+            continue
+        seen.add(item.get("Id"))
+        labels = item.get("Config", {}).get("Labels") or {}
+        name = labels.get("com.docker.compose.project")
+        if not name or labels.get("com.docker.compose.oneoff") == "True":
+            continue
+        if name not in projects:
+            config_files = labels.get("com.docker.compose.project.config_files", "")
+            projects[name] = HostProject(
+                name=name,
+                working_dir=Path(labels.get("com.docker.compose.project.working_dir", "")),
+                config_files=tuple(Path(f) for f in config_files.split(",") if f),
             )
-            status.container_state = "not created"
-        else:
-            state = container_ps.get("State", "").lower()
-            status.container_state = state
-            status.exit_code = container_ps.get("ExitCode")
-
-            if state != "running":
-                status.needs_restart = True
-                exit_info = ""
-                if status.exit_code is not None:
-                    exit_info = f" (exit code: {status.exit_code})"
-                status.reasons.append(
-                    RestartReason(
-                        trigger=RestartTrigger.NOT_RUNNING,
-                        details=[f"State: {state}{exit_info}"],
-                    )
-                )
+        projects[name].containers.append(item)
+    return projects
+
+
+def ps_entry_from_inspect(item: dict[str, Any]) -> dict[str, Any]:
+    """Build a `docker compose ps --format json` style entry from inspect data."""
+    labels = item.get("Config", {}).get("Labels") or {}
+    state = item.get("State", {})
+    return {
+        "ID": item.get("Id", ""),
+        "Name": item.get("Name", "").lstrip("/"),
+        "Service": labels.get("com.docker.compose.service", ""),
+        "State": state.get("Status", ""),
+        "Health": (state.get("Health") or {}).get("Status", ""),
+        "ExitCode": state.get("ExitCode"),
+    }
 
-            # Get detailed container info for comparisons
-            container_name = container_ps.get("Name", "")
-            container_info = get_container_inspect(container_name) if container_name else None
 
-            # Check image
-            image_reason = check_image_changed(service_name, config, container_info)
-            if image_reason:
-                status.needs_restart = True
-                status.reasons.append(image_reason)
+def load_host_projects() -> dict[str, ProjectState | None]:
+    """Load and check every compose project that has containers on this host.
 
-            # Check config
-            svc_env_sources = all_env_sources.get(service_name, {})
-            config_reason = check_config_changed(
-                service_name, config, container_info, svc_env_sources, project_dir
-            )
-            if config_reason:
-                status.needs_restart = True
-                status.reasons.append(config_reason)
+    Container and image metadata are fetched once for the whole host (one
+    container listing, batched inspects, one image resolver) and shared by all
+    projects, so only `docker compose config` runs per project, concurrently.
+    Returns: {project_name: project, or None if its compose files can't be loaded}
+    """
+    with phase("inspect"):
+        inspects = get_container_inspects(list_compose_containers())
+    projects = discover_projects(inspects)
+
+    def load_config(project: HostProject) -> tuple[Any, ...]:
+        """(config or None, env sources, config hashes) for one project."""
+        if not project.config_files or not all(f.is_file() for f in project.config_files):
+            return None, {}, {}
+        compose_file, *extra_files = project.config_files
+        return resolve_compose(compose_file, project.working_dir, tuple(extra_files), project.name)
+
+    with phase("resolve"):
+        loaded = run_parallel([lambda project=project: load_config(project) for project in projects.values()])
+
+    images = ImageResolver()
+    with phase("inspect"):
+        images.resolve([
+            svc.get("image", "")
+            for config, *_ in loaded if config
+            for svc in config.get("services", {}).values()
+        ])
+
+    results: dict[str, ProjectState | None] = {}
+    for project, (config, env_sources, config_hashes) in zip(projects.values(), loaded):
+        if not config:
+            results[project.name] = None
+            continue
+        state = ProjectState(
+            compose_file=project.config_files[0],
+            project_dir=project.working_dir,
+            config=config,
+            env_sources=env_sources,
+            container_map=map_containers([ps_entry_from_inspect(c) for c in project.containers]),
+            inspects=inspects,
+            images=images,
+            extra_files=project.config_files[1:],
+            config_hashes=config_hashes,
+            project_name=project.name,
+        )
+        state.rebuild_graph()
+        with phase("check"):
+            state.check()
+        results[project.name] = state
 
-        statuses[service_name] = status
+    return dict(sorted(results.items()))
 
-    # Propagate dependency restarts
-    propagate_dependency_restarts(statuses, dependents)
 
-    return statuses
+def analyse_host_projects() -> dict[str, dict[str, ServiceStatus] | None]:
+    """Analyse every compose project that has containers on this host.
+
+    Returns: {project_name: statuses, or None if its compose files can't be loaded}
+    """
+    projects = load_host_projects()
+    with phase("check"):
+        return {name: project.statuses() if project else None for name, project in projects.items()}
 
 
 def format_trigger(trigger: RestartTrigger) -> str:
     """Format a trigger with colour."""
-    colours = {
-        RestartTrigger.IMAGE_UPDATED: Colour.MAGENTA,
-        RestartTrigger.CONFIG_CHANGED: Colour.YELLOW,
-        RestartTrigger.DEPENDENCY_RESTART: Colour.CYAN,
-        RestartTrigger.NOT_RUNNING: Colour.RED,
-        RestartTrigger.NOT_CREATED: Colour.RED,
-    }
-    colour = colours.get(trigger, "")
-    return f"{colour}{trigger.value}{Colour.RESET}"
+    return f"{trigger_colour(trigger.value)}{trigger.value}{Colour.RESET}"
 
 
-def print_tree_output(statuses: dict[str, ServiceStatus]) -> None:
-    """Print the analysis results as a tree."""
+def print_tree_output(statuses: dict[str, ServiceStatus], project: str | None = None) -> None:
+    """Print the analysis results as a tree (optionally titled with the project name)."""
     need_restart = {name: s for name, s in statuses.items() if s.needs_restart}
     no_restart = {name: s for name, s in statuses.items() if not s.needs_restart}
 
-    print(f"\n{Colour.BOLD}compose-tree:{Colour.RESET} Analysed {len(statuses)} services\n")
+    title = f"compose-tree: {project}:" if project else "compose-tree:"
+    print(f"\n{Colour.BOLD}{title}{Colour.RESET} Analysed {len(statuses)} services\n")
 
     if need_restart:
         print(f"{Colour.RED}{Colour.BOLD}Restart Required ({len(need_restart)} services):{Colour.RESET}\n")
@@ -1060,8 +2502,9 @@ def print_tree_output(statuses: dict[str, ServiceStatus]) -> None:
             for j, reason in enumerate(status.reasons):
                 is_last_reason = j == len(status.reasons) - 1 and not status.dependents
 
-                for k, detail in enumerate(reason.details):
-                    is_last_detail = k == len(reason.details) - 1
+                lines = reason.lines()
+                for k, detail in enumerate(lines):
+                    is_last_detail = k == len(lines) - 1
                     detail_prefix = "└── " if is_last_detail and is_last_reason else "├── "
                     print(f"{child_prefix}{detail_prefix}{Colour.DIM}{detail}{Colour.RESET}")
 
@@ -1087,6 +2530,1188 @@ def print_tree_output(statuses: dict[str, ServiceStatus]) -> None:
         print(f"  {Colour.DIM}{services_list}{Colour.RESET}\n")
 
 
+def dependency_chain(name: str, statuses: dict[str, ServiceStatus]) -> list[str]:
+    """Services from the root cause to `name` along DEPENDENCY_RESTART triggers.
+
+    Empty unless `name` restarts because of a dependency.
+    """
+    chain = [name]
+    current = name
+    while True:
+        reason = next(
+            (r for r in statuses[current].reasons if r.trigger == RestartTrigger.DEPENDENCY_RESTART), None
+        )
+        upstream = next(
+            (dep for dep in reason.details if dep in statuses and dep not in chain), None
+        ) if reason else None
+        if upstream is None:
+            break
+        chain.append(upstream)
+        current = upstream
+    return chain[::-1] if len(chain) > 1 else []
+
+
+def status_record(status: ServiceStatus, statuses: dict[str, ServiceStatus]) -> dict[str, Any]:
+    """Serialise a service status for --format json/ndjson."""
+    return {
+        "name": status.name,
+        "needs_restart": status.needs_restart,
+        "container_state": status.container_state,
+        "exit_code": status.exit_code,
+        "triggers": [r.trigger.value for r in status.reasons],
+        "reasons": [
+            {"trigger": r.trigger.value, "details": r.lines(), "changes": [asdict(c) for c in r.changes]}
+            for r in status.reasons
+        ],
+        "dependencies": status.dependencies,
+        "dependents": status.dependents,
+        "dependency_chain": dependency_chain(status.name, statuses),
+    }
+
+
+def project_summary(statuses: dict[str, ServiceStatus]) -> dict[str, Any]:
+    """Project-level fields shared by the json document and the ndjson summary line."""
+    graph = DependencyGraph({name: status.dependencies for name, status in statuses.items()})
+    return {
+        "needs_restart": sorted(name for name, s in statuses.items() if s.needs_restart),
+        "cycles": graph.cycles,
+    }
+
+
+def timings_ms() -> dict[str, float]:
+    """Per-phase wall time so far, in milliseconds."""
+    return {name: round(seconds * 1000, 3) for name, seconds in PHASE_TIMINGS.items()}
+
+
+def project_document(name: str, statuses: dict[str, ServiceStatus]) -> dict[str, Any]:
+    """One project's analysis as a JSON-serialisable dict."""
+    return {
+        "project": name,
+        "services": [status_record(status, statuses) for status in statuses.values()],
+        **project_summary(statuses),
+    }
+
+
+def print_json(document: dict[str, Any]) -> None:
+    """Print a --format json document, stamped with the schema version and phase timings."""
+    print(json.dumps(
+        {"schema_version": OUTPUT_SCHEMA_VERSION, **document, "timings_ms": timings_ms()}, indent=2
+    ))
+
+
+def emit_ndjson(record_type: str, project: str, **fields: Any) -> None:
+    """Print a single --format ndjson record and flush it straight away."""
+    record = {"schema_version": OUTPUT_SCHEMA_VERSION, "type": record_type, "project": project, **fields}
+    print(json.dumps(record), flush=True)
+
+
+def stream_project(project: ProjectState) -> dict[str, ServiceStatus]:
+    """Emit ndjson records for a project, one per service as soon as its status is final."""
+    name = project.name
+    emit_ndjson(
+        "project", name,
+        compose_file=str(project.compose_file),
+        services=len(project.config.get("services", {})),
+    )
+    statuses: dict[str, ServiceStatus] = {}
+    for status in project.iter_statuses():
+        statuses[status.name] = status
+        emit_ndjson("service", name, **status_record(status, statuses))
+    emit_ndjson("summary", name, **project_summary(statuses), timings_ms=timings_ms())
+    return statuses
+
+
+def compose_up(project: ProjectState, services: list[str], force_recreate: bool = False) -> bool:
+    """Run `docker compose up -d --no-deps` for the given services."""
+    cmd = compose_command((project.compose_file, *project.extra_files), project.project_name)
+    cmd.extend(["up", "-d", "--no-deps"])
+    if force_recreate:
+        cmd.append("--force-recreate")
+    cmd.extend(services)
+    code, _, stderr = run_command(cmd, cwd=project.project_dir, timeout=COMPOSE_UP_TIMEOUT)
+    if code != 0:
+        command = " ".join(cmd[cmd.index("up"):])
+        print(f"{Colour.RED}Error:{Colour.RESET} {command} failed: {stderr.strip()}", file=sys.stderr)
+    return code == 0
+
+
+def runs_to_completion(project: ProjectState, name: str) -> bool:
+    """Whether a service may finish rather than keep running.
+
+    True if its restart policy is explicitly "no" or "on-failure", or a dependent
+    waits for it with `condition: service_completed_successfully`. A service
+    without a policy is taken to be long-running, even though docker won't
+    restart it either: one that exits straight away has failed.
+    """
+    services = project.config.get("services", {})
+    restart = services.get(name, {}).get("restart")
+    # An unquoted `restart: no` is a YAML boolean
+    if restart is False or str(restart) == "no" or str(restart).startswith("on-failure"):
+        return True
+    for dependent in project.graph.dependents.get(name, []):
+        depends_on = services.get(dependent, {}).get("depends_on")
+        if isinstance(depends_on, dict):
+            condition = (depends_on.get(name) or {}).get("condition")
+            if condition == "service_completed_successfully":
+                return True
+    return False
+
+
+def wait_healthy(project: ProjectState, services: list[str], timeout: float) -> list[str]:
+    """Wait until the services are running (and healthy, if they have a healthcheck).
+
+    Services that run to completion (see runs_to_completion) are also done once
+    they have exited with code 0. Returns the services that failed: exited
+    otherwise, unhealthy, or not ready within `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    waiting = set(services)
+    one_shot = {name for name in services if runs_to_completion(project, name)}
+    failed: list[str] = []
+    while True:
+        containers = map_containers(
+            get_compose_ps(project.compose_file, project.project_dir, project.name)
+        )
+        for name in sorted(waiting):
+            container = containers.get(name)
+            if not container:
+                continue
+            state = container.get("State", "").lower()
+            health = container.get("Health", "")
+            if state == "exited" and container.get("ExitCode") == 0 and name in one_shot:
+                waiting.discard(name)
+            elif state in ("exited", "dead") or health == "unhealthy":
+                waiting.discard(name)
+                failed.append(name)
+            elif state == "running" and health in ("", "healthy"):
+                waiting.discard(name)
+        if not waiting:
+            return failed
+        if time.monotonic() >= deadline:
+            return failed + sorted(waiting)
+        time.sleep(HEALTH_POLL_INTERVAL)
+
+
+def apply_restarts(
+    project: ProjectState, statuses: dict[str, ServiceStatus], max_parallel: int, health_timeout: float
+) -> int:
+    """Restart services needing it, wave by wave in dependency order.
+
+    Each wave is split into batches of at most `max_parallel` services (0 = no
+    limit), one `docker compose up -d --no-deps` per batch. Services restarting
+    only because of a dependency are force-recreated, as compose would otherwise
+    consider them up to date, in a second `up` run after the first. After each batch, every restarted service must be
+    running and healthy before moving on (skipped with health_timeout=0).
+    Returns 0 if every wave succeeded, 1 otherwise.
+    """
+    restart = [name for name, status in statuses.items() if status.needs_restart]
+    waves = project.graph.waves(restart)
+    if not waves:
+        print(f"{Colour.GREEN}Nothing to restart{Colour.RESET}")
+        return 0
+
+    print(f"{Colour.BOLD}Restart plan:{Colour.RESET} {len(restart)} services in {len(waves)} waves")
+    for number, wave in enumerate(waves, 1):
+        print(f"  wave {number}: {', '.join(wave)}")
+    print(flush=True)
+
+    for number, wave in enumerate(waves, 1):
+        start = time.perf_counter()
+        size = max_parallel if max_parallel > 0 else len(wave)
+        for batch in (wave[i:i + size] for i in range(0, len(wave), size)):
+            dependency_only = [
+                name for name in batch
+                if all(r.trigger == RestartTrigger.DEPENDENCY_RESTART for r in statuses[name].reasons)
+            ]
+            direct = [name for name in batch if name not in dependency_only]
+            print(f"wave {number}/{len(waves)}: restarting {', '.join(batch)}", flush=True)
+            # One `up` at a time: concurrent ones on a project race to create its networks and volumes
+            started = all(
+                compose_up(project, services, force)
+                for services, force in ((direct, False), (dependency_only, True)) if services
+            )
+            if not started:
+                print(f"{Colour.RED}Stopped:{Colour.RESET} wave {number} failed to start", file=sys.stderr)
+                return 1
+            if health_timeout > 0:
+                failed = wait_healthy(project, batch, health_timeout)
+                if failed:
+                    print(
+                        f"{Colour.RED}Stopped:{Colour.RESET} not running/healthy after wave {number}: "
+                        f"{', '.join(failed)}",
+                        file=sys.stderr,
+                    )
+                    return 1
+        elapsed = time.perf_counter() - start
+        print(f"{Colour.GREEN}wave {number}/{len(waves)} done{Colour.RESET} ({elapsed:.1f}s)", flush=True)
+    return 0
+
+
+# inotify constants (linux/inotify.h)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# docker events that can change a service's verdict
+CONTAINER_EVENTS = {
+    "create", "start", "restart", "stop", "die", "kill", "destroy",
+    "rename", "update", "pause", "unpause", "oom",
+}
+IMAGE_EVENTS = {"pull", "tag", "untag", "delete", "load", "import"}
+
+# Batch events arriving within this window into one re-analysis
+WATCH_DEBOUNCE = 0.1
+
+# serve: default unix socket; serve and --watch: how long to wait before restarting a dead `docker events` stream
+DEFAULT_SERVE_SOCKET = Path(os.environ.get("XDG_RUNTIME_DIR") or CACHE_DIR) / "compose-tree.sock"
+SERVE_EVENTS_RETRY = 5.0
+
+
+class FileWatcher:
+    """Watch a set of files: inotify on Linux, stat polling elsewhere.
+
+    Parent directories are watched rather than the files themselves so editors
+    that save by rename are seen. Changes arrive as ("files", {path, ...}) on
+    the queue.
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, paths: Iterable[Path], events: queue.Queue) -> None:
+        self.events = events
+        self.paths: set[Path] = set()
+        self._lock = threading.Lock()
+        self._dirs: dict[int, Path] = {}
+        self._stats: dict[Path, tuple[int, int] | None] = {}
+        self._libc: Any = None
+        self._fd = self._init_inotify()
+        self.update(paths)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _init_inotify(self) -> int | None:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return fd if fd >= 0 else None
+
+    @staticmethod
+    def _stat(path: Path) -> tuple[int, int] | None:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def update(self, paths: Iterable[Path]) -> None:
+        """Replace the watched file set (e.g. after includes change)."""
+        with self._lock:
+            self.paths = set(paths)
+            self._stats = {path: self._stat(path) for path in self.paths}
+            if self._fd is None:
+                return
+            watched = set(self._dirs.values())
+            for directory in {path.parent for path in self.paths} - watched:
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), INOTIFY_MASK)
+                if wd >= 0:
+                    self._dirs[wd] = directory
+
+    def _run(self) -> None:
+        if self._fd is None:
+            self._poll()
+        else:
+            self._read_inotify()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            with self._lock:
+                changed = set()
+                for path, old in self._stats.items():
+                    new = self._stat(path)
+                    if new != old:
+                        self._stats[path] = new
+                        changed.add(path)
+            if changed:
+                self.events.put(("files", changed))
+
+    def _read_inotify(self) -> None:
+        header = struct.Struct("iIII")
+        while True:
+            select.select([self._fd], [], [])
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            changed = set()
+            offset = 0
+            with self._lock:
+                while offset + header.size <= len(data):
+                    wd, mask, cookie, length = header.unpack_from(data, offset)
+                    name = data[offset + header.size:offset + header.size + length].rstrip(b"\0")
+                    offset += header.size + length
+                    directory = self._dirs.get(wd)
+                    if directory is None or not name:
+                        continue
+                    path = directory / os.fsdecode(name)
+                    if path in self.paths:
+                        changed.add(path)
+            if changed:
+                self.events.put(("files", changed))
+
+
+def stream_docker_events(events: queue.Queue) -> subprocess.Popen | None:
+    """Follow `docker events` for containers and images, as ("docker", event) items."""
+    cmd = [
+        "docker", "events",
+        "--filter", "type=container", "--filter", "type=image",
+        "--format", "{{json .}}",
+    ]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except FileNotFoundError:
+        return None
+
+    def reader() -> None:
+        for line in proc.stdout:
+            try:
+                events.put(("docker", json.loads(line)))
+            except json.JSONDecodeError:
+                continue
+        events.put(("docker-eof", None))
+
+    threading.Thread(target=reader, daemon=True).start()
+    return proc
+
+
+def next_batch(events: queue.Queue, timeout: float | None = None) -> list[tuple[str, Any]]:
+    """Wait for an event, then gather whatever follows within WATCH_DEBOUNCE.
+
+    Returns an empty batch if nothing arrives within `timeout` seconds.
+    """
+    try:
+        batch = [events.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while True:
+        try:
+            batch.append(events.get(timeout=WATCH_DEBOUNCE))
+        except queue.Empty:
+            return batch
+
+
+def classify_events(batch: list[tuple[str, Any]]) -> tuple[set[Path], bool, dict[str, set[str]], bool]:
+    """Split a batch of events into what needs refreshing.
+
+    Returns (changed files, whether images changed, {project: services with
+    container events}, whether the docker events stream ended).
+    """
+    files: set[Path] = set()
+    images_changed = False
+    services: dict[str, set[str]] = {}
+    events_ended = False
+    for kind, payload in batch:
+        if kind == "files":
+            files |= payload
+            continue
+        if kind == "docker-eof":
+            events_ended = True
+            continue
+        action = payload.get("Action", "").split(":")[0]
+        attributes = payload.get("Actor", {}).get("Attributes", {})
+        if payload.get("Type") == "image" and action in IMAGE_EVENTS:
+            images_changed = True
+        elif action in CONTAINER_EVENTS and attributes.get("com.docker.compose.project"):
+            services.setdefault(attributes["com.docker.compose.project"], set()).add(
+                attributes.get("com.docker.compose.service", "")
+            )
+    return files, images_changed, services, events_ended
+
+
+def render(statuses: dict[str, ServiceStatus], quiet: bool) -> None:
+    """Print the analysis in the selected output mode."""
+    if quiet:
+        for name in sorted(n for n, s in statuses.items() if s.needs_restart):
+            print(name)
+    else:
+        print_tree_output(statuses)
+
+
+def watch_project(project: ProjectState, quiet: bool) -> int:
+    """Keep the analysis live, re-checking only services touched by file or docker events."""
+    events: queue.Queue = queue.Queue()
+    watcher = FileWatcher(get_compose_inputs(project.compose_file, project.project_dir)[0], events)
+    docker_events = stream_docker_events(events)
+    restart_events_at = None if docker_events else time.monotonic() + SERVE_EVENTS_RETRY
+    project_name = project.name
+    redraw = sys.stdout.isatty()
+    note = "initial analysis"
+
+    try:
+        while True:
+            if redraw:
+                print("\033[H\033[2J", end="")
+            render(project.statuses(), quiet)
+            sources = "and docker events" if docker_events else "(docker events stopped, retrying)"
+            print(f"{Colour.DIM}watching {len(watcher.paths)} files {sources} - {note}{Colour.RESET}", flush=True)
+
+            timeout = None if restart_events_at is None else max(0.0, restart_events_at - time.monotonic())
+            files, images_changed, touched, events_ended = classify_events(next_batch(events, timeout))
+            start = time.perf_counter()
+            services = touched.get(project_name, set())
+            if events_ended and docker_events:
+                # Same as serve: retry the stream, and re-check everything once it's back
+                docker_events.wait()
+                docker_events = None
+                restart_events_at = time.monotonic() + SERVE_EVENTS_RETRY
+                note = "docker events stream ended"
+            elif restart_events_at is not None and time.monotonic() >= restart_events_at:
+                docker_events = stream_docker_events(events)
+                restart_events_at = None if docker_events else time.monotonic() + SERVE_EVENTS_RETRY
+                if docker_events:
+                    images_changed = True
+                    services = set(project.config.get("services", {}))
+            if not (files or images_changed or services):
+                continue
+
+            affected = project.refresh(bool(files), images_changed, services)
+            if files:
+                watcher.update(get_compose_inputs(project.compose_file, project.project_dir)[0])
+
+            elapsed = (time.perf_counter() - start) * 1000
+            note = f"re-checked {len(affected)} services in {elapsed:.0f} ms"
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if docker_events:
+            docker_events.terminate()
+
+
+@dataclass(frozen=True)
+class ProjectSnapshot:
+    """One project's analysis, serialised once per refresh.
+
+    Snapshots are never modified: queries keep reading the current one while the
+    next is built, so they never see a half-refreshed project.
+    """
+
+    generation: int
+    summary: dict[str, Any]
+    document: bytes
+    services: dict[str, bytes]
+
+
+@dataclass(frozen=True)
+class ServeView:
+    """Every project's current snapshot plus the pre-serialised project listing."""
+
+    generation: int
+    projects: dict[str, ProjectSnapshot]
+    index: bytes
+
+
+def encode_json(document: dict[str, Any]) -> bytes:
+    """Compact JSON response body."""
+    return json.dumps(document).encode()
+
+
+def snapshot_project(
+    name: str, project: ProjectState | None, generation: int, refresh_ms: float
+) -> ProjectSnapshot:
+    """Serialise a project's current statuses for `serve` (None = couldn't be loaded)."""
+    stamp = {"generation": generation, "updated": time.time(), "refresh_ms": round(refresh_ms, 3)}
+    if project is None:
+        summary = {"project": name, "error": "compose files not found or could not be parsed", **stamp}
+        document = encode_json({"schema_version": OUTPUT_SCHEMA_VERSION, **summary})
+        return ProjectSnapshot(generation, summary, document, {})
+
+    statuses = project.statuses()
+    records = {status.name: status_record(status, statuses) for status in statuses.values()}
+    summary = {
+        "project": name,
+        "compose_file": str(project.compose_file),
+        "services": len(statuses),
+        **project_summary(statuses),
+        **stamp,
+    }
+    document = encode_json({"schema_version": OUTPUT_SCHEMA_VERSION, **summary, "services": list(records.values())})
+    services = {
+        service: encode_json({"schema_version": OUTPUT_SCHEMA_VERSION, "project": name, **record, **stamp})
+        for service, record in records.items()
+    }
+    return ProjectSnapshot(generation, summary, document, services)
+
+
+class ServeHandler(BaseHTTPRequestHandler):
+    """Answers queries from the current view without touching the analysis itself.
+
+      GET /                                  every project's summary
+      GET /projects/NAME                     one project, as --format json
+      GET /projects/NAME/services/SERVICE    one service record
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: UnixServeServer | TCPServeServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        debug(f"serve: {format % args}")
+
+    def send_body(self, status: int, body: bytes, etag: str | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        # One read of the current view: the whole response comes from a single snapshot
+        view = self.server.analysis.view
+        parts = [unquote(part) for part in urlparse(self.path).path.strip("/").split("/") if part]
+
+        if not parts:
+            body, generation = view.index, view.generation
+        elif parts[0] == "projects" and len(parts) in (2, 4) and parts[1] in view.projects:
+            snapshot = view.projects[parts[1]]
+            generation = snapshot.generation
+            if len(parts) == 2:
+                body = snapshot.document
+            elif parts[2] == "services" and parts[3] in snapshot.services:
+                body = snapshot.services[parts[3]]
+            else:
+                self.send_body(404, encode_json({"error": f"no such service: {parts[3]}"}))
+                return
+        else:
+            self.send_body(404, encode_json({"error": f"not found: {self.path}"}))
+            return
+
+        etag = f'"{generation}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_body(200, body, etag)
+
+    do_HEAD = do_GET
+
+
+class UnixServeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    analysis: AnalysisServer
+
+
+class TCPServeServer(ThreadingHTTPServer):
+    analysis: AnalysisServer
+
+
+class AnalysisServer:
+    """Keep several projects analysed and answer queries about them over HTTP.
+
+    The event loop runs on the calling thread and is the only writer: after each
+    batch of file or docker events it re-checks the affected services, builds
+    fresh snapshots for the projects that changed and swaps in a new view.
+    Request threads only ever read `view`.
+    """
+
+    def __init__(self, projects: dict[str, ProjectState | None]) -> None:
+        self.projects = projects
+        self.view = ServeView(0, {}, b"")
+        self.publish(set(projects), {name: 0.0 for name in projects})
+
+    def publish(self, changed: set[str], refresh_ms: dict[str, float]) -> None:
+        """Snapshot the changed projects and make them visible to queries."""
+        generation = self.view.generation + 1
+        snapshots = dict(self.view.projects)
+        for name in changed:
+            snapshots[name] = snapshot_project(name, self.projects[name], generation, refresh_ms.get(name, 0.0))
+        index = encode_json({
+            "schema_version": OUTPUT_SCHEMA_VERSION,
+            "generation": generation,
+            "projects": [snapshots[name].summary for name in sorted(snapshots)],
+        })
+        self.view = ServeView(generation, snapshots, index)
+
+    def inputs(self) -> dict[str, set[Path]]:
+        """Compose and env files each project depends on."""
+        return {
+            name: set(get_compose_inputs(project.compose_file, project.project_dir)[0])
+            for name, project in self.projects.items() if project
+        }
+
+    def run(self, server: socketserver.BaseServer) -> int:
+        """Serve queries on a background thread while following events here."""
+        server.analysis = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        events: queue.Queue = queue.Queue()
+        inputs = self.inputs()
+        watcher = FileWatcher(set().union(*inputs.values()), events)
+        docker_events = stream_docker_events(events)
+        restart_events_at = None if docker_events else time.monotonic() + SERVE_EVENTS_RETRY
+        try:
+            while True:
+                timeout = None if restart_events_at is None else max(0.0, restart_events_at - time.monotonic())
+                files, images_changed, touched, events_ended = classify_events(next_batch(events, timeout))
+                resync = False
+                if events_ended:
+                    # Events may have been missed while the stream was down; resync once it's back
+                    debug("docker events stream ended")
+                    restart_events_at = time.monotonic() + SERVE_EVENTS_RETRY
+                elif restart_events_at is not None and time.monotonic() >= restart_events_at:
+                    docker_events = stream_docker_events(events)
+                    restart_events_at = None if docker_events else time.monotonic() + SERVE_EVENTS_RETRY
+                    resync = docker_events is not None
+
+                changed: set[str] = set()
+                refresh_ms: dict[str, float] = {}
+                for name, project in self.projects.items():
+                    if project is None:
+                        continue
+                    project_files = bool(files & inputs.get(name, set()))
+                    services = touched.get(name, set())
+                    if resync:
+                        services = services | set(project.config.get("services", {}))
+                    if not (project_files or images_changed or services):
+                        continue
+                    start = time.perf_counter()
+                    project.refresh(project_files, images_changed or resync, services)
+                    refresh_ms[name] = (time.perf_counter() - start) * 1000
+                    changed.add(name)
+
+                if files:
+                    inputs = self.inputs()
+                    watcher.update(set().union(*inputs.values()))
+                if changed:
+                    self.publish(changed, refresh_ms)
+                    debug(f"serve: refreshed {', '.join(sorted(changed))} (generation {self.view.generation})")
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            server.shutdown()
+            server.server_close()
+            if docker_events:
+                docker_events.terminate()
+
+
+def open_serve_socket(socket_path: Path | None, listen: str | None) -> socketserver.BaseServer | None:
+    """Bind the query server: localhost HTTP for --listen, otherwise a unix socket."""
+    if listen:
+        host, _, port = listen.rpartition(":")
+        try:
+            return TCPServeServer((host or "127.0.0.1", int(port)), ServeHandler)
+        except (OSError, ValueError) as e:
+            print(f"{Colour.RED}Error:{Colour.RESET} can't listen on {listen}: {e}", file=sys.stderr)
+            return None
+
+    path = socket_path or DEFAULT_SERVE_SOCKET
+    if path.exists():
+        # Only replace the socket if nothing is answering on it any more
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()
+        else:
+            print(f"{Colour.RED}Error:{Colour.RESET} {path} is already being served", file=sys.stderr)
+            return None
+        finally:
+            probe.close()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        return UnixServeServer(str(path), ServeHandler)
+    except OSError as e:
+        print(f"{Colour.RED}Error:{Colour.RESET} can't bind {path}: {e}", file=sys.stderr)
+        return None
+
+
+def serve(projects: dict[str, ProjectState | None], socket_path: Path | None, listen: str | None) -> int:
+    """Run `compose_tree.py serve` until interrupted."""
+    analysis = AnalysisServer(projects)
+    server = open_serve_socket(socket_path, listen)
+    if server is None:
+        return 1
+    address = "http://{}:{}".format(*server.server_address[:2]) if listen else server.server_address
+    print(f"compose-tree: serving {len(projects)} projects on {address}", file=sys.stderr, flush=True)
+
+    # Stop cleanly (closing the socket) on SIGTERM as well as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        return analysis.run(server)
+    finally:
+        if not listen:
+            Path(server.server_address).unlink(missing_ok=True)
+
+
+# --hosts: where per-host SSH tunnel sockets live, the Docker socket path on remote
+# hosts, and timeouts
+HOST_TUNNEL_DIR = DEFAULT_SERVE_SOCKET.parent / "compose-tree-hosts"
+DEFAULT_REMOTE_SOCKET = "/var/run/docker.sock"
+SSH_CONNECT_TIMEOUT = 30.0
+HOST_ANALYSIS_TIMEOUT = 600
+
+# Short trigger names for the --hosts matrix cells
+TRIGGER_CODES = {
+    RestartTrigger.IMAGE_UPDATED: "image",
+    RestartTrigger.CONFIG_CHANGED: "config",
+    RestartTrigger.DEPENDENCY_RESTART: "dep",
+    RestartTrigger.NOT_RUNNING: "down",
+    RestartTrigger.NOT_CREATED: "new",
+}
+
+
+@dataclass
+class RemoteHost:
+    """One --hosts entry: its label in the matrix and how to reach its Docker daemon.
+
+    unix:// and tcp:// entries are used as DOCKER_HOST directly; anything else
+    ([ssh://][user@]host[:port][/remote/docker.sock]) is reached through an SSHTunnel.
+    """
+
+    label: str
+    docker_host: str | None = None
+    ssh_target: str | None = None
+    ssh_port: int | None = None
+    remote_socket: str = DEFAULT_REMOTE_SOCKET
+
+    @classmethod
+    def parse(cls, entry: str) -> RemoteHost:
+        if entry.startswith(("unix://", "tcp://")):
+            return cls(entry, docker_host=entry)
+        url = urlparse(entry if "://" in entry else f"ssh://{entry}")
+        try:
+            port = url.port
+        except ValueError:
+            port = None
+            url = url._replace(netloc="")
+        if url.scheme != "ssh" or not url.hostname:
+            raise ValueError(f"unsupported host {entry!r} (use [ssh://][user@]host[:port], unix:// or tcp://)")
+        target = f"{url.username}@{url.hostname}" if url.username else url.hostname
+        return cls(url.netloc, ssh_target=target, ssh_port=port, remote_socket=url.path or DEFAULT_REMOTE_SOCKET)
+
+
+class SSHTunnel:
+    """One SSH connection per host, forwarding its Docker socket to a local unix socket.
+
+    Every docker call for the host (CLI or Engine API) goes through the forwarded
+    socket, so a run costs one SSH handshake per host instead of one per call as
+    DOCKER_HOST=ssh:// would. The connection and its socket belong to this run
+    (the socket name carries the pid), and multiplexing is off, so closing it
+    never takes down a tunnel that another run is still using.
+    """
+
+    def __init__(self, host: RemoteHost, tunnel_dir: Path = HOST_TUNNEL_DIR) -> None:
+        key = hashlib.sha256(host.label.encode()).hexdigest()[:16]
+        self.host = host
+        self.socket_path = tunnel_dir / f"{key}-{os.getpid()}.sock"
+        self.process: subprocess.Popen | None = None
+
+    def listening(self) -> bool:
+        """Whether something accepts connections on the local socket."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.socket_path))
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def open(self, timeout: float = SSH_CONNECT_TIMEOUT) -> str:
+        """Bring the tunnel up and return the DOCKER_HOST for it. Raises OSError on failure."""
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+        cmd = [
+            "ssh", "-N",
+            "-o", "BatchMode=yes",
+            "-o", "ExitOnForwardFailure=yes",
+            "-o", "StreamLocalBindUnlink=yes",
+            "-o", "ControlMaster=no",
+            "-o", "ControlPath=none",
+            "-o", f"ConnectTimeout={int(timeout)}",
+            "-L", f"{self.socket_path}:{self.host.remote_socket}",
+        ]
+        if self.host.ssh_port:
+            cmd += ["-p", str(self.host.ssh_port)]
+        cmd.append(self.host.ssh_target)
+
+        # stderr goes to an unlinked temp file rather than a pipe nobody drains once
+        # the tunnel is up, so a chatty connection can never block on a full pipe
+        with profiled("subprocess", "ssh", argv=cmd), tempfile.TemporaryFile("w+") as stderr:
+            try:
+                self.process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr)
+            except FileNotFoundError:
+                raise OSError("Command not found: ssh") from None
+            deadline = time.monotonic() + timeout
+            while not self.listening():
+                if self.process.poll() is not None:
+                    self.process = None
+                    stderr.seek(0)
+                    message = stderr.read().strip()
+                    raise OSError(f"ssh failed: {message or 'exited without forwarding the socket'}")
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise OSError(f"ssh: no tunnel after {timeout:.0f}s")
+                time.sleep(0.05)
+        return f"unix://{self.socket_path}"
+
+    def close(self) -> None:
+        """Stop the SSH connection and remove its socket."""
+        if self.process is None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+        self.socket_path.unlink(missing_ok=True)
+
+
+def host_command(args: argparse.Namespace, compose_file: Path) -> list[str]:
+    """compose-tree command line analysing compose_file on one host (DOCKER_HOST set by the caller)."""
+    cmd = [
+        sys.executable, str(Path(__file__).resolve()), "-f", str(compose_file), "--format", "json",
+        "--backend", args.backend, "--jobs", str(args.jobs),
+    ]
+    if args.experimental_native_loader:
+        cmd.append("--experimental-native-loader")
+    for option, value in (("--fields", args.fields), ("--skip-fields", args.skip_fields)):
+        if value:
+            cmd += [option, value]
+    for flag, enabled in (("--full-diff", args.full_diff), ("--no-cache", args.no_cache), ("--refresh", args.refresh)):
+        if enabled:
+            cmd.append(flag)
+    return cmd
+
+
+def analyse_host(host: RemoteHost, cmd: list[str]) -> dict[str, Any]:
+    """Run the analysis against one host; returns its JSON document, or {"error": message}."""
+    tunnel = SSHTunnel(host) if host.docker_host is None else None
+    try:
+        with phase("connect"):
+            docker_host = tunnel.open() if tunnel else host.docker_host
+        env = {**os.environ, "DOCKER_HOST": docker_host, HOST_LABEL_ENV: host.label}
+        env.pop("DOCKER_CONTEXT", None)
+        with profiled("subprocess", "compose-tree", host=host.label):
+            proc = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=HOST_ANALYSIS_TIMEOUT)
+    except OSError as e:
+        return {"error": str(e)}
+    except subprocess.TimeoutExpired:
+        return {"error": f"analysis timed out after {HOST_ANALYSIS_TIMEOUT}s"}
+    finally:
+        if tunnel:
+            tunnel.close()
+    try:
+        document = json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        lines = proc.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {proc.returncode}"}
+    document.pop("schema_version", None)
+    return document
+
+
+def analyse_hosts(hosts: list[RemoteHost], cmd: list[str]) -> dict[str, dict[str, Any]]:
+    """Analyse every host at once (each is mostly waiting on its network); results in --hosts order."""
+    with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+        documents = list(pool.map(lambda host: analyse_host(host, cmd), hosts))
+    return {host.label: document for host, document in zip(hosts, documents)}
+
+
+def host_matrix(documents: dict[str, dict[str, Any]]) -> dict[str, dict[str, list[str] | None]]:
+    """{service: {host: [trigger, ...] (empty if up to date) or None if the host lacks it}}.
+
+    Services are listed in the order first seen; hosts that failed are left out.
+    """
+    services: dict[str, dict[str, list[str]]] = {}
+    analysed = [label for label, document in documents.items() if "error" not in document]
+    for label in analysed:
+        for record in documents[label].get("services", []):
+            services.setdefault(record["name"], {})[label] = record["triggers"]
+    return {name: {label: by_host.get(label) for label in analysed} for name, by_host in services.items()}
+
+
+def trigger_colour(trigger: str) -> str:
+    """Colour of a RestartTrigger value."""
+    return {
+        RestartTrigger.IMAGE_UPDATED.value: Colour.MAGENTA,
+        RestartTrigger.CONFIG_CHANGED.value: Colour.YELLOW,
+        RestartTrigger.DEPENDENCY_RESTART.value: Colour.CYAN,
+        RestartTrigger.NOT_RUNNING.value: Colour.RED,
+        RestartTrigger.NOT_CREATED.value: Colour.RED,
+    }.get(trigger, "")
+
+
+def print_host_matrix(matrix: dict[str, dict[str, list[str] | None]], hosts: list[str], quiet: bool) -> None:
+    """Print the service × host matrix, one cell per service per host with its restart triggers."""
+    codes = {trigger.value: code for trigger, code in TRIGGER_CODES.items()}
+    rows = [
+        (name, cells) for name, cells in matrix.items()
+        if not quiet or any(cells.get(host) for host in hosts)
+    ]
+
+    def cell(triggers: list[str] | None) -> tuple[str, str]:
+        """(plain text, coloured text) of one cell."""
+        if triggers is None:
+            return "-", f"{Colour.DIM}-{Colour.RESET}"
+        if not triggers:
+            return "ok", f"{Colour.GREEN}ok{Colour.RESET}"
+        text = ",".join(codes.get(t, t) for t in triggers)
+        return text, f"{trigger_colour(triggers[0])}{text}{Colour.RESET}"
+
+    table = [(name, [cell(cells.get(host)) for host in hosts]) for name, cells in rows]
+    name_width = max([len("SERVICE"), *(len(name) for name, _ in table)])
+    widths = [max([len(host), *(len(cells[i][0]) for _, cells in table)]) for i, host in enumerate(hosts)]
+
+    header = "  ".join([f"{'SERVICE':<{name_width}}", *(f"{host:<{w}}" for host, w in zip(hosts, widths))])
+    print(f"{Colour.BOLD}{header.rstrip()}{Colour.RESET}")
+    for name, cells in table:
+        line = [f"{name:<{name_width}}"]
+        line += [coloured + " " * (w - len(plain)) for (plain, coloured), w in zip(cells, widths)]
+        print("  ".join(line).rstrip())
+
+    drifted = [host for host in hosts if any(cells.get(host) for cells in matrix.values())]
+    print()
+    print(f"{len(drifted)} of {len(hosts)} hosts need restarts" + (f": {', '.join(drifted)}" if drifted else ""))
+    if not quiet:
+        legend = ", ".join(f"{code} = {trigger.value}" for trigger, code in TRIGGER_CODES.items())
+        print(f"{Colour.DIM}{legend}; - = not defined on that host{Colour.RESET}")
+
+
+def run_hosts(args: argparse.Namespace) -> int:
+    """--hosts: analyse the compose file against each host's Docker and print one matrix."""
+    if args.watch or args.apply or args.all_projects or args.format == "ndjson":
+        print(
+            f"{Colour.RED}Error:{Colour.RESET} --hosts can't be combined with --watch, --apply, "
+            "--all-projects or --format ndjson",
+            file=sys.stderr,
+        )
+        return 1
+    try:
+        hosts = [RemoteHost.parse(entry.strip()) for entry in args.hosts.split(",") if entry.strip()]
+    except ValueError as e:
+        print(f"{Colour.RED}Error:{Colour.RESET} {e}", file=sys.stderr)
+        return 1
+    labels = [host.label for host in hosts]
+    if not hosts or len(set(labels)) != len(labels):
+        print(f"{Colour.RED}Error:{Colour.RESET} --hosts needs distinct host names", file=sys.stderr)
+        return 1
+    found = find_compose_file(args.file[0] if args.file else None)
+    if not found:
+        print(f"{Colour.RED}Error:{Colour.RESET} No compose file found", file=sys.stderr)
+        return 1
+    compose_file, _ = found
+
+    documents = analyse_hosts(hosts, host_command(args, compose_file))
+    matrix = host_matrix(documents)
+    analysed = [label for label in labels if "error" not in documents[label]]
+
+    if args.format == "json":
+        print_json({"compose_file": str(compose_file), "hosts": documents, "matrix": matrix})
+    else:
+        for label in labels:
+            if "error" in documents[label]:
+                print(f"{Colour.RED}Error:{Colour.RESET} {label}: {documents[label]['error']}", file=sys.stderr)
+        if analysed:
+            print_host_matrix(matrix, analysed, args.quiet)
+
+    needs_restart = any(triggers for cells in matrix.values() for triggers in cells.values())
+    return 1 if needs_restart or len(analysed) < len(labels) else 0
+
+
+def print_cache_stats(quiet: bool) -> None:
+    """Report compose config cache hits/misses and reused inspect snapshots on stderr."""
+    if not quiet and CONFIG_CACHE.enabled:
+        inspected = INSPECT_STORE.hits + INSPECT_STORE.misses
+        snapshots = f"; inspect snapshots: {INSPECT_STORE.hits} reused, {INSPECT_STORE.misses} fetched"
+        print(
+            f"{Colour.DIM}config cache: {CONFIG_CACHE.hits} hits, {CONFIG_CACHE.misses} misses"
+            f"{snapshots if inspected else ''}{Colour.RESET}",
+            file=sys.stderr,
+        )
+
+
+def print_host_projects(
+    results: dict[str, dict[str, ServiceStatus] | None], quiet: bool, output_format: str = "tree"
+) -> int:
+    """Print one section per project; quiet mode prints project/service names."""
+    if not results:
+        print(f"{Colour.RED}Error:{Colour.RESET} No compose projects found on this host", file=sys.stderr)
+        return 1
+
+    error = "compose files not found or could not be parsed"
+    if output_format == "json":
+        print_json({"projects": [
+            {"project": name, "error": error} if statuses is None else project_document(name, statuses)
+            for name, statuses in results.items()
+        ]})
+    elif output_format == "ndjson":
+        for name, statuses in results.items():
+            if statuses is None:
+                emit_ndjson("error", name, error=error)
+                continue
+            emit_ndjson("project", name, services=len(statuses))
+            for status in statuses.values():
+                emit_ndjson("service", name, **status_record(status, statuses))
+            emit_ndjson("summary", name, **project_summary(statuses), timings_ms=timings_ms())
+    else:
+        for name, statuses in results.items():
+            if statuses is None:
+                print(f"{Colour.RED}Error:{Colour.RESET} {name}: {error}", file=sys.stderr)
+            elif quiet:
+                for service in sorted(s for s, status in statuses.items() if status.needs_restart):
+                    print(f"{name}/{service}")
+            else:
+                print_tree_output(statuses, project=name)
+
+    needs_restart = any(
+        status.needs_restart for statuses in results.values() if statuses for status in statuses.values()
+    )
+    return 1 if needs_restart or None in results.values() else 0
+
+
+def find_compose_file(path: Path | None) -> tuple[Path, Path] | None:
+    """Resolve -f (or the default compose file in the current directory) to (file, project dir)."""
+    if path:
+        compose_file = path.resolve()
+        project_dir = compose_file.parent
+    else:
+        project_dir = Path.cwd()
+        # Try common names
+        compose_file = next(
+            (
+                project_dir / name
+                for name in ["docker-compose.yaml", "docker-compose.yml", "compose.yaml", "compose.yml"]
+                if (project_dir / name).exists()
+            ),
+            None,
+        )
+    if not compose_file or not compose_file.exists():
+        return None
+    return compose_file, project_dir
+
+
+def run_serve(args: argparse.Namespace) -> int:
+    """Load the projects to serve (each -f, or every project on the host) and serve them."""
+    if args.watch or args.apply or args.quiet or args.hosts or args.format != "tree":
+        print(
+            f"{Colour.RED}Error:{Colour.RESET} serve can't be combined with --watch, --apply, --quiet, --hosts "
+            "or --format",
+            file=sys.stderr,
+        )
+        return 1
+
+    if args.all_projects:
+        projects = load_host_projects()
+    else:
+        found = [find_compose_file(path) for path in args.file or [None]]
+        if None in found:
+            print(f"{Colour.RED}Error:{Colour.RESET} No compose file found", file=sys.stderr)
+            return 1
+        loaded = run_parallel([
+            lambda compose_file=compose_file, project_dir=project_dir: load_project(compose_file, project_dir)
+            for compose_file, project_dir in found
+        ])
+        projects = {}
+        for (compose_file, project_dir), project in zip(found, loaded):
+            if not project:
+                print(f"{Colour.RED}Error:{Colour.RESET} Could not parse {compose_file}", file=sys.stderr)
+                return 1
+            name = project.name
+            if name in projects:
+                print(f"{Colour.RED}Error:{Colour.RESET} project {name} given more than once", file=sys.stderr)
+                return 1
+            projects[name] = project
+
+    if not projects:
+        print(f"{Colour.RED}Error:{Colour.RESET} No compose projects found on this host", file=sys.stderr)
+        return 1
+    return serve(projects, args.socket, args.listen)
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the analysis selected on the command line; returns the exit code."""
+    if args.command == "serve":
+        return run_serve(args)
+
+    if args.file and len(args.file) > 1:
+        print(f"{Colour.RED}Error:{Colour.RESET} more than one -f is only supported by serve", file=sys.stderr)
+        return 1
+
+    if args.hosts:
+        return run_hosts(args)
+
+    if args.watch and args.format != "tree":
+        print(f"{Colour.RED}Error:{Colour.RESET} --watch only supports --format tree", file=sys.stderr)
+        return 1
+
+    if args.apply and (args.watch or args.all_projects or args.format != "tree"):
+        print(
+            f"{Colour.RED}Error:{Colour.RESET} --apply works on a single project with --format tree",
+            file=sys.stderr,
+        )
+        return 1
+
+    if args.all_projects:
+        if args.watch:
+            print(f"{Colour.RED}Error:{Colour.RESET} --watch can't be combined with --all-projects", file=sys.stderr)
+            return 1
+        code = print_host_projects(analyse_host_projects(), args.quiet, args.format)
+        print_cache_stats(args.quiet)
+        return code
+
+    # Determine compose file and project directory
+    found = find_compose_file(args.file[0] if args.file else None)
+    if not found:
+        print(f"{Colour.RED}Error:{Colour.RESET} No compose file found", file=sys.stderr)
+        return 1
+    compose_file, project_dir = found
+
+    # Analyse services
+    if args.watch:
+        project = load_project(compose_file, project_dir)
+        if not project:
+            print(f"{Colour.RED}Error:{Colour.RESET} Could not parse compose file", file=sys.stderr)
+            return 1
+        return watch_project(project, args.quiet)
+
+    # ndjson checks services lazily so each record goes out as soon as it's final
+    project = load_project(compose_file, project_dir, check=args.format != "ndjson")
+    if not project:
+        statuses = {}
+    elif args.format == "ndjson":
+        statuses = stream_project(project)
+    else:
+        with phase("propagate"):
+            statuses = project.statuses()
+        if args.format == "json":
+            name = project.name
+            print_json({"project": name, "compose_file": str(compose_file), **project_document(name, statuses)})
+    if not statuses:
+        print(f"{Colour.RED}Error:{Colour.RESET} No services found or could not parse compose file", file=sys.stderr)
+        return 1
+
+    # Output results
+    if args.format == "tree":
+        render(statuses, args.quiet)
+    print_cache_stats(args.quiet)
+
+    if args.apply:
+        return apply_restarts(project, statuses, args.max_parallel, args.health_timeout)
+
+    # Exit with 0 if nothing needs restart, 1 otherwise
+    return 1 if any(s.needs_restart for s in statuses.values()) else 0
+
+
 def main() -> int:
     """Main entry point."""
     parser = argparse.ArgumentParser(
@@ -1097,12 +3722,23 @@ Examples:
   %(prog)s                          # Analyse docker-compose.yaml in current dir
   %(prog)s -f compose.yaml          # Analyse specific file
   %(prog)s -f docker-compose.yaml --no-colour  # Plain text output
+  %(prog)s serve -f a/compose.yaml -f b/compose.yaml  # Keep both analysed, answer queries on a socket
         """,
     )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["check", "serve"],
+        default="check",
+        help="check: analyse once and exit (default); serve: keep the analysis warm and "
+             "answer JSON queries over a unix socket or localhost HTTP",
+    )
     parser.add_argument(
         "-f", "--file",
         type=Path,
-        help="Path to docker-compose file (default: docker-compose.yaml)",
+        action="append",
+        help="Path to docker-compose file (default: docker-compose.yaml); "
+             "serve accepts several, one per project",
     )
     parser.add_argument(
         "--no-colour", "--no-color",
@@ -1114,57 +3750,161 @@ Examples:
         action="store_true",
         help="Only show services that need restart",
     )
+    parser.add_argument(
+        "--format",
+        choices=["tree", "json", "ndjson"],
+        default="tree",
+        help="Output format: coloured tree (default), one JSON document, or one JSON "
+             "record per line, streamed as each service's analysis completes",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
         help="Show debug info for mismatches",
     )
+    parser.add_argument(
+        "--full-diff",
+        action="store_true",
+        help="Diff every service's config against its container, even when compose's "
+             "config hash shows it unchanged",
+    )
+    parser.add_argument(
+        "--fields",
+        metavar="LIST",
+        help=f"Comma-separated config fields to compare (default: all of {','.join(COMPARATORS)})",
+    )
+    parser.add_argument(
+        "--skip-fields",
+        metavar="LIST",
+        help="Comma-separated config fields not to compare",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["cli", "api"],
+        default="cli",
+        help="Talk to docker via the CLI or directly to the Engine API socket "
+             "(api falls back to the CLI if the socket is unavailable)",
+    )
+    parser.add_argument(
+        "--experimental-native-loader",
+        action="store_true",
+        help="EXPERIMENTAL: resolve compose files in-process instead of with `docker compose "
+             "config` (not yet verified against the CLI; falls back to it for files it can't resolve)",
+    )
+    parser.add_argument(
+        "-a", "--all-projects",
+        action="store_true",
+        help="Analyse every compose project with containers on this host",
+    )
+    parser.add_argument(
+        "--hosts",
+        metavar="LIST",
+        help="Comma-separated Docker hosts ([ssh://][user@]host[:port], unix:// or tcp://) to analyse "
+             "the compose file against in parallel, one SSH connection each; prints a service × host matrix",
+    )
+    parser.add_argument(
+        "-w", "--watch",
+        action="store_true",
+        help="Keep running and re-analyse on compose/env file changes and docker events",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Don't read or write the compose config cache or inspect snapshots ({CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached compose config and inspect snapshots, and fetch them again",
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Restart the services that need it, in dependency-ordered waves of "
+             "`docker compose up -d --no-deps`",
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=int,
+        default=0,
+        metavar="N",
+        help="With --apply, restart at most N services at a time (default: 0, a whole wave at once)",
+    )
+    parser.add_argument(
+        "--health-timeout",
+        type=float,
+        default=DEFAULT_HEALTH_TIMEOUT,
+        metavar="SECONDS",
+        help="With --apply, how long to wait for restarted services to be running and healthy "
+             f"before the next wave; 0 skips the wait (default: {DEFAULT_HEALTH_TIMEOUT})",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        metavar="PATH",
+        help=f"With serve, the unix socket to listen on (default: {DEFAULT_SERVE_SOCKET})",
+    )
+    parser.add_argument(
+        "--listen",
+        metavar="[HOST:]PORT",
+        help="With serve, listen for HTTP on HOST:PORT (default host 127.0.0.1) instead of a unix socket",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a timing breakdown (phases, docker calls, slowest services) to stderr",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        type=Path,
+        metavar="FILE",
+        help="Also write a Chrome trace-event JSON file (implies --profile)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        metavar="N",
+        help=f"Maximum concurrent docker calls (default: {DEFAULT_JOBS})",
+    )
 
     args = parser.parse_args()
+    set_jobs(args.jobs)
 
     # Set global debug flag
-    global DEBUG
+    global DEBUG, DOCKER_API, PROFILER, CONFIG_HASH_CHECK, CONFIG_FIELDS, NATIVE_LOADER
     DEBUG = args.debug
+    NATIVE_LOADER = args.experimental_native_loader
+    CONFIG_HASH_CHECK = not args.full_diff
 
-    # Disable colours if requested or not a TTY
-    if args.no_colour or not sys.stdout.isatty():
-        Colour.disable()
+    fields = args.fields.split(",") if args.fields else list(COMPARATORS)
+    skipped = args.skip_fields.split(",") if args.skip_fields else []
+    unknown = sorted(set(fields + skipped) - set(COMPARATORS))
+    if unknown:
+        parser.error(f"unknown config fields: {', '.join(unknown)} (choose from {', '.join(COMPARATORS)})")
+    CONFIG_FIELDS = tuple(name for name in COMPARATORS if name in fields and name not in skipped)
 
-    # Determine compose file and project directory
-    compose_file = args.file
-    if compose_file:
-        compose_file = compose_file.resolve()
-        project_dir = compose_file.parent
-    else:
-        project_dir = Path.cwd()
-        # Try common names
-        for name in ["docker-compose.yaml", "docker-compose.yml", "compose.yaml", "compose.yml"]:
-            candidate = project_dir / name
-            if candidate.exists():
-                compose_file = candidate
-                break
+    if args.profile or args.profile_trace:
+        PROFILER = Profiler()
 
-    if not compose_file or not compose_file.exists():
-        print(f"{Colour.RED}Error:{Colour.RESET} No compose file found", file=sys.stderr)
-        return 1
+    CONFIG_CACHE.enabled = INSPECT_STORE.enabled = not args.no_cache
+    CONFIG_CACHE.refresh = INSPECT_STORE.refresh = args.refresh
 
-    # Analyse services
-    statuses = analyse_services(compose_file, project_dir)
-    if not statuses:
-        print(f"{Colour.RED}Error:{Colour.RESET} No services found or could not parse compose file", file=sys.stderr)
-        return 1
+    if args.backend == "api":
+        DOCKER_API = DockerAPIClient.from_env(args.jobs)
+        if DOCKER_API is None:
+            debug("Engine API socket unavailable, using the docker CLI")
 
-    # Output results
-    if args.quiet:
-        need_restart = [name for name, s in statuses.items() if s.needs_restart]
-        if need_restart:
-            for name in sorted(need_restart):
-                print(name)
-    else:
-        print_tree_output(statuses)
+    # Disable colours if requested or not a TTY; JSON details are always plain text
+    if args.no_colour or args.format != "tree" or args.command == "serve" or not sys.stdout.isatty():
+        Colour.disable()
 
-    # Exit with 0 if nothing needs restart, 1 otherwise
-    return 1 if any(s.needs_restart for s in statuses.values()) else 0
+    code = run(args)
+    if PROFILER:
+        PROFILER.report()
+        if args.profile_trace:
+            PROFILER.write_trace(args.profile_trace)
+    return code
 
 
 if __name__ == "__main__":
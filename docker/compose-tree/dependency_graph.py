@@ -0,0 +1,157 @@
+"""
+Service dependency graph for compose-tree.
+
+Builds the depends_on/links graph of a compose config, orders it dependencies
+first, finds dependency cycles and works out which dependents restart when
+some services do. Knows nothing about containers or restart reasons: callers
+in compose_tree.py turn its results into ServiceStatus updates.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Collection, Iterable
+
+
+def build_dependency_graph(
+    compose_config: dict[str, Any],
+) -> dict[str, list[str]]:
+    """Build a mapping of service -> services it depends on."""
+    services = compose_config.get("services", {})
+    dependencies: dict[str, list[str]] = {}
+
+    for service_name, service_cfg in services.items():
+        deps = []
+
+        # Handle depends_on (both list and dict formats)
+        depends_on = service_cfg.get("depends_on", {})
+        if isinstance(depends_on, list):
+            deps.extend(depends_on)
+        elif isinstance(depends_on, dict):
+            deps.extend(depends_on.keys())
+
+        # Handle links (legacy)
+        links = service_cfg.get("links", [])
+        for link in links:
+            # Links can be "service" or "service:alias"
+            dep_service = link.split(":")[0]
+            if dep_service not in deps:
+                deps.append(dep_service)
+
+        dependencies[service_name] = deps
+
+    return dependencies
+
+
+def build_dependents_graph(
+    dependencies: dict[str, list[str]],
+) -> dict[str, list[str]]:
+    """Build inverse mapping: service -> services that depend on it."""
+    dependents: dict[str, list[str]] = {name: [] for name in dependencies}
+
+    for service, deps in dependencies.items():
+        for dep in deps:
+            if dep in dependents:
+                dependents[dep].append(service)
+
+    return dependents
+
+
+class DependencyGraph:
+    """Service dependency graph, built once per compose config.
+
+    Holds both directions plus a topological order (dependencies first).
+    Services on or behind a dependency cycle can't be ordered; the cycles
+    themselves are listed in `cycles`.
+    """
+
+    def __init__(self, dependencies: dict[str, list[str]]) -> None:
+        self.dependencies = dependencies
+        self.dependents = build_dependents_graph(dependencies)
+        self.order, self.cycles = self._topological_order()
+
+    @classmethod
+    def from_config(cls, compose_config: dict[str, Any]) -> DependencyGraph:
+        return cls(build_dependency_graph(compose_config))
+
+    def _topological_order(self) -> tuple[list[str], list[list[str]]]:
+        """Kahn's algorithm; whatever is left over is on or downstream of a cycle."""
+        pending = {
+            name: sum(1 for dep in deps if dep in self.dependencies)
+            for name, deps in self.dependencies.items()
+        }
+        ready = deque(name for name, count in pending.items() if count == 0)
+        order: list[str] = []
+        while ready:
+            current = ready.popleft()
+            order.append(current)
+            for dependent in self.dependents[current]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+
+        # Every leftover service has a leftover dependency, so following those
+        # from any leftover service must eventually revisit one: that's a cycle.
+        # Leftovers are walked in declaration order so cycles are reported stably.
+        leftover = {name for name, count in pending.items() if count > 0}
+        cycles: list[list[str]] = []
+        visited: set[str] = set()
+        for start in (name for name in self.dependencies if name in leftover):
+            path: list[str] = []
+            position: dict[str, int] = {}
+            current = start
+            while current not in visited:
+                visited.add(current)
+                position[current] = len(path)
+                path.append(current)
+                current = next(dep for dep in self.dependencies[current] if dep in leftover)
+            if current in position:
+                cycles.append(path[position[current]:] + [current])
+        return order, cycles
+
+    def waves(self, services: Iterable[str]) -> list[list[str]]:
+        """Group services into restart waves, each after all of its dependencies.
+
+        Only dependencies within `services` count (the rest keep running), so
+        the number of waves is the depth of the restart set, not of the whole
+        graph. Services on dependency cycles can't be ordered and go last.
+        """
+        pending = set(services)
+        depth: dict[str, int] = {}
+        for name in self.order:
+            if name in pending:
+                depth[name] = 1 + max(
+                    (depth[dep] for dep in self.dependencies[name] if dep in depth), default=-1
+                )
+        waves: list[list[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name, level in depth.items():
+            waves[level].append(name)
+        unordered = sorted(pending - depth.keys())
+        if unordered:
+            waves.append(unordered)
+        return [sorted(wave) for wave in waves]
+
+    def restarting_dependents(self, roots: Iterable[str], services: Collection[str]) -> dict[str, list[str]]:
+        """Dependents that restart because `roots` do, transitively.
+
+        Returns {dependent: its restarting direct dependencies, in declaration
+        order}. Only dependents in `services` are followed. Roots that depend
+        on another restarting service are included too.
+        """
+        to_process = deque(roots)
+        restarting = set(to_process)
+        triggers: dict[str, list[str]] = {}
+        # Breadth-first over dependents; the restarting set also makes cycles terminate
+        while to_process:
+            current = to_process.popleft()
+            for dependent in self.dependents.get(current, []):
+                if dependent not in services:
+                    continue
+                triggers.setdefault(dependent, []).append(current)
+                if dependent not in restarting:
+                    restarting.add(dependent)
+                    to_process.append(dependent)
+        return {
+            name: sorted(set(deps), key=self.dependencies[name].index)
+            for name, deps in triggers.items()
+        }
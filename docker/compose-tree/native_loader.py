@@ -0,0 +1,1077 @@
+"""
+EXPERIMENTAL in-process compose loader for compose-tree (--experimental-native-loader).
+
+Resolves compose files the way `docker compose config --format json` does,
+without a subprocess: a YAML parser for the subset compose files use, then
+includes, extends, override files, profiles, interpolation and env_file.
+Anything it can't resolve exactly raises ComposeLoadError, and compose-tree
+falls back to the CLI.
+
+Not yet verified against a real `docker compose`: test/loader_equiv.py has no
+recorded CLI output for its fixtures (see --update there). Off by default.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+import re
+import shlex
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_]\w*")
+
+
+class YAMLError(ValueError):
+    """A compose file uses YAML the native loader doesn't understand (or isn't valid YAML)."""
+
+
+YAML_NULLS = {"", "~", "null", "Null", "NULL"}
+YAML_BOOLS = {"true": True, "True": True, "TRUE": True, "false": False, "False": False, "FALSE": False}
+YAML_INT_RE = re.compile(r"[-+]?(?:0|[1-9][0-9]*)")
+YAML_FLOAT_RE = re.compile(r"[-+]?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][-+]?[0-9]+)?")
+YAML_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "0": "\0", "\\": "\\", '"': '"', "/": "/", " ": " ", "e": "\x1b"}
+
+
+def yaml_scalar(text: str) -> Any:
+    """Resolve a plain scalar the way the YAML 1.2 core schema (and compose) does."""
+    if text in YAML_NULLS:
+        return None
+    if text in YAML_BOOLS:
+        return YAML_BOOLS[text]
+    if YAML_INT_RE.fullmatch(text):
+        return int(text)
+    if text.startswith(("0x", "0o")) and len(text) > 2:
+        try:
+            return int(text, 0)
+        except ValueError:
+            return text
+    if YAML_FLOAT_RE.fullmatch(text) and any(c.isdigit() for c in text):
+        return float(text)
+    return text
+
+
+def unquote_double(body: str) -> str:
+    """Contents of a double-quoted scalar with its escapes applied."""
+    out: list[str] = []
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if ch != "\\":
+            out.append(ch)
+            i += 1
+            continue
+        code = body[i + 1:i + 2]
+        if code in YAML_ESCAPES:
+            out.append(YAML_ESCAPES[code])
+            i += 2
+        elif code in ("x", "u", "U"):
+            width = {"x": 2, "u": 4, "U": 8}[code]
+            try:
+                out.append(chr(int(body[i + 2:i + 2 + width], 16)))
+            except ValueError:
+                raise YAMLError(f"bad escape in {body!r}") from None
+            i += 2 + width
+        else:
+            raise YAMLError(f"unsupported escape \\{code} in {body!r}")
+    return "".join(out)
+
+
+def fold_quoted(text: str, double: bool = False) -> str:
+    """Join a multi-line quoted scalar: line breaks become spaces, blank lines newlines.
+
+    In double quotes a backslash at the end of a line escapes the break (no space is added).
+    """
+    lines = text.split("\n")
+    if len(lines) == 1:
+        return text
+    out = ""
+    joined = False
+    blanks = 0
+    for n, line in enumerate(lines):
+        content = line.lstrip(" \t") if n else line
+        escaped = False
+        if n < len(lines) - 1:
+            stripped = content.rstrip(" \t")
+            escaped = double and (len(stripped) - len(stripped.rstrip("\\"))) % 2 == 1
+            content = content[:-1] if escaped and content.endswith("\\") else stripped
+            if n and not content and not escaped:
+                blanks += 1
+                continue
+        if n:
+            out += "\n" * blanks if joined or blanks else " "
+        out += content
+        joined, blanks = escaped, 0
+    return out
+
+
+class YAMLParser:
+    """Parser for the block-style YAML subset compose files use.
+
+    Handles block mappings and sequences, flow collections, plain/quoted/block
+    scalars, comments, anchors, aliases and `<<` merge keys. Anything else
+    (tags, complex keys, multiple documents) raises YAMLError so callers can
+    fall back to `docker compose config`.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.lines = text.replace("\r\n", "\n").split("\n")
+        self.pos = 0
+        self.anchors: dict[str, Any] = {}
+
+    # Lines -------------------------------------------------------------------
+
+    def peek(self) -> tuple[int, str] | None:
+        """(indent, content) of the next line holding a node, skipping blanks and comments."""
+        while self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                self.pos += 1
+                continue
+            if stripped in ("---", "...") and not line[0].isspace():
+                if self.pos and stripped == "---" and any(
+                    l.strip() and not l.strip().startswith("#") for l in self.lines[:self.pos]
+                ):
+                    raise YAMLError("multiple YAML documents")
+                self.pos += 1
+                continue
+            if "\t" in line[:len(line) - len(line.lstrip())]:
+                raise YAMLError(f"line {self.pos + 1}: tab in indentation")
+            return len(line) - len(line.lstrip(" ")), line.strip()
+        return None
+
+    @staticmethod
+    def strip_comment(text: str) -> str:
+        """Drop a trailing `# comment` from plain text (quoted and flow values handle their own)."""
+        if text.startswith("#"):
+            return ""
+        match = re.search(r"[ \t]#", text)
+        return (text[:match.start()] if match else text).rstrip()
+
+    @staticmethod
+    def split_key(text: str) -> tuple[str, str] | None:
+        """Split "key: value" (or "key:") into key and rest; None if it isn't a mapping entry."""
+        if text.startswith(("'", '"')):
+            quote = text[0]
+            end = YAMLParser.closing_quote(text, 0)
+            if end is None:
+                return None
+            rest = text[end + 1:]
+            if rest == ":" or rest.startswith(": "):
+                raw = text[1:end]
+                key = raw.replace("''", "'") if quote == "'" else unquote_double(raw)
+                return key, rest[1:].strip()
+            return None
+        if text.startswith(("[", "{", "- ", "&", "*", "!", "|", ">")) or text == "-":
+            return None
+        for i, ch in enumerate(text):
+            if ch == ":" and (i + 1 == len(text) or text[i + 1] in " \t"):
+                key = text[:i].rstrip()
+                if not key:
+                    return None
+                return key, text[i + 1:].strip()
+            if ch == "#" and i and text[i - 1] in " \t":
+                return None
+        return None
+
+    # Nodes -------------------------------------------------------------------
+
+    def parse(self) -> Any:
+        head = self.peek()
+        if head is None:
+            return None
+        value = self.parse_block(head[0])
+        if self.peek() is not None:
+            raise YAMLError(f"line {self.pos + 1}: unexpected content")
+        return value
+
+    def parse_block(self, indent: int) -> Any:
+        """Parse the node starting on the next line, which is at `indent`."""
+        _, content = self.peek()
+        if content == "-" or content.startswith("- "):
+            return self.parse_sequence(indent)
+        if self.split_key(content) is not None:
+            return self.parse_mapping(indent)
+        self.pos += 1
+        return self.parse_inline(content, indent - 1)
+
+    def parse_mapping(self, indent: int) -> dict[str, Any]:
+        explicit: dict[str, Any] = {}
+        merged: list[dict[str, Any]] = []
+        while True:
+            head = self.peek()
+            if head is None or head[0] < indent:
+                break
+            if head[0] > indent:
+                raise YAMLError(f"line {self.pos + 1}: bad indentation")
+            entry = self.split_key(head[1])
+            if entry is None:
+                if head[1] == "-" or head[1].startswith("- "):
+                    break
+                raise YAMLError(f"line {self.pos + 1}: expected a mapping entry")
+            key, rest = entry
+            self.pos += 1
+            value = self.parse_value(rest, indent, in_mapping=True)
+            if key == "<<":
+                sources = value if isinstance(value, list) else [value]
+                if not all(isinstance(source, dict) for source in sources):
+                    raise YAMLError(f"line {self.pos}: merge key needs mappings")
+                merged.extend(sources)
+            elif key in explicit:
+                raise YAMLError(f"line {self.pos}: duplicate key {key!r}")
+            else:
+                explicit[key] = value
+        if not merged:
+            return explicit
+        # Explicit keys win; among merged mappings, earlier ones win
+        result: dict[str, Any] = {}
+        for source in reversed(merged):
+            result.update(copy.deepcopy(source))
+        result.update(explicit)
+        return result
+
+    def parse_sequence(self, indent: int) -> list[Any]:
+        items: list[Any] = []
+        while True:
+            head = self.peek()
+            if head is None or head[0] != indent or not (head[1] == "-" or head[1].startswith("- ")):
+                if head is not None and head[0] > indent:
+                    raise YAMLError(f"line {self.pos + 1}: bad indentation")
+                break
+            line = self.lines[self.pos]
+            content = head[1][1:].lstrip()
+            column = len(line) - len(line.lstrip(" ")) + len(head[1]) - len(content)
+            if not content or content.startswith("#"):
+                self.pos += 1
+                items.append(self.parse_value("", indent))
+            elif content == "-" or content.startswith("- ") or self.split_key(content) is not None:
+                # "- key: value" / "- - item": the rest of the line opens a nested block at its column
+                self.lines[self.pos] = " " * column + content
+                items.append(self.parse_block(column))
+            else:
+                self.pos += 1
+                items.append(self.parse_value(content, indent))
+        return items
+
+    def parse_value(self, rest: str, indent: int, in_mapping: bool = False) -> Any:
+        """The value after "key:" or "- " on a line already consumed; may continue on later lines."""
+        anchor = None
+        while rest.startswith(("&", "!")):
+            prop, _, rest = rest.partition(" ")
+            rest = rest.strip()
+            if prop.startswith("!"):
+                raise YAMLError(f"line {self.pos}: tag {prop} not supported")
+            anchor = prop[1:]
+        if rest.startswith("#"):
+            rest = ""
+        if rest.startswith("*"):
+            name = self.strip_comment(rest)[1:]
+            if name not in self.anchors:
+                raise YAMLError(f"line {self.pos}: unknown alias *{name}")
+            value = copy.deepcopy(self.anchors[name])
+        elif rest.startswith(("|", ">")):
+            value = self.parse_block_scalar(self.strip_comment(rest), indent)
+        elif rest:
+            value = self.parse_inline(rest, indent)
+        else:
+            head = self.peek()
+            if head is not None and head[0] > indent:
+                value = self.parse_block(head[0])
+            elif (
+                head is not None and in_mapping and head[0] == indent
+                and (head[1] == "-" or head[1].startswith("- "))
+            ):
+                # Compose files often write "key:\n- item" with the list at the key's indent
+                value = self.parse_sequence(indent)
+            else:
+                value = None
+        if anchor:
+            self.anchors[anchor] = value
+        return value
+
+    def continuation(self, indent: int) -> list[str]:
+        """Following lines indented deeper than `indent` (multi-line scalars and flow collections)."""
+        lines = []
+        while self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            if line.strip() and len(line) - len(line.lstrip(" ")) <= indent:
+                break
+            lines.append(line)
+            self.pos += 1
+        while lines and not lines[-1].strip():
+            lines.pop()
+            self.pos -= 1
+        return lines
+
+    def parse_inline(self, text: str, indent: int) -> Any:
+        """A scalar or flow collection starting with `text`, possibly continued on deeper lines."""
+        if text[0] in "[{":
+            source = text
+            while True:
+                try:
+                    value, end = self.parse_flow(source, 0)
+                except IndexError:
+                    more = self.continuation(indent)
+                    if not more:
+                        raise YAMLError(f"line {self.pos}: unterminated flow collection") from None
+                    source += "\n" + "\n".join(more)
+                    continue
+                if self.strip_comment(source[end:]).strip():
+                    raise YAMLError(f"line {self.pos}: unexpected {source[end:].strip()!r}")
+                return value
+        if text[0] in "'\"":
+            source = text
+            while True:
+                end = self.closing_quote(source, 0)
+                if end is not None:
+                    break
+                more = self.continuation(indent)
+                if not more:
+                    raise YAMLError(f"line {self.pos}: unterminated quoted scalar")
+                source += "\n" + "\n".join(more)
+            if self.strip_comment(source[end + 1:]).strip():
+                raise YAMLError(f"line {self.pos}: unexpected text after quoted scalar")
+            body = fold_quoted(source[1:end], double=source[0] == '"')
+            return body.replace("''", "'") if source[0] == "'" else unquote_double(body)
+        text = self.strip_comment(text)
+        more = [self.strip_comment(line).strip() for line in self.continuation(indent)]
+        if any(self.split_key(line) is not None for line in more if line):
+            raise YAMLError(f"line {self.pos}: mapping entry after a scalar")
+        if not more:
+            return yaml_scalar(text)
+        return fold_quoted("\n".join([text, *more]))
+
+    @staticmethod
+    def closing_quote(text: str, start: int) -> int | None:
+        """Index of the quote closing the scalar opened at text[start], or None."""
+        quote = text[start]
+        i = start + 1
+        while i < len(text):
+            if text[i] == "\\" and quote == '"':
+                i += 2
+                continue
+            if text[i] == quote:
+                if quote == "'" and text[i + 1:i + 2] == "'":
+                    i += 2
+                    continue
+                return i
+            i += 1
+        return None
+
+    @staticmethod
+    def skip_space(text: str, i: int, commas: bool = False) -> int:
+        """Index of the next token in a flow collection, past whitespace, comments (and commas).
+
+        IndexError if the text ends first, i.e. the collection continues on a later line.
+        """
+        while True:
+            ch = text[i]
+            if ch == "#" and (i == 0 or text[i - 1] in " \n"):
+                end = text.find("\n", i)
+                if end == -1:
+                    raise IndexError
+                i = end
+            elif ch in " \n" or (commas and ch == ","):
+                i += 1
+            else:
+                return i
+
+    def parse_flow(self, text: str, i: int) -> tuple[Any, int]:
+        """Parse a flow node at text[i]; returns (value, index after it). IndexError if unterminated."""
+        i = self.skip_space(text, i)
+        ch = text[i]
+        if ch in "[{":
+            closing = "]" if ch == "[" else "}"
+            items: list[Any] = []
+            mapping: dict[str, Any] = {}
+            i += 1
+            while True:
+                i = self.skip_space(text, i, commas=True)
+                if text[i] == closing:
+                    return (items if ch == "[" else mapping), i + 1
+                if text[i] in "]}":
+                    raise YAMLError(f"line {self.pos}: unbalanced {text[i]!r} in flow collection")
+                key, i = self.parse_flow(text, i)
+                i = self.skip_space(text, i)
+                if ch == "{" or text[i] == ":":
+                    value = None
+                    if text[i] == ":":
+                        i = self.skip_space(text, i + 1)
+                        if text[i] not in ",}]":
+                            value, i = self.parse_flow(text, i)
+                    if ch == "{":
+                        mapping[str(key) if key is not None else ""] = value
+                    else:
+                        items.append({key: value})
+                else:
+                    items.append(key)
+                i = self.skip_space(text, i)
+                if text[i] not in ",]}":
+                    raise YAMLError(f"line {self.pos}: expected ',' in flow collection")
+        if ch in "'\"":
+            end = self.closing_quote(text, i)
+            if end is None:
+                raise IndexError
+            body = fold_quoted(text[i + 1:end], double=ch == '"')
+            return (body.replace("''", "'") if ch == "'" else unquote_double(body)), end + 1
+        if ch == "*":
+            match = re.match(r"\*([^\s,\]}]+)", text[i:])
+            if not match or match.group(1) not in self.anchors:
+                raise YAMLError(f"line {self.pos}: unknown alias in flow collection")
+            return copy.deepcopy(self.anchors[match.group(1)]), i + match.end()
+        start = i
+        while i < len(text) and text[i] not in ",]}" and not (
+            (text[i] == ":" and text[i + 1:i + 2] in (" ", "\n", ",")) or (text[i] == "#" and text[i - 1] in " \n")
+        ):
+            i += 1
+        if i == len(text):
+            raise IndexError
+        return yaml_scalar(fold_quoted(text[start:i].strip())), i
+
+    def parse_block_scalar(self, header: str, indent: int) -> str:
+        """A `|` (literal) or `>` (folded) scalar with optional chomping/indentation indicators."""
+        style, indicators = header[0], header[1:]
+        chomp = "-" if "-" in indicators else "+" if "+" in indicators else ""
+        digits = "".join(c for c in indicators if c.isdigit())
+        if indicators.strip("+-0123456789"):
+            raise YAMLError(f"line {self.pos}: bad block scalar header {header!r}")
+        lines = []
+        while self.pos < len(self.lines):
+            line = self.lines[self.pos]
+            if line.strip() and len(line) - len(line.lstrip(" ")) <= indent:
+                break
+            lines.append(line)
+            self.pos += 1
+        content_indent = indent + int(digits) if digits else min(
+            (len(l) - len(l.lstrip(" ")) for l in lines if l.strip()), default=indent + 1
+        )
+        body = [l[content_indent:] if l.strip() else "" for l in lines]
+        trailing = 0
+        while body and not body[-1]:
+            body.pop()
+            trailing += 1
+        if style == "|":
+            text = "\n".join(body)
+        else:
+            # Folded: single line breaks become spaces, except around more-indented lines
+            text = body[0] if body else ""
+            blanks = 0
+            previous = text
+            for line in body[1:]:
+                if not line:
+                    blanks += 1
+                    continue
+                if line.startswith(" ") or previous.startswith(" "):
+                    text += "\n" * (blanks + 1) + line
+                else:
+                    text += ("\n" * blanks or " ") + line
+                blanks = 0
+                previous = line
+        if not body:
+            return "" if chomp != "+" else "\n" * trailing
+        if chomp == "-":
+            return text
+        if chomp == "+":
+            # The line count retained; pos may have eaten trailing blank lines belonging to the scalar
+            return text + "\n" + "\n" * trailing
+        return text + "\n"
+
+
+def parse_yaml(text: str) -> Any:
+    """Parse a compose file (see YAMLParser for the supported subset)."""
+    return YAMLParser(text).parse()
+
+
+class ComposeLoadError(Exception):
+    """The native loader can't resolve a project exactly as `docker compose config` would."""
+
+
+# Service fields merged by key (override files, extends); other mappings are merged recursively
+MERGE_BY_KEY_FIELDS = {"environment", "labels", "depends_on", "networks", "sysctls", "ulimits", "extra_hosts"}
+# Service fields whose lists the override replaces rather than extends
+REPLACE_FIELDS = {"command", "entrypoint"}
+PORT_RANGE_RE = re.compile(r"(\d+)(?:-(\d+))?")
+PROJECT_NAME_RE = re.compile(r"[^a-z0-9_-]")
+
+# Parsed compose files: {path: ((mtime_ns, size), document)}
+_yaml_cache: dict[Path, tuple[tuple[int, int], Any]] = {}
+
+
+def read_compose_document(path: Path) -> dict[str, Any]:
+    """Parse a compose file, memoised by (mtime, size); callers get their own copy."""
+    try:
+        st = path.stat()
+        fingerprint = (st.st_mtime_ns, st.st_size)
+        cached = _yaml_cache.get(path)
+        if cached and cached[0] == fingerprint:
+            return copy.deepcopy(cached[1])
+        document = parse_yaml(path.read_text())
+    except OSError as e:
+        raise ComposeLoadError(f"{path}: {e.strerror}") from e
+    except YAMLError as e:
+        raise ComposeLoadError(f"{path}: {e}") from e
+    if document is None:
+        document = {}
+    if not isinstance(document, dict):
+        raise ComposeLoadError(f"{path}: top level is not a mapping")
+    _yaml_cache[path] = (fingerprint, document)
+    return copy.deepcopy(document)
+
+
+def interpolate(text: str, lookup: Callable[[str], tuple[str, str] | None]) -> tuple[str, list[str]]:
+    """Substitute ${VAR}, ${VAR:-default} etc. the way compose does.
+
+    `lookup` returns (value, source) or None for unset variables. Returns the
+    substituted text and the sources of the variables that supplied its value.
+    `$$` is kept as is, as `docker compose config` prints it.
+    """
+    out: list[str] = []
+    sources: list[str] = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch != "$" or i + 1 == len(text):
+            out.append(ch)
+            i += 1
+            continue
+        nxt = text[i + 1]
+        if nxt == "$":
+            out.append("$$")
+            i += 2
+        elif nxt == "{":
+            depth, j = 1, i + 2
+            while j < len(text) and depth:
+                if text[j] == "{":
+                    depth += 1
+                elif text[j] == "}":
+                    depth -= 1
+                j += 1
+            if depth:
+                raise ComposeLoadError(f"invalid interpolation format in {text!r}")
+            out.append(interpolate_braced(text[i + 2:j - 1], lookup, sources))
+            i = j
+        else:
+            match = IDENTIFIER_RE.match(text, i + 1)
+            if not match:
+                out.append(ch)
+                i += 1
+                continue
+            found = lookup(match.group())
+            if found:
+                out.append(found[0])
+                sources.append(found[1])
+            i = match.end()
+    return "".join(out), sources
+
+
+def interpolate_braced(body: str, lookup: Callable[[str], tuple[str, str] | None], sources: list[str]) -> str:
+    """Value of one ${...} expression."""
+    match = IDENTIFIER_RE.match(body)
+    if not match:
+        raise ComposeLoadError(f"invalid interpolation format for ${{{body}}}")
+    name, rest = match.group(), body[match.end():]
+    found = lookup(name)
+    if not rest:
+        if found:
+            sources.append(found[1])
+            return found[0]
+        return ""
+    for operator in (":-", ":?", ":+", "-", "?", "+"):
+        if rest.startswith(operator):
+            break
+    else:
+        raise ComposeLoadError(f"invalid interpolation format for ${{{body}}}")
+    argument = rest[len(operator):]
+    is_set = found is not None and (found[0] != "" or ":" not in operator)
+    if operator.endswith("-"):
+        if is_set:
+            sources.append(found[1])
+            return found[0]
+        value, inner = interpolate(argument, lookup)
+        sources.extend(inner)
+        return value
+    if operator.endswith("?"):
+        if not is_set:
+            message = interpolate(argument, lookup)[0]
+            raise ComposeLoadError(f"required variable {name} is missing a value: {message}")
+        sources.append(found[1])
+        return found[0]
+    if not is_set:
+        return ""
+    value, inner = interpolate(argument, lookup)
+    sources.extend(inner)
+    return value
+
+
+def interpolate_tree(node: Any, lookup: Callable[[str], tuple[str, str] | None]) -> Any:
+    """Interpolate every string value (not key) in a parsed document."""
+    if isinstance(node, str):
+        return interpolate(node, lookup)[0] if "$" in node else node
+    if isinstance(node, dict):
+        return {key: interpolate_tree(value, lookup) for key, value in node.items()}
+    if isinstance(node, list):
+        return [interpolate_tree(value, lookup) for value in node]
+    return node
+
+
+def yaml_string(value: Any) -> str:
+    """A scalar as the string compose would give it in environment/labels."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def absolute_path(path: str, base_dir: Path) -> str:
+    """Resolve a relative path (or ~) the way compose does: made absolute, not symlink-resolved."""
+    if path.startswith("~"):
+        path = os.path.expanduser(path)
+    return os.path.normpath(os.path.join(base_dir, path))
+
+
+class ComposeVariables:
+    """Variables for interpolation: the shell environment over the given .env files."""
+
+    def __init__(self, loader: ComposeLoader, env_files: Iterable[Path], required: bool = False) -> None:
+        self.values: dict[str, tuple[str, str]] = {}
+        for path in env_files:
+            if not path.is_file():
+                if required:
+                    raise ComposeLoadError(f"env file {path} not found")
+                continue
+            for name, value in loader.read_env_file(path, self).items():
+                self.values[name] = (value, str(path))
+
+    def get(self, name: str) -> tuple[str, str] | None:
+        if name in os.environ:
+            return os.environ[name], "shell"
+        return self.values.get(name)
+
+
+def parse_port(spec: Any) -> list[dict[str, Any]]:
+    """Compose's long port syntax for a short or long port entry (a target range gives several)."""
+    if isinstance(spec, dict):
+        port = {"mode": "ingress", **spec, "protocol": spec.get("protocol") or "tcp"}
+        if port.get("published") is not None:
+            port["published"] = str(port["published"])
+        return [port]
+    text = str(spec)
+    text, _, protocol = text.partition("/")
+    host_ip = None
+    if text.startswith("["):
+        end = text.find("]")
+        host_ip, text = text[1:end], text[end + 2:]
+    parts = text.split(":")
+    if len(parts) == 3:
+        host_ip, published, target = parts
+    elif len(parts) == 2:
+        published, target = parts
+    elif len(parts) == 1:
+        published, target = "", parts[0]
+    else:
+        raise ComposeLoadError(f"invalid port {spec!r}")
+    target_match = PORT_RANGE_RE.fullmatch(target)
+    if not target_match:
+        raise ComposeLoadError(f"invalid port {spec!r}")
+    start = int(target_match.group(1))
+    end = int(target_match.group(2) or start)
+    published_match = PORT_RANGE_RE.fullmatch(published)
+    ports = []
+    for offset, target_port in enumerate(range(start, end + 1)):
+        port: dict[str, Any] = {"mode": "ingress"}
+        if host_ip:
+            port["host_ip"] = host_ip
+        port["target"] = target_port
+        if published and end > start and published_match and published_match.group(2):
+            port["published"] = str(int(published_match.group(1)) + offset)
+        elif published:
+            port["published"] = published
+        port["protocol"] = protocol or "tcp"
+        ports.append(port)
+    return ports
+
+
+def parse_volume(spec: Any, base_dir: Path) -> dict[str, Any]:
+    """Compose's long volume syntax, with bind sources made absolute."""
+    if isinstance(spec, dict):
+        volume = dict(spec)
+        if volume.get("type") == "bind" and volume.get("source"):
+            volume["source"] = absolute_path(volume["source"], base_dir)
+        return volume
+    parts = str(spec).split(":")
+    if len(parts) == 1:
+        return {"type": "volume", "target": parts[0], "volume": {}}
+    source, target, mode = parts[0], parts[1], ":".join(parts[2:])
+    if source.startswith((".", "/", "~")):
+        volume = {"type": "bind", "source": absolute_path(source, base_dir), "target": target,
+                  "bind": {"create_host_path": True}}
+    else:
+        volume = {"type": "volume", "source": source, "target": target, "volume": {}}
+    if "ro" in mode.split(","):
+        volume["read_only"] = True
+    return volume
+
+
+def merge_service(base: dict[str, Any], override: dict[str, Any]) -> dict[str, Any]:
+    """Merge a service definition over another (override files, extends)."""
+    merged = dict(base)
+    for key, value in override.items():
+        current = merged.get(key)
+        if current is None or value is None or key in REPLACE_FIELDS:
+            merged[key] = value
+        elif key in MERGE_BY_KEY_FIELDS and isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = {**current, **value}
+        elif key == "volumes" and isinstance(current, list) and isinstance(value, list):
+            by_target = {volume.get("target"): volume for volume in current}
+            by_target.update((volume.get("target"), volume) for volume in value)
+            merged[key] = list(by_target.values())
+        elif key == "env_file":
+            merged[key] = current + value
+        elif isinstance(current, list) and isinstance(value, list):
+            merged[key] = current + [item for item in value if item not in current]
+        elif isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = merge_mapping(current, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def merge_mapping(base: dict[str, Any], override: dict[str, Any]) -> dict[str, Any]:
+    """Recursive merge for nested service mappings (deploy, healthcheck, build...): lists are replaced."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(merged.get(key), dict) and isinstance(value, dict):
+            merged[key] = merge_mapping(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class ComposeLoader:
+    """Resolves compose files in-process, as `docker compose config --format json` would.
+
+    Covers what compose-tree reads: includes, extends, multiple -f files,
+    profiles, interpolation, env_file and the short port/volume/depends_on
+    syntaxes. Along the way it records where each environment variable's value
+    came from (an env file, the shell, or inline in the compose file).
+    Anything it can't resolve exactly raises ComposeLoadError.
+    """
+
+    def __init__(self) -> None:
+        self._env_files: dict[tuple[Path, int], dict[str, str]] = {}
+
+    def read_env_file(self, path: Path, variables: ComposeVariables) -> dict[str, str]:
+        """Values in an env file, interpolated like compose's dotenv parser does."""
+        key = (path, id(variables))
+        if key in self._env_files:
+            return self._env_files[key]
+        values: dict[str, str] = {}
+
+        def lookup(name: str) -> tuple[str, str] | None:
+            if name in values:
+                return values[name], str(path)
+            return variables.get(name)
+
+        try:
+            text = path.read_text()
+        except OSError as e:
+            raise ComposeLoadError(f"{path}: {e.strerror}") from e
+        for number, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            line = line.removeprefix("export ").lstrip()
+            name, eq, value = line.partition("=")
+            name = name.strip()
+            if not eq:
+                found = lookup(name)
+                if found:
+                    values[name] = found[0]
+                continue
+            value = value.strip()
+            if value[:1] in ("'", '"'):
+                end = YAMLParser.closing_quote(value, 0)
+                if end is None:
+                    raise ComposeLoadError(f"{path}:{number}: unterminated quoted value")
+                body = value[1:end]
+                if value[0] == "'":
+                    values[name] = body
+                    continue
+                value = body.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\")
+            else:
+                value = re.split(r"\s#", value, maxsplit=1)[0].rstrip()
+            values[name] = interpolate(value, lookup)[0]
+        self._env_files[key] = values
+        return values
+
+    def load(
+        self, compose_files: tuple[Path, ...], project_dir: Path, project_name: str | None = None
+    ) -> tuple[dict[str, Any], dict[str, dict[str, str]]]:
+        """Resolve a project: (config in `docker compose config` JSON shape, env sources per service).
+
+        project_name, like `-p`, takes precedence over COMPOSE_PROJECT_NAME and `name:`.
+        """
+        variables = ComposeVariables(self, [project_dir / ".env"])
+        model = self.load_files(compose_files, project_dir, variables, [])
+
+        profiles_value = variables.get("COMPOSE_PROFILES")
+        profiles = {p.strip() for p in (profiles_value[0] if profiles_value else "").split(",") if p.strip()}
+        config: dict[str, Any] = {}
+        name_value = variables.get("COMPOSE_PROJECT_NAME")
+        name = project_name or (name_value[0] if name_value else model.get("name") or project_dir.name)
+        config["name"] = PROJECT_NAME_RE.sub("", str(name).lower()).lstrip("-_")
+
+        services: dict[str, Any] = {}
+        env_sources: dict[str, dict[str, str]] = {}
+        for service_name, service in sorted(model["services"].items()):
+            service_profiles = service.get("profiles")
+            if service_profiles and not profiles.intersection(service_profiles) and "*" not in profiles:
+                continue
+            services[service_name], env_sources[service_name] = self.finish_service(service)
+        config["services"] = services
+        for key in ("networks", "volumes", "secrets", "configs"):
+            if model.get(key):
+                config[key] = model[key]
+        return config, env_sources
+
+    def load_files(
+        self, compose_files: Iterable[Path], base_dir: Path, variables: ComposeVariables, stack: list[Path]
+    ) -> dict[str, Any]:
+        """Load and merge compose files in order (`-f a -f b`), sharing one project directory."""
+        merged: dict[str, Any] = {"services": {}}
+        for path in compose_files:
+            document = self.load_file(path, base_dir, variables, stack)
+            for service_name, service in document.pop("services").items():
+                existing = merged["services"].get(service_name)
+                merged["services"][service_name] = merge_service(existing, service) if existing else service
+            for key, value in document.items():
+                if isinstance(merged.get(key), dict) and isinstance(value, dict):
+                    merged[key] = {**merged[key], **value}
+                else:
+                    merged[key] = value
+        return merged
+
+    def load_file(
+        self, path: Path, base_dir: Path, variables: ComposeVariables, stack: list[Path]
+    ) -> dict[str, Any]:
+        """One compose file with its includes and extends resolved and its services normalised."""
+        path = path.resolve()
+        if path in stack:
+            raise ComposeLoadError(f"include cycle: {' -> '.join(map(str, [*stack, path]))}")
+        document = self.interpolate_document(read_compose_document(path), variables)
+        raw_services = document.pop("services", None) or {}
+        if not isinstance(raw_services, dict):
+            raise ComposeLoadError(f"{path}: services must be a mapping")
+
+        services: dict[str, Any] = {}
+        for service_name in raw_services:
+            services[service_name] = self.extend_service(
+                service_name, raw_services, path, base_dir, variables, [],
+            )
+
+        for item in document.pop("include", None) or []:
+            for service_name, service in self.load_include(item, base_dir, variables, [*stack, path]).items():
+                if service_name in services:
+                    raise ComposeLoadError(f"{path}: service {service_name} conflicts with an included service")
+                services[service_name] = service
+
+        document = {key: value for key, value in document.items() if not key.startswith("x-")}
+        document["services"] = services
+        return document
+
+    def load_include(
+        self, item: Any, base_dir: Path, variables: ComposeVariables, stack: list[Path]
+    ) -> dict[str, Any]:
+        """Services of one `include` entry, loaded as their own project (own directory and .env)."""
+        spec = {"path": item} if isinstance(item, str) else item
+        if not isinstance(spec, dict) or not spec.get("path"):
+            raise ComposeLoadError(f"invalid include entry {item!r}")
+        paths = [spec["path"]] if isinstance(spec["path"], str) else spec["path"]
+        files = [Path(absolute_path(p, base_dir)) for p in paths]
+        project_dir = Path(absolute_path(spec["project_directory"], base_dir)) if spec.get("project_directory") \
+            else files[0].parent
+        env_files = spec.get("env_file")
+        if env_files:
+            if isinstance(env_files, str):
+                env_files = [env_files]
+            env_paths = [Path(absolute_path(p, base_dir)) for p in env_files]
+            include_variables = ComposeVariables(self, env_paths, required=True)
+        else:
+            include_variables = ComposeVariables(self, [project_dir / ".env"])
+        return self.load_files(files, project_dir, include_variables, stack)["services"]
+
+    def extend_service(
+        self, name: str, services: dict[str, Any], path: Path, base_dir: Path,
+        variables: ComposeVariables, stack: list[tuple[Path, str]],
+    ) -> dict[str, Any]:
+        """A service with `extends` resolved (recursively, possibly from another file) and normalised."""
+        if (path, name) in stack:
+            raise ComposeLoadError(f"extends cycle at service {name} in {path}")
+        if name not in services:
+            raise ComposeLoadError(f"{path}: cannot extend unknown service {name}")
+        service = services[name]
+        if service is None:
+            service = {}
+        if not isinstance(service, dict):
+            raise ComposeLoadError(f"{path}: service {name} must be a mapping")
+        service = self.normalise_service(dict(service), base_dir, variables)
+        extends = service.pop("extends", None)
+        if not extends:
+            return service
+        spec = {"service": extends} if isinstance(extends, str) else extends
+        if spec.get("file"):
+            other = Path(absolute_path(spec["file"], path.parent)).resolve()
+            other_services = self.interpolate_document(read_compose_document(other), variables).get("services") or {}
+            base = self.extend_service(
+                spec["service"], other_services, other, other.parent, variables, [*stack, (path, name)],
+            )
+        else:
+            base = self.extend_service(spec["service"], services, path, base_dir, variables, [*stack, (path, name)])
+        return merge_service(base, service)
+
+    @staticmethod
+    def interpolate_document(
+        document: dict[str, Any], variables: ComposeVariables
+    ) -> dict[str, Any]:
+        """Interpolate a document, keeping each service's raw environment for normalise_service."""
+        raw_env: dict[str, Any] = {}
+        services = document.get("services")
+        if isinstance(services, dict):
+            for service_name, service in services.items():
+                if isinstance(service, dict) and "environment" in service:
+                    raw_env[service_name] = service.pop("environment")
+        document = interpolate_tree(document, variables.get)
+        for service_name, environment in raw_env.items():
+            document["services"][service_name]["environment"] = ("raw", environment)
+        return document
+
+    def normalise_service(
+        self, service: dict[str, Any], base_dir: Path, variables: ComposeVariables
+    ) -> dict[str, Any]:
+        """Rewrite a service into the long syntax `docker compose config` prints.
+
+        environment becomes {VAR: (value, source)} and env_file a list of
+        (path, values) pairs; finish_service turns both into the final environment.
+        """
+        environment = service.get("environment")
+        if isinstance(environment, tuple) and environment[0] == "raw":
+            service["environment"] = self.resolve_environment(environment[1], variables)
+
+        env_files = service.get("env_file")
+        if env_files is not None:
+            entries = []
+            for entry in [env_files] if isinstance(env_files, (str, dict)) else env_files:
+                spec = {"path": entry} if isinstance(entry, str) else entry
+                env_path = Path(absolute_path(spec["path"], base_dir))
+                if not env_path.is_file():
+                    if spec.get("required", True):
+                        raise ComposeLoadError(f"env file {env_path} not found")
+                    continue
+                entries.append((str(env_path), self.read_env_file(env_path, variables)))
+            service["env_file"] = entries
+
+        labels = service.get("labels")
+        if isinstance(labels, list):
+            service["labels"] = dict(
+                (item.split("=", 1) + [""])[:2] for item in map(str, labels)
+            )
+        elif isinstance(labels, dict):
+            service["labels"] = {
+                key: yaml_string(value) if value is not None else "" for key, value in labels.items()
+            }
+
+        for key in ("command", "entrypoint"):
+            if isinstance(service.get(key), str):
+                try:
+                    service[key] = shlex.split(service[key])
+                except ValueError as e:
+                    raise ComposeLoadError(f"{key}: {e}") from e
+            elif isinstance(service.get(key), list):
+                service[key] = [yaml_string(arg) for arg in service[key]]
+
+        if isinstance(service.get("ports"), list):
+            service["ports"] = [port for spec in service["ports"] for port in parse_port(spec)]
+        if isinstance(service.get("volumes"), list):
+            service["volumes"] = [parse_volume(spec, base_dir) for spec in service["volumes"]]
+        if isinstance(service.get("networks"), list):
+            service["networks"] = dict.fromkeys(service["networks"])
+
+        depends_on = service.get("depends_on")
+        if isinstance(depends_on, list):
+            depends_on = dict.fromkeys(depends_on)
+        if isinstance(depends_on, dict):
+            service["depends_on"] = {
+                dep: {"condition": "service_started", "required": True, **(spec or {})}
+                for dep, spec in depends_on.items()
+            }
+
+        build = service.get("build")
+        if isinstance(build, str):
+            service["build"] = {"context": absolute_path(build, base_dir), "dockerfile": "Dockerfile"}
+        elif isinstance(build, dict) and build.get("context") and "://" not in build["context"]:
+            service["build"] = {**build, "context": absolute_path(build["context"], base_dir)}
+        return service
+
+    @staticmethod
+    def resolve_environment(environment: Any, variables: ComposeVariables) -> dict[str, tuple[str | None, str]]:
+        """Interpolate a service's `environment`, noting where each value came from.
+
+        A value built from variables is attributed to the first variable's source
+        (the shell or an .env file); a literal value is "compose:inline". A bare
+        name is passed through from the shell/.env (None when unset).
+        """
+        if isinstance(environment, list):
+            items = [str(item).partition("=") for item in environment]
+            entries = [(name, value if eq else None) for name, eq, value in items]
+        elif isinstance(environment, dict):
+            entries = [(str(name), value) for name, value in environment.items()]
+        elif environment is None:
+            return {}
+        else:
+            raise ComposeLoadError("environment must be a list or mapping")
+
+        resolved: dict[str, tuple[str | None, str]] = {}
+        for name, value in entries:
+            if value is None:
+                found = variables.get(name)
+                resolved[name] = (found[0], found[1]) if found else (None, "shell")
+                continue
+            text, sources = interpolate(yaml_string(value), variables.get)
+            resolved[name] = (text, sources[0] if sources else "compose:inline")
+        return resolved
+
+    @staticmethod
+    def finish_service(service: dict[str, Any]) -> tuple[dict[str, Any], dict[str, str]]:
+        """Fold env_file values under environment; returns (service, {VAR: source}).
+
+        Also fills in what `docker compose config` adds after merging: maps come
+        out sorted, as Go prints them, and a service given neither `networks`
+        nor `network_mode` joins the project's default network.
+        """
+        environment: dict[str, str | None] = {}
+        sources: dict[str, str] = {}
+        for env_path, values in service.pop("env_file", None) or []:
+            environment.update(values)
+            sources.update(dict.fromkeys(values, env_path))
+        for name, (value, source) in (service.get("environment") or {}).items():
+            environment[name] = value
+            sources[name] = source
+        if environment:
+            service["environment"] = dict(sorted(environment.items()))
+        else:
+            service.pop("environment", None)
+        if service.get("labels"):
+            service["labels"] = dict(sorted(service["labels"].items()))
+        if "networks" not in service and "network_mode" not in service:
+            service["networks"] = {"default": None}
+        return service, sources
+
+
+def load_compose_native(
+    compose_file: Path, project_dir: Path, extra_files: tuple[Path, ...] = (), project_name: str | None = None
+) -> tuple[dict[str, Any], dict[str, dict[str, str]]]:
+    """Resolve a project in-process (see ComposeLoader). Raises ComposeLoadError."""
+    return ComposeLoader().load((compose_file, *extra_files), project_dir, project_name)
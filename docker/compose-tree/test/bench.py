@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark compose-tree against the fake docker shim.
+
+Generates a synthetic stack, writes fixtures for test/fake-docker/docker and
+times the per-service docker lookups (container inspect, image ID) against
+the batched ones and against the Engine API backend (test/fake-docker/engine.py).
+
+Usage: python3 bench.py [--services N] [--latency SECONDS]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE / "fake-docker"))
+
+import compose_tree  # noqa: E402
+from engine import FakeEngine  # noqa: E402
+from stackgen import CREATED, CREATED_AT, config_hash  # noqa: E402
+
+
+def generate_stack(out_dir: Path, services: int) -> Path:
+    """Write a synthetic compose file plus fake-docker fixtures for N services."""
+    config: dict = {"name": "bench", "services": {}}
+    ps, inspects = [], []
+    images = {}
+
+    for i in range(services):
+        name = f"svc{i:04d}"
+        image = f"busybox:{i % 5}"
+        images[image] = f"sha256:{i % 5:064x}"
+        env = {"SERVICE_INDEX": str(i), "SHARED": "value"}
+        deps = [f"svc{i - 1:04d}"] if i and i % 10 else []
+
+        config["services"][name] = {
+            "image": image,
+            "environment": env,
+            "depends_on": {d: {"condition": "service_started"} for d in deps},
+            "labels": {"bench.index": str(i)},
+        }
+        container = f"bench-{name}-1"
+        ps.append({
+            "ID": f"{i:064x}", "Name": container, "Service": name, "CreatedAt": CREATED_AT,
+            "State": "running", "ExitCode": 0,
+        })
+        inspects.append({
+            "Id": f"{i:064x}",
+            "Name": f"/{container}",
+            "Created": CREATED,
+            "Image": images[image],
+            "State": {"Status": "running", "ExitCode": 0},
+            "Config": {
+                "Image": image,
+                "Env": [f"{k}={v}" for k, v in env.items()],
+                "Labels": {
+                    "bench.index": str(i),
+                    "com.docker.compose.project": "bench",
+                    "com.docker.compose.service": name,
+                    "com.docker.compose.oneoff": "False",
+                    "com.docker.compose.config-hash": config_hash(config["services"][name]),
+                },
+            },
+            "HostConfig": {},
+            "Mounts": [],
+            "NetworkSettings": {"Networks": {}},
+        })
+
+    (out_dir / "config.json").write_text(json.dumps(config))
+    (out_dir / "ps.json").write_text(json.dumps(ps))
+    (out_dir / "inspect.json").write_text(json.dumps(inspects))
+    (out_dir / "images.json").write_text(json.dumps(images))
+
+    compose_file = out_dir / "docker-compose.yaml"
+    compose_file.write_text("services:\n" + "".join(f"  {n}:\n    image: busybox\n" for n in config["services"]))
+    return compose_file
+
+
+def count_calls(log: Path) -> int:
+    return len(log.read_text().splitlines()) if log.exists() else 0
+
+
+def timed(log: Path, func, *args):
+    """Run func, returning (result, seconds, docker calls made)."""
+    log.unlink(missing_ok=True)
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start, count_calls(log)
+
+
+def report(title: str, before: tuple, after: tuple) -> None:
+    _, before_time, before_calls = before
+    _, after_time, after_calls = after
+    print(f"  {title}")
+    print(f"    per-service: {before_time:7.3f}s  ({before_calls} docker calls)")
+    print(f"    batched:     {after_time:7.3f}s  ({after_calls} docker calls)")
+    if after_time:
+        print(f"    speedup:     {before_time / after_time:7.1f}x")
+
+
+def resolve_images(config: dict) -> dict[str, str | None]:
+    images = compose_tree.ImageResolver()
+    images.prefetch(config)
+    return {svc["image"]: images.get(svc["image"]) for svc in config["services"].values()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=120, help="number of services (default: 120)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake CLI startup delay in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="compose-tree-bench-") as tmp:
+        tmp_dir = Path(tmp)
+        generate_stack(tmp_dir, args.services)
+        log = tmp_dir / "calls.log"
+
+        os.environ["PATH"] = f"{HERE / 'fake-docker'}{os.pathsep}{os.environ['PATH']}"
+        os.environ["FAKE_DOCKER_FIXTURES"] = str(tmp_dir)
+        os.environ["FAKE_DOCKER_LATENCY"] = str(args.latency)
+        os.environ["FAKE_DOCKER_LOG"] = str(log)
+
+        names = [c["Name"] for c in json.loads((tmp_dir / "ps.json").read_text())]
+        config = json.loads((tmp_dir / "config.json").read_text())
+
+        inspect_single = timed(log, lambda: {n: compose_tree.get_container_inspect(n) for n in names})
+        inspect_batched = timed(log, compose_tree.get_container_inspects, names)
+        image_single = timed(log, lambda: {
+            svc["image"]: compose_tree.get_image_id(svc["image"]) for svc in config["services"].values()
+        })
+        image_batched = timed(log, resolve_images, config)
+
+        # Same lookups through the Engine API backend, against a fake daemon socket
+        engine = FakeEngine(str(tmp_dir / "engine.sock"), tmp_dir, args.latency)
+        engine.start()
+        compose_tree.DOCKER_API = compose_tree.DockerAPIClient(engine.server_address)
+        inspect_api = timed(log, compose_tree.get_container_inspects, names)
+        image_api = timed(log, resolve_images, config)
+        api_requests = engine.requests
+        compose_tree.DOCKER_API = None
+        engine.shutdown()
+
+        if any(inspect_batched[0].get(n) != data for n, data in inspect_single[0].items()):
+            print("error: batched inspect results differ from per-container results", file=sys.stderr)
+            return 1
+        if image_batched[0] != image_single[0]:
+            print("error: batched image IDs differ from per-service lookups", file=sys.stderr)
+            return 1
+        if inspect_api[0] != inspect_batched[0]:
+            print("error: Engine API inspect results differ from the CLI", file=sys.stderr)
+            return 1
+        if image_api[0] != image_single[0]:
+            print("error: Engine API image IDs differ from the CLI", file=sys.stderr)
+            return 1
+
+    print(f"services: {args.services}")
+    report("container inspect", inspect_single, inspect_batched)
+    report("image lookup", image_single, image_batched)
+    print(f"  engine API (--backend api, {api_requests} HTTP requests, 0 docker calls)")
+    print(f"    container inspect: {inspect_api[1]:7.3f}s")
+    print(f"    image lookup:      {image_api[1]:7.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark compose-tree's dependency graph on large synthetic stacks.
+
+Builds DependencyGraph and propagates restarts for several 5,000-service graph
+shapes (deep chain, wide fan-out, layered DAG, layered DAG with a cycle), next
+to the old dependents-map + propagate_dependency_restarts BFS it replaced, and
+checks both mark the same services. The graph is built once per config and
+reused by every propagation in --watch and serve, while the old code rebuilt
+its dependents map on every call, so `ratio` is propagate / baseline. Timings
+are only reported: the exit code is 1 if the restart sets differ or the ratio
+is above 2 on some shape, which means a complexity regression rather than
+timer jitter.
+
+Usage: python3 bench_graph.py [--services N] [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import compose_tree  # noqa: E402
+from dependency_graph import DependencyGraph, build_dependents_graph  # noqa: E402
+
+# Fail only when the graph is this many times slower than the baseline: both are
+# linear, so anything short of that is timer noise, not a regression
+MAX_RATIO = 2.0
+
+
+def chain(n: int, rng: random.Random) -> dict[str, list[str]]:
+    return {f"s{i}": [f"s{i - 1}"] if i else [] for i in range(n)}
+
+
+def fan_out(n: int, rng: random.Random) -> dict[str, list[str]]:
+    return {f"s{i}": ["s0"] if i else [] for i in range(n)}
+
+
+def layered(n: int, rng: random.Random, width: int = 100, fan_in: int = 3) -> dict[str, list[str]]:
+    graph: dict[str, list[str]] = {}
+    for i in range(n):
+        layer = i // width
+        if layer == 0:
+            graph[f"s{i}"] = []
+        else:
+            previous = range((layer - 1) * width, layer * width)
+            graph[f"s{i}"] = [f"s{j}" for j in rng.sample(previous, fan_in)]
+    return graph
+
+
+def layered_cycle(n: int, rng: random.Random) -> dict[str, list[str]]:
+    graph = layered(n, rng)
+    graph["s0"] = [f"s{n - 1}"]  # close a loop from the last layer back to the first
+    return graph
+
+
+def propagate_dependency_restarts(
+    statuses: dict[str, compose_tree.ServiceStatus],
+    dependents_graph: dict[str, list[str]],
+) -> None:
+    """The pre-DependencyGraph propagation, kept verbatim as the baseline."""
+    DEPENDENCY_RESTART = compose_tree.RestartTrigger.DEPENDENCY_RESTART
+    needs_restart = {
+        name for name, status in statuses.items()
+        if status.needs_restart and not any(
+            r.trigger == DEPENDENCY_RESTART for r in status.reasons
+        )
+    }
+
+    to_process = list(needs_restart)
+    processed = set()
+
+    while to_process:
+        current = to_process.pop(0)
+        if current in processed:
+            continue
+        processed.add(current)
+
+        for dependent in dependents_graph.get(current, []):
+            if dependent not in statuses:
+                continue
+
+            status = statuses[dependent]
+
+            has_dep_reason = any(
+                r.trigger == DEPENDENCY_RESTART
+                for r in status.reasons
+            )
+
+            if not has_dep_reason:
+                existing_deps = []
+                for r in status.reasons:
+                    if r.trigger == DEPENDENCY_RESTART:
+                        existing_deps = r.details
+                        break
+
+                if current not in existing_deps:
+                    existing_deps.append(current)
+
+                found = False
+                for r in status.reasons:
+                    if r.trigger == DEPENDENCY_RESTART:
+                        if current not in r.details:
+                            r.details.append(current)
+                        found = True
+                        break
+
+                if not found:
+                    status.reasons.append(
+                        compose_tree.RestartReason(
+                            trigger=DEPENDENCY_RESTART,
+                            details=[current],
+                        )
+                    )
+                status.needs_restart = True
+
+            if dependent not in processed:
+                to_process.append(dependent)
+
+
+SHAPES = {
+    "chain": chain,
+    "fan-out": fan_out,
+    "layered": layered,
+    "layered+cycle": layered_cycle,
+}
+
+
+def make_statuses(graph: dict[str, list[str]], rng: random.Random, fraction: float) -> dict:
+    statuses = {name: compose_tree.ServiceStatus(name=name) for name in graph}
+    for name in rng.sample(sorted(graph), max(1, int(len(graph) * fraction))):
+        statuses[name].needs_restart = True
+        statuses[name].reasons.append(
+            compose_tree.RestartReason(trigger=compose_tree.RestartTrigger.NOT_RUNNING)
+        )
+    return statuses
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=5000, help="services per graph (default: 5000)")
+    parser.add_argument("--repeat", type=int, default=15, help="runs per shape, best is reported (default: 15)")
+    parser.add_argument("--restarting", type=float, default=0.01,
+                        help="fraction of services needing a direct restart (default: 0.01)")
+    args = parser.parse_args()
+
+    print(f"{'shape':<15} {'build':>9} {'propagate':>10} {'total':>9} {'baseline':>9} {'ratio':>6} "
+          f"{'restarting':>11} {'cycles':>7}")
+    slower = []
+    gc.disable()  # as timeit does: collections would land on whichever side happens to allocate last
+    for shape, generate in SHAPES.items():
+        rng = random.Random(42)
+        dependencies = generate(args.services, rng)
+        best_build = best_propagate = best_total = best_baseline = float("inf")
+        for _ in range(args.repeat):
+            statuses = make_statuses(dependencies, random.Random(7), args.restarting)
+            start = time.perf_counter()
+            graph = DependencyGraph(dependencies)
+            built = time.perf_counter()
+            compose_tree.propagate_restarts(graph, statuses)
+            done = time.perf_counter()
+            best_build = min(best_build, built - start)
+            best_propagate = min(best_propagate, done - built)
+            best_total = min(best_total, done - start)
+
+            baseline = make_statuses(dependencies, random.Random(7), args.restarting)
+            start = time.perf_counter()
+            propagate_dependency_restarts(baseline, build_dependents_graph(dependencies))
+            best_baseline = min(best_baseline, time.perf_counter() - start)
+
+        restarting = {name for name, status in statuses.items() if status.needs_restart}
+        if restarting != {name for name, status in baseline.items() if status.needs_restart}:
+            print(f"{shape}: restart set differs from the baseline", file=sys.stderr)
+            return 1
+        ratio = best_propagate / best_baseline
+        if ratio > MAX_RATIO:
+            slower.append(shape)
+        print(
+            f"{shape:<15} {best_build * 1000:7.1f}ms {best_propagate * 1000:8.1f}ms "
+            f"{best_total * 1000:7.1f}ms {best_baseline * 1000:7.1f}ms {ratio:6.2f} "
+            f"{len(restarting):>11} {len(graph.cycles):>7}"
+        )
+    if slower:
+        print(f"over {MAX_RATIO:g}x the baseline: {', '.join(slower)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
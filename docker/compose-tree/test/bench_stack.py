@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark and regression check for compose-tree.
+
+For each stack size, generates a synthetic stack (see stackgen.py), runs
+compose_tree.py against the fake docker CLI (and optionally the fake Engine
+API), and reports wall time, docker subprocesses, API requests and peak memory.
+Runs are cold (config cache refreshed) and warm (cache reused). Each run's
+`--format json` output must name exactly the services the generator expects,
+otherwise the exit code is 1.
+
+Usage: python3 bench_stack.py [--sizes 50,200,1000] [--latency SECONDS] [--backend cli,api] [--loader cli,native]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+COMPOSE_TREE = HERE.parent / "compose_tree.py"
+sys.path.insert(0, str(HERE / "fake-docker"))
+
+from engine import FakeEngine  # noqa: E402
+from stackgen import generate  # noqa: E402
+
+# --loader names and the compose-tree flags that select them
+LOADER_ARGS = {"cli": [], "native": ["--experimental-native-loader"]}
+
+# Runs compose_tree.py in this interpreter and writes its own peak RSS (KiB) to $BENCH_RSS_FILE
+LAUNCHER = """
+import atexit, os, resource, runpy, sys
+def report():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024
+    with open(os.environ["BENCH_RSS_FILE"], "w") as f:
+        f.write(str(rss))
+atexit.register(report)
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def run_compose_tree(stack_dir: Path, compose_file: Path, args: list[str], env: dict[str, str]) -> dict:
+    """Run compose_tree.py once; returns wall time, docker calls, peak RSS and the needs_restart list."""
+    log = stack_dir / "calls.log"
+    rss_file = stack_dir / "rss"
+    log.unlink(missing_ok=True)
+    env = {**env, "FAKE_DOCKER_LOG": str(log), "BENCH_RSS_FILE": str(rss_file)}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", LAUNCHER, str(COMPOSE_TREE), "-f", str(compose_file), "--format", "json", *args],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    wall = time.perf_counter() - start
+    try:
+        needs_restart = json.loads(proc.stdout)["needs_restart"]
+    except (ValueError, KeyError):
+        print(proc.stdout, proc.stderr, sep="\n", file=sys.stderr)
+        needs_restart = None
+    return {
+        "wall": wall,
+        "calls": len(log.read_text().splitlines()) if log.exists() else 0,
+        "rss_mb": int(rss_file.read_text()) / 1024 if rss_file.exists() else 0.0,
+        "needs_restart": needs_restart,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,200,1000", help="comma-separated stack sizes (default: 50,200,1000)")
+    parser.add_argument("--env-files", type=int, default=20, help="env files per stack (default: 20)")
+    parser.add_argument("--includes", type=int, default=2, help="included compose files per stack (default: 2)")
+    parser.add_argument("--depth", type=int, default=10, help="dependency chain length (default: 10)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake CLI/API delay per call in seconds")
+    parser.add_argument("--backend", default="cli,api", help="comma-separated backends to run (default: cli,api)")
+    parser.add_argument("--loader", default="cli",
+                        help="comma-separated compose loaders to run: cli, native (--experimental-native-loader) "
+                             "(default: cli)")
+    parser.add_argument("--jobs", type=int, default=8, help="compose-tree --jobs (default: 8)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    backends = args.backend.split(",")
+    loaders = args.loader.split(",")
+    unknown = set(loaders) - LOADER_ARGS.keys()
+    if unknown:
+        parser.error(f"unknown loader: {', '.join(sorted(unknown))}")
+    failures = 0
+
+    print(f"{'services':>8}  {'backend':<7}  {'loader':<6}  {'cache':<5}  {'wall s':>7}  {'docker':>6}  "
+          f"{'api':>5}  {'peak MB':>7}  result")
+    with tempfile.TemporaryDirectory(prefix="compose-tree-bench-") as tmp:
+        for size in sizes:
+            stack_dir = Path(tmp) / str(size)
+            stack = generate(stack_dir, size, args.env_files, args.includes, args.depth)
+            env = {
+                **os.environ,
+                "PATH": f"{HERE / 'fake-docker'}{os.pathsep}{os.environ['PATH']}",
+                "FAKE_DOCKER_FIXTURES": str(stack_dir),
+                "FAKE_DOCKER_LATENCY": str(args.latency),
+                "XDG_CACHE_HOME": str(stack_dir / "cache"),
+            }
+
+            for backend in backends:
+                engine = None
+                run_args = ["--jobs", str(args.jobs)]
+                if backend == "api":
+                    engine = FakeEngine(str(stack_dir / "engine.sock"), stack_dir, args.latency)
+                    engine.start()
+                    env["DOCKER_HOST"] = f"unix://{stack_dir / 'engine.sock'}"
+                    run_args += ["--backend", "api"]
+
+                for loader, (cache, cache_args) in (
+                    (loader, cache) for loader in loaders for cache in (("cold", ["--refresh"]), ("warm", []))
+                ):
+                    api_before = engine.requests if engine else 0
+                    result = run_compose_tree(
+                        stack_dir, stack.compose_file, run_args + cache_args + LOADER_ARGS[loader], env
+                    )
+                    api_requests = engine.requests - api_before if engine else 0
+                    ok = result["needs_restart"] == stack.expected
+                    failures += not ok
+                    print(
+                        f"{size:>8}  {backend:<7}  {loader:<6}  {cache:<5}  {result['wall']:>7.3f}  "
+                        f"{result['calls']:>6}  {api_requests:>5}  {result['rss_mb']:>7.1f}  "
+                        f"{'ok' if ok else 'FAIL'} ({len(stack.expected)} need restart)",
+                        flush=True,
+                    )
+                    if not ok and result["needs_restart"] is not None:
+                        got = set(result["needs_restart"])
+                        print(f"    missing: {sorted(set(stack.expected) - got)}", file=sys.stderr)
+                        print(f"    unexpected: {sorted(got - set(stack.expected))}", file=sys.stderr)
+
+                if engine:
+                    engine.shutdown()
+                    env.pop("DOCKER_HOST")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
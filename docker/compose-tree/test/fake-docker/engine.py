@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Fake Docker Engine API server on a unix socket, for compose-tree's --backend api.
+
+Serves the same fixture directory as the fake `docker` CLI (see ./docker):
+
+  GET /_ping
+  GET /containers/json?all=1&filters={"label": ["k=v", ...]}
+  GET /containers/{name-or-id}/json
+  GET /images/{ref}/json
+
+Usage: python3 engine.py SOCKET_PATH [--fixtures DIR] [--latency SECONDS]
+Then:  DOCKER_HOST=unix://SOCKET_PATH compose_tree.py --backend api
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+    """Answers Engine API GETs from fixture files."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real daemon
+    server: FakeEngine
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def send_json(self, status: int, data: object) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        with self.server.requests_lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+
+        if parts == ["_ping"]:
+            body = b"OK"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ["containers", "json"]:
+            filters = json.loads(parse_qs(url.query).get("filters", ["{}"])[0])
+            self.send_json(200, self.server.list_containers(filters.get("label", [])))
+        elif len(parts) == 3 and parts[0] == "containers" and parts[2] == "json":
+            item = self.server.containers.get(parts[1])
+            self.send_json(200 if item else 404, item or {"message": f"No such container: {parts[1]}"})
+        elif len(parts) >= 3 and parts[0] == "images" and parts[-1] == "json":
+            ref = "/".join(parts[1:-1])
+            image_id = self.server.images.get(ref)
+            if image_id:
+                self.send_json(200, {"Id": image_id, "RepoTags": [ref]})
+            else:
+                self.send_json(404, {"message": f"No such image: {ref}"})
+        else:
+            self.send_json(404, {"message": "page not found"})
+
+
+class FakeEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded unix-socket HTTP server backed by a fixtures directory."""
+
+    daemon_threads = True
+    # The default listen backlog of 5 refuses connections when --jobs opens more at once
+    request_queue_size = 128
+
+    def __init__(self, socket_path: str, fixtures: Path, latency: float = 0.0) -> None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, EngineHandler)
+        self.latency = latency
+        self.requests = 0
+        self.requests_lock = threading.Lock()
+
+        inspects = json.loads((fixtures / "inspect.json").read_text())
+        self.containers: dict[str, dict] = {}
+        for item in inspects:
+            self.containers[item.get("Name", "").lstrip("/")] = item
+            self.containers[item.get("Id", "")] = item
+        images_file = fixtures / "images.json"
+        self.images = json.loads(images_file.read_text()) if images_file.exists() else {}
+        self.inspects = inspects
+
+    def list_containers(self, label_filters: list[str]) -> list[dict]:
+        result = []
+        for item in self.inspects:
+            labels = item.get("Config", {}).get("Labels") or {}
+            if not all(
+                (k in labels) if not sep else labels.get(k) == v
+                for k, sep, v in (f.partition("=") for f in label_filters)
+            ):
+                continue
+            state = item.get("State", {})
+            status = state.get("Status", "running")
+            health = (state.get("Health") or {}).get("Status")
+            created = item.get("Created")
+            result.append({
+                "Id": item.get("Id", ""),
+                "Names": [item.get("Name", "")],
+                "Created": int(datetime.fromisoformat(created[:19]).timestamp()) if created else 0,
+                "Image": item.get("Config", {}).get("Image", ""),
+                "ImageID": item.get("Image", ""),
+                "Labels": labels,
+                "State": status,
+                "Status": (
+                    (f"Up ({health})" if health else "Up") if status == "running"
+                    else f"Exited ({state.get('ExitCode', 0)})"
+                ),
+            })
+        return result
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread (for use from benchmarks)."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("socket", help="unix socket path to listen on")
+    parser.add_argument("--fixtures", type=Path, default=Path(os.environ.get("FAKE_DOCKER_FIXTURES", ".")))
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to sleep per request")
+    args = parser.parse_args()
+
+    server = FakeEngine(args.socket, args.fixtures, args.latency)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
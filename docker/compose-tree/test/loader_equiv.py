@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Check compose-tree's experimental native compose loader against `docker compose config`.
+
+For each project, resolves the compose files with ComposeLoader and compares
+what compose-tree reads from them with `docker compose config --format json`
+output: the project name, the service list, each service's image and
+dependencies, and the normalised value of every config field it compares (see
+prepare_service). Projects the native loader declines (it would fall back to
+the CLI) are reported but don't fail the check.
+
+With no arguments, checks every project under loader-fixtures/ (compose.yaml,
+plus compose.override.yaml when present) against the CLI output recorded next
+to it as expected.json, in which the project directory is written as
+@FIXTURE@. Only output captured from a real `docker compose` belongs there:
+record it with --update. A fixture without a recording fails the check.
+Fixtures are resolved with the shell's variables cleared (only PATH, HOME and
+DOCKER_* are kept), so the result doesn't depend on who runs it. --cli
+compares against the docker compose CLI on PATH directly. --stack N generates
+a stack (see stackgen.py) and checks it against the fake docker CLI in
+fake-docker/, which only covers what stackgen produces.
+
+Usage: python3 loader_equiv.py [PROJECT_DIR ...] [--cli | --update | --stack N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import compose_tree  # noqa: E402
+from native_loader import ComposeLoadError, load_compose_native  # noqa: E402
+from stackgen import generate  # noqa: E402
+
+
+def project_files(project_dir: Path) -> list[Path]:
+    """compose.yaml and its override, as `docker compose` picks them up without -f."""
+    for name in ("compose.yaml", "compose.yml", "docker-compose.yaml", "docker-compose.yml"):
+        if (project_dir / name).is_file():
+            main = project_dir / name
+            break
+    else:
+        raise SystemExit(f"{project_dir}: no compose file")
+    override = main.with_name(main.name.replace(".y", ".override.y"))
+    return [main, override] if override.is_file() else [main]
+
+
+# How the project directory appears in expected.json, so fixtures can be checked from any checkout
+FIXTURE_DIR = "@FIXTURE@"
+
+
+def fixture_env() -> dict[str, str]:
+    """The environment fixtures are resolved in: no variables a compose file could interpolate."""
+    return {k: v for k, v in os.environ.items() if k in ("PATH", "HOME") or k.startswith("DOCKER_")}
+
+
+def expected_config(project_dir: Path) -> dict[str, Any]:
+    """The project's committed `docker compose config` output."""
+    text = (project_dir / "expected.json").read_text()
+    return json.loads(text.replace(FIXTURE_DIR, str(project_dir)))
+
+
+def update_expected(project_dir: Path, files: list[Path], env: dict[str, str]) -> None:
+    config = cli_config(files, env)
+    text = json.dumps(config, indent=2).replace(str(project_dir), FIXTURE_DIR)
+    (project_dir / "expected.json").write_text(text + "\n")
+    print(f"{project_dir.name}: wrote expected.json ({len(config.get('services', {}))} services)")
+
+
+def cli_config(files: list[Path], env: dict[str, str]) -> dict[str, Any]:
+    cmd = ["docker", "compose"]
+    for path in files:
+        cmd += ["-f", str(path)]
+    proc = subprocess.run(
+        [*cmd, "config", "--format", "json"], capture_output=True, text=True, cwd=files[0].parent, env=env,
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip() or f"exit code {proc.returncode}")
+    return json.loads(proc.stdout)
+
+
+def compare(native: dict[str, Any], cli: dict[str, Any]) -> list[str]:
+    """Differences between the two configs in everything compose-tree reads."""
+    problems = []
+    if native.get("name") != cli.get("name"):
+        problems.append(f"name: native {native.get('name')!r}, cli {cli.get('name')!r}")
+    native_services = native.get("services", {})
+    cli_services = cli.get("services", {})
+    for name in sorted(native_services.keys() ^ cli_services.keys()):
+        problems.append(f"{name}: only in {'native' if name in native_services else 'cli'}")
+
+    for name in sorted(native_services.keys() & cli_services.keys()):
+        ours, theirs = native_services[name], cli_services[name]
+        if ours.get("image") != theirs.get("image"):
+            problems.append(f"{name}.image: native {ours.get('image')!r}, cli {theirs.get('image')!r}")
+        if sorted(ours.get("depends_on") or {}) != sorted(theirs.get("depends_on") or {}):
+            problems.append(
+                f"{name}.depends_on: native {sorted(ours.get('depends_on') or {})}, "
+                f"cli {sorted(theirs.get('depends_on') or {})}"
+            )
+        prepared_ours = compose_tree.prepare_service(ours)
+        prepared_theirs = compose_tree.prepare_service(theirs)
+        for field in compose_tree.COMPARATORS:
+            if prepared_ours.get(field) != prepared_theirs.get(field):
+                problems.append(
+                    f"{name}.{field}: native {prepared_ours.get(field)!r}, cli {prepared_theirs.get(field)!r}"
+                )
+    return problems
+
+
+def check(label: str, files: list[Path], reference: Callable[[], dict[str, Any]]) -> str:
+    """Compare one project with `reference()`'s config; returns "ok", "fallback" or "FAIL"."""
+    try:
+        native, _ = load_compose_native(files[0], files[0].parent, tuple(files[1:]))
+    except ComposeLoadError as e:
+        print(f"{label}: native loader declined ({e}); compose-tree would use the CLI")
+        return "fallback"
+    try:
+        cli = reference()
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"{label}: docker compose config failed: {e}")
+        return "FAIL"
+    problems = compare(native, cli)
+    for problem in problems:
+        print(f"{label}: {problem}")
+    status = "FAIL" if problems else "ok"
+    print(f"{label}: {status} ({len(native.get('services', {}))} services)")
+    return status
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("projects", nargs="*", type=Path, help="project directories (default: loader-fixtures/*)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--cli", action="store_true", help="compare against the docker compose CLI on PATH")
+    mode.add_argument("--update", action="store_true", help="rewrite expected.json from the docker compose CLI")
+    mode.add_argument("--stack", type=int, metavar="N", help="check a generated N-service stack with fake docker")
+    args = parser.parse_args()
+
+    results = []
+    if args.stack:
+        with tempfile.TemporaryDirectory(prefix="compose-tree-loader-") as tmp:
+            stack = generate(Path(tmp), args.stack)
+            env = {
+                **os.environ,
+                "PATH": f"{HERE / 'fake-docker'}{os.pathsep}{os.environ['PATH']}",
+                "FAKE_DOCKER_FIXTURES": tmp,
+            }
+            files = [stack.compose_file]
+            results.append(check(f"stack({args.stack})", files, lambda: cli_config(files, env)))
+        return 1 if "FAIL" in results else 0
+
+    if (args.cli or args.update) and not shutil.which("docker"):
+        print("docker not found on PATH", file=sys.stderr)
+        return 2
+    # The native loader reads os.environ: give it the same clean environment as the CLI
+    env = fixture_env()
+    os.environ.clear()
+    os.environ.update(env)
+    projects = args.projects or sorted(p for p in (HERE / "loader-fixtures").iterdir() if p.is_dir())
+    for project_dir in (p.resolve() for p in projects):
+        files = project_files(project_dir)
+        if args.update:
+            update_expected(project_dir, files, env)
+        elif args.cli:
+            results.append(check(project_dir.name, files, lambda: cli_config(files, env)))
+        elif not (project_dir / "expected.json").is_file():
+            print(f"{project_dir.name}: FAIL (no recorded docker compose config output; run --update)")
+            results.append("FAIL")
+        else:
+            results.append(check(project_dir.name, files, lambda: expected_config(project_dir)))
+
+    return 1 if "FAIL" in results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Regression check and benchmark for compose-tree --hosts.
+
+Generates one stack per fake host (same services, different drift seeds, see
+stackgen.py), serves each host's containers from a fake Engine API server, and
+runs `compose_tree.py --hosts` against them through the fake `ssh` in
+fake-docker/. Checks that every host reports exactly the services its
+generator expects and that each host cost exactly one SSH connection, and
+reports the wall time against one host.
+
+Usage: python3 multihost.py [--hosts 4] [--services 200] [--latency SECONDS] [--ssh-latency SECONDS]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+COMPOSE_TREE = HERE.parent / "compose_tree.py"
+sys.path.insert(0, str(HERE / "fake-docker"))
+
+from engine import FakeEngine  # noqa: E402
+from stackgen import generate  # noqa: E402
+
+
+def run_hosts(compose_file: Path, hosts: list[str], env: dict[str, str]) -> tuple[float, dict]:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, str(COMPOSE_TREE), "-f", str(compose_file), "--format", "json", "--backend", "api",
+         "--hosts", ",".join(hosts)],
+        capture_output=True, text=True, env=env,
+    )
+    wall = time.perf_counter() - start
+    try:
+        return wall, json.loads(proc.stdout)
+    except ValueError:
+        print(proc.stdout, proc.stderr, sep="\n", file=sys.stderr)
+        return wall, {}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=4, help="number of fake hosts (default: 4)")
+    parser.add_argument("--services", type=int, default=200, help="services per stack (default: 200)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API delay per request in seconds")
+    parser.add_argument("--ssh-latency", type=float, default=0.2, help="fake SSH handshake time (default: 0.2)")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="compose-tree-hosts-") as tmp:
+        root = Path(tmp)
+        names = [f"host{n}" for n in range(args.hosts)]
+        stacks, engines = {}, []
+        for n, name in enumerate(names):
+            stacks[name] = generate(root / name, args.services, drift=0.05, seed=n + 1)
+            engine = FakeEngine(str(root / name / "engine.sock"), root / name, args.latency)
+            engine.start()
+            engines.append(engine)
+
+        log = root / "ssh.log"
+        env = {
+            **os.environ,
+            "PATH": f"{HERE / 'fake-docker'}{os.pathsep}{os.environ['PATH']}",
+            "FAKE_DOCKER_FIXTURES": str(root / names[0]),
+            "FAKE_DOCKER_LATENCY": str(args.latency),
+            "FAKE_SSH_HOSTS": str(root),
+            "FAKE_SSH_LOG": str(log),
+            "FAKE_SSH_LATENCY": str(args.ssh_latency),
+            "XDG_CACHE_HOME": str(root / "cache"),
+            "XDG_RUNTIME_DIR": str(root),
+        }
+        # Every host runs host0's compose file; host0's config is the one all stacks share
+        compose_file = stacks[names[0]].compose_file
+
+        try:
+            single, _ = run_hosts(compose_file, names[:1], env)
+            log.unlink(missing_ok=True)
+            wall, document = run_hosts(compose_file, [f"ssh://user@{name}" for name in names], env)
+            connections = log.read_text().splitlines() if log.exists() else []
+        finally:
+            for engine in engines:
+                engine.shutdown()
+
+        for name in names:
+            label = f"user@{name}"
+            got = document.get("hosts", {}).get(label, {}).get("needs_restart")
+            ok = got == stacks[name].expected
+            failures += not ok
+            print(f"{label}: {'ok' if ok else 'FAIL'} ({len(stacks[name].expected)} need restart)")
+            if not ok and got is not None:
+                print(f"    missing: {sorted(set(stacks[name].expected) - set(got))}", file=sys.stderr)
+                print(f"    unexpected: {sorted(set(got) - set(stacks[name].expected))}", file=sys.stderr)
+        if sorted(connections) != names:
+            failures += 1
+            print(f"FAIL: expected one SSH connection per host, got {sorted(connections)}")
+        print(f"{args.hosts} hosts: {wall:.3f}s ({single:.3f}s for one host), {len(connections)} SSH connections")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic compose stacks for benchmarking and regression-testing compose-tree.
+
+Writes real compose files (an x-common anchor, env files, `include`d files,
+dependency chains) plus the fixtures test/fake-docker serves: the resolved
+config, `compose ps`, `inspect` and image IDs. A seeded fraction of services is
+given drift (changed env or labels, an updated image, a stopped or missing
+container), and the services compose-tree should report are written to
+expected.json.
+
+Usage: python3 stackgen.py OUT_DIR [--services N] [--env-files M] [--includes N] [--depth D]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+# Kinds of drift applied to containers, in rotation
+DRIFT_KINDS = ("env", "image", "stopped", "missing", "label")
+
+# Creation time of every container, as inspect and `docker compose ps` report it
+CREATED = "2024-01-01T00:00:00.000000000Z"
+CREATED_AT = "2024-01-01 00:00:00 +0000 UTC"
+
+
+@dataclass
+class Stack:
+    """A generated stack and the answer compose-tree should give for it."""
+
+    compose_file: Path
+    services: int
+    drifted: dict[str, str]
+    expected: list[str]
+
+
+def config_hash(service: dict) -> str:
+    """Same per-service hash as fake-docker's `compose config --hash=*`."""
+    return hashlib.sha256(json.dumps(service, sort_keys=True).encode()).hexdigest()
+
+
+def service_name(i: int) -> str:
+    return f"svc{i:04d}"
+
+
+def dependencies(i: int, depth: int) -> list[int]:
+    """Chains of `depth` services; each chain's middle also waits on the previous chain's head."""
+    deps = [i - 1] if i % depth else []
+    if depth > 2 and i % depth == depth // 2 and i >= depth:
+        deps.append((i // depth - 1) * depth)
+    return deps
+
+
+def write_env_file(path: Path, index: int, variables: int) -> dict[str, str]:
+    values = {f"ENV{index:03d}_VAR{k}": f"value-{index}-{k}" for k in range(variables)}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("# generated\n" + "".join(f"{k}={v}\n" for k, v in values.items()))
+    return values
+
+
+def generate(
+    out_dir: Path,
+    services: int,
+    env_files: int = 10,
+    includes: int = 2,
+    depth: int = 10,
+    drift: float = 0.05,
+    seed: int = 1,
+    env_vars: int = 5,
+) -> Stack:
+    """Write a stack of `services` services into out_dir; see the module docstring."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    env_files = max(1, env_files)
+    project = "stack"
+
+    # One compose file per include, plus the main file (part 0)
+    parts = [out_dir] + [out_dir / f"include{n}" for n in range(1, includes + 1)]
+    common_env = {}
+    for part in parts:
+        common_env = write_env_file(part / "env" / "common.env", 999, 2)
+    env_values = [write_env_file(out_dir / "env" / f"env{m:03d}.env", m, env_vars) for m in range(env_files)]
+
+    texts = [["x-common: &common\n", "  env_file:\n", "    - env/common.env\n", "  restart: unless-stopped\n\n"]
+             for _ in parts]
+    texts[0].insert(0, f"name: {project}\n\n")
+    if includes:
+        texts[0].append("include:\n")
+        for part in parts[1:]:
+            texts[0].append(f"  - path: {part.name}/compose.yaml\n")
+        texts[0].append("\n")
+    for text in texts:
+        text.append("services:\n")
+
+    resolved: dict[str, dict] = {}
+    images: dict[str, str] = {}
+    for i in range(services):
+        name = service_name(i)
+        part = i % len(parts)
+        image = f"busybox:{i % 7}"
+        images[image] = f"sha256:{i % 7:064x}"
+        deps = [service_name(d) for d in dependencies(i, depth)]
+
+        text = texts[part]
+        text.append(f"  {name}:\n    <<: *common\n    image: {image}\n")
+        # Every third service keeps the anchor's env_file; the rest override it with their own
+        if i % 3:
+            env_index = i % env_files
+            env_path = out_dir / "env" / f"env{env_index:03d}.env"
+            text.append(f"    env_file:\n      - {env_path}\n")
+            environment = dict(env_values[env_index])
+        else:
+            environment = dict(common_env)
+        environment["SERVICE_INDEX"] = str(i)
+        text.append(f"    environment:\n      SERVICE_INDEX: \"{i}\"\n")
+        text.append(f"    labels:\n      stack.index: \"{i}\"\n")
+        if deps:
+            text.append("    depends_on:\n" + "".join(f"      - {d}\n" for d in deps))
+
+        resolved[name] = {
+            "image": image,
+            "environment": environment,
+            "labels": {"stack.index": str(i)},
+            "depends_on": {d: {"condition": "service_started", "required": True} for d in deps},
+            "networks": {"default": None},
+            "restart": "unless-stopped",
+        }
+
+    compose_file = out_dir / "docker-compose.yaml"
+    for part, text in zip(parts, texts):
+        path = compose_file if part == out_dir else part / "compose.yaml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(text))
+
+    # Containers as compose would have created them, then drift applied
+    rng = random.Random(seed)
+    drifted_indexes = sorted(rng.sample(range(services), max(1, int(services * drift)))) if services else []
+    drifted = {service_name(i): DRIFT_KINDS[n % len(DRIFT_KINDS)] for n, i in enumerate(drifted_indexes)}
+
+    ps, inspects = [], []
+    for i, (name, service) in enumerate(resolved.items()):
+        kind = drifted.get(name)
+        if kind == "missing":
+            continue
+        container = f"{project}-{name}-1"
+        env = dict(service["environment"])
+        labels = dict(service["labels"])
+        hash_label = config_hash(service)
+        if kind == "env":
+            env["SERVICE_INDEX"] = "stale"
+            hash_label = "stale"
+        elif kind == "label":
+            labels["stack.index"] = "stale"
+            hash_label = "stale"
+        state = "exited" if kind == "stopped" else "running"
+        exit_code = 137 if kind == "stopped" else 0
+
+        ps.append({
+            "ID": f"{i + 1:064x}", "Name": container, "Service": name, "CreatedAt": CREATED_AT,
+            "State": state, "ExitCode": exit_code,
+        })
+        inspects.append({
+            "Id": f"{i + 1:064x}",
+            "Name": f"/{container}",
+            "Created": CREATED,
+            "Image": "sha256:stale" if kind == "image" else images[service["image"]],
+            "State": {"Status": state, "ExitCode": exit_code},
+            "Config": {
+                "Image": service["image"],
+                "Env": [f"{k}={v}" for k, v in env.items()],
+                "Labels": {
+                    **labels,
+                    "com.docker.compose.project": project,
+                    "com.docker.compose.project.working_dir": str(out_dir),
+                    "com.docker.compose.project.config_files": str(compose_file),
+                    "com.docker.compose.service": name,
+                    "com.docker.compose.container-number": "1",
+                    "com.docker.compose.oneoff": "False",
+                    "com.docker.compose.config-hash": hash_label,
+                },
+            },
+            "HostConfig": {},
+            "Mounts": [],
+            "NetworkSettings": {"Networks": {f"{project}_default": {}}},
+        })
+
+    # Drifted services and everything depending on them, directly or not
+    dependents: dict[str, list[str]] = {name: [] for name in resolved}
+    for name, service in resolved.items():
+        for dep in service["depends_on"]:
+            dependents[dep].append(name)
+    expected = set(drifted)
+    pending = list(drifted)
+    while pending:
+        for dependent in dependents[pending.pop()]:
+            if dependent not in expected:
+                expected.add(dependent)
+                pending.append(dependent)
+
+    (out_dir / "config.json").write_text(json.dumps({"name": project, "services": resolved}))
+    (out_dir / "ps.json").write_text(json.dumps(ps))
+    (out_dir / "inspect.json").write_text(json.dumps(inspects))
+    (out_dir / "images.json").write_text(json.dumps(images))
+    stack = Stack(compose_file, services, drifted, sorted(expected))
+    (out_dir / "expected.json").write_text(json.dumps({"drifted": drifted, "needs_restart": stack.expected}))
+    return stack
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir", type=Path, help="directory to write the stack into")
+    parser.add_argument("--services", type=int, default=100, help="number of services (default: 100)")
+    parser.add_argument("--env-files", type=int, default=10, help="number of env files (default: 10)")
+    parser.add_argument("--includes", type=int, default=2, help="number of included compose files (default: 2)")
+    parser.add_argument("--depth", type=int, default=10, help="dependency chain length (default: 10)")
+    parser.add_argument("--drift", type=float, default=0.05, help="fraction of drifted services (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for drift (default: 1)")
+    args = parser.parse_args()
+
+    stack = generate(args.out_dir, args.services, args.env_files, args.includes, args.depth, args.drift, args.seed)
+    print(f"{stack.compose_file}: {stack.services} services, {len(stack.drifted)} drifted, "
+          f"{len(stack.expected)} need restart")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
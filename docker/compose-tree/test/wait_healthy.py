@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Regression check for --apply's post-restart health wait.
+
+Serves a small project's containers from the fake Engine API server (and the
+same states through the fake `docker compose ps`) and checks which services
+wait_healthy reports as failed, on both backends. One-shot services that
+exited with code 0 are done; long-running ones that exited, non-zero exits and
+unhealthy containers are failures.
+
+Usage: python3 wait_healthy.py
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE / "fake-docker"))
+
+import compose_tree  # noqa: E402
+from engine import FakeEngine  # noqa: E402
+
+PROJECT = "oneshot"
+
+# service -> (compose config, container state, exit code, health)
+SERVICES: dict[str, tuple[dict, str, int, str]] = {
+    "web": (
+        {"restart": "unless-stopped",
+         "depends_on": {"seed": {"condition": "service_completed_successfully", "required": True}}},
+        "running", 0, "",
+    ),
+    "migrate": ({"restart": "no"}, "exited", 0, ""),
+    "once": ({"restart": False}, "exited", 0, ""),  # unquoted `restart: no` in YAML
+    "cron": ({}, "exited", 0, ""),  # no restart policy: long-running, so exiting is a failure
+    "retry": ({"restart": "on-failure:3"}, "exited", 0, ""),
+    "seed": ({"restart": "always"}, "exited", 0, ""),  # web waits for it to complete
+    "worker": ({"restart": "unless-stopped"}, "exited", 0, ""),
+    "broken": ({"restart": "no"}, "exited", 1, ""),
+    "sick": ({"restart": "unless-stopped"}, "running", 0, "unhealthy"),
+    "ready": ({"restart": "unless-stopped"}, "running", 0, "healthy"),
+}
+EXPECTED_FAILED = ["broken", "cron", "sick", "worker"]
+
+
+def write_fixtures(out_dir: Path) -> None:
+    ps, inspects = [], []
+    for i, (name, (_, state, exit_code, health)) in enumerate(SERVICES.items()):
+        container = f"{PROJECT}-{name}-1"
+        ps.append({"Name": container, "Service": name, "State": state, "ExitCode": exit_code, "Health": health})
+        inspects.append({
+            "Id": f"{i + 1:064x}",
+            "Name": f"/{container}",
+            "State": {"Status": state, "ExitCode": exit_code, **({"Health": {"Status": health}} if health else {})},
+            "Config": {"Labels": {
+                "com.docker.compose.project": PROJECT,
+                "com.docker.compose.service": name,
+                "com.docker.compose.container-number": "1",
+                "com.docker.compose.oneoff": "False",
+            }},
+        })
+    (out_dir / "ps.json").write_text(json.dumps(ps))
+    (out_dir / "inspect.json").write_text(json.dumps(inspects))
+    (out_dir / "compose.yaml").write_text("services: {}\n")
+
+
+def check(backend: str, project: compose_tree.ProjectState) -> bool:
+    failed = sorted(compose_tree.wait_healthy(project, list(SERVICES), timeout=5))
+    ok = failed == EXPECTED_FAILED
+    print(f"{backend:<4} failed: {', '.join(failed) or '-'}  {'ok' if ok else 'FAIL'}")
+    if not ok:
+        print(f"    expected: {', '.join(EXPECTED_FAILED)}", file=sys.stderr)
+    return ok
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="compose-tree-wait-") as tmp:
+        root = Path(tmp)
+        write_fixtures(root)
+        os.environ["FAKE_DOCKER_FIXTURES"] = str(root)
+        os.environ["PATH"] = f"{HERE / 'fake-docker'}{os.pathsep}{os.environ['PATH']}"
+
+        config = {"name": PROJECT, "services": {name: cfg for name, (cfg, *_) in SERVICES.items()}}
+        project = compose_tree.ProjectState(
+            compose_file=root / "compose.yaml",
+            project_dir=root,
+            config=config,
+            env_sources={},
+            container_map={},
+            inspects={},
+            images=compose_tree.ImageResolver(),
+            project_name=PROJECT,
+        )
+        project.rebuild_graph()
+
+        results = [check("cli", project)]
+
+        engine = FakeEngine(str(root / "engine.sock"), root)
+        engine.start()
+        compose_tree.DOCKER_API = compose_tree.DockerAPIClient(str(root / "engine.sock"))
+        try:
+            results.append(check("api", project))
+        finally:
+            compose_tree.DOCKER_API = None
+            engine.shutdown()
+
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())